@@ -11,6 +11,8 @@ backtest_reporter.py - 自動回測報告系統
 
 import json
 import os
+import sqlite3
+import threading
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -20,10 +22,283 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class PredictionLedger:
+    """
+    預測帳本（SQLite）
+    預測與驗證結果逐筆插入，不需重寫整個檔案；
+    常用查詢欄位皆建立索引，啟動時不載入歷史資料
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS predictions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT UNIQUE NOT NULL,
+            stock_code TEXT NOT NULL,
+            prediction_date TEXT NOT NULL,
+            prediction_type TEXT NOT NULL,
+            direction TEXT,
+            verified INTEGER NOT NULL DEFAULT 0,
+            due_date TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_pred_stock ON predictions(stock_code);
+        CREATE INDEX IF NOT EXISTS idx_pred_date ON predictions(prediction_date);
+        CREATE INDEX IF NOT EXISTS idx_pred_type ON predictions(prediction_type);
+        CREATE INDEX IF NOT EXISTS idx_pred_verified ON predictions(verified);
+
+        CREATE TABLE IF NOT EXISTS results (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            prediction_id TEXT UNIQUE NOT NULL,
+            stock_code TEXT NOT NULL,
+            prediction_date TEXT NOT NULL,
+            verify_date TEXT NOT NULL,
+            prediction_type TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_result_stock ON results(stock_code);
+        CREATE INDEX IF NOT EXISTS idx_result_verify_date ON results(verify_date);
+        CREATE INDEX IF NOT EXISTS idx_result_type ON results(prediction_type);
+
+        CREATE TABLE IF NOT EXISTS rollups (
+            verify_date TEXT NOT NULL,
+            prediction_type TEXT NOT NULL,
+            direction TEXT NOT NULL,
+            confidence TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            positive INTEGER NOT NULL,
+            negative INTEGER NOT NULL,
+            sum_return REAL NOT NULL,
+            sum_sq_return REAL NOT NULL,
+            min_return REAL NOT NULL,
+            max_return REAL NOT NULL,
+            PRIMARY KEY (verify_date, prediction_type, direction, confidence)
+        );
+
+        CREATE TABLE IF NOT EXISTS stock_rollups (
+            stock_code TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            sum_return REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS daily_prices (
+            date TEXT NOT NULL,
+            stock_code TEXT NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (date, stock_code)
+        );
+        CREATE INDEX IF NOT EXISTS idx_prices_stock ON daily_prices(stock_code, date);
+    """
+
+    # 驗證等待天數：短線5天後驗證，長線20天後驗證
+    VERIFY_AFTER_DAYS = {'short_term': 5, 'long_term': 20}
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        self._migrate_schema()
+        self.lock = threading.RLock()
+
+        if self.conn.execute('SELECT NOT EXISTS (SELECT 1 FROM rollups) '
+                             'AND EXISTS (SELECT 1 FROM results)').fetchone()[0]:
+            self.rebuild_rollups()
+
+    def _migrate_schema(self):
+        """舊版帳本補上 due_date 欄位並回填，再建立待驗證索引"""
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(predictions)')}
+        with self.conn:
+            if 'due_date' not in columns:
+                self.conn.execute('ALTER TABLE predictions ADD COLUMN due_date TEXT')
+            self.conn.execute(
+                "UPDATE predictions SET due_date = date(prediction_date, "
+                "CASE WHEN prediction_type = 'short_term' THEN '+5 days' ELSE '+20 days' END) "
+                "WHERE due_date IS NULL"
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_pred_due '
+                              'ON predictions(verified, due_date)')
+
+    @classmethod
+    def due_date_for(cls, prediction: Dict[str, Any]) -> str:
+        """計算預測的驗證到期日"""
+        verify_after = cls.VERIFY_AFTER_DAYS.get(prediction['prediction_type'], 20)
+        pred_date = datetime.strptime(prediction['prediction_date'], '%Y-%m-%d').date()
+        return (pred_date + timedelta(days=verify_after)).isoformat()
+
+    def next_sequence(self) -> int:
+        """下一筆預測的序號（MAX 走主鍵索引，不需掃描）"""
+        row = self.conn.execute('SELECT IFNULL(MAX(seq), 0) FROM predictions').fetchone()
+        return row[0]
+
+    def insert_prediction(self, prediction: Dict[str, Any], conn=None):
+        """插入一筆預測"""
+        (conn or self.conn).execute(
+            'INSERT INTO predictions (id, stock_code, prediction_date, prediction_type, '
+            'direction, verified, due_date, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (prediction['id'], prediction['stock_code'], prediction['prediction_date'],
+             prediction['prediction_type'], prediction.get('direction'),
+             int(bool(prediction.get('verified'))), self.due_date_for(prediction),
+             json.dumps(prediction, ensure_ascii=False))
+        )
+
+    def insert_result(self, result: Dict[str, Any], conn=None):
+        """插入一筆驗證結果，並在同一交易內更新彙總"""
+        conn = conn or self.conn
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO results (prediction_id, stock_code, prediction_date, '
+            'verify_date, prediction_type, data) VALUES (?, ?, ?, ?, ?, ?)',
+            (result['prediction_id'], result['stock_code'], result['prediction_date'],
+             result['verify_date'], result['prediction_type'],
+             json.dumps(result, ensure_ascii=False))
+        )
+        if cursor.rowcount:
+            self._update_rollups(result, conn)
+
+    @staticmethod
+    def confidence_bucket(score) -> str:
+        """信心度分組（與 BacktestAnalyzer.analyze_by_confidence 相同的切點）"""
+        if score is None:
+            return 'unknown'
+        if score > 70:
+            return 'high_confidence'
+        if score >= 50:
+            return 'medium_confidence'
+        return 'low_confidence'
+
+    def _update_rollups(self, result: Dict[str, Any], conn):
+        """累加一筆結果到每日 / 類型 / 方向 / 信心度彙總及個股彙總"""
+        ret = float(result['actual_return'])
+        correct = int(bool(result['is_correct']))
+
+        conn.execute(
+            'INSERT INTO rollups VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (verify_date, prediction_type, direction, confidence) DO UPDATE SET '
+            'count = count + 1, correct = correct + excluded.correct, '
+            'positive = positive + excluded.positive, negative = negative + excluded.negative, '
+            'sum_return = sum_return + excluded.sum_return, '
+            'sum_sq_return = sum_sq_return + excluded.sum_sq_return, '
+            'min_return = MIN(min_return, excluded.min_return), '
+            'max_return = MAX(max_return, excluded.max_return)',
+            (result['verify_date'], result['prediction_type'],
+             result.get('predicted_direction') or 'unknown',
+             self.confidence_bucket(result.get('predicted_score')),
+             correct, int(ret > 0), int(ret < 0), ret, ret * ret, ret, ret)
+        )
+        conn.execute(
+            'INSERT INTO stock_rollups VALUES (?, 1, ?, ?) '
+            'ON CONFLICT (stock_code) DO UPDATE SET count = count + 1, '
+            'correct = correct + excluded.correct, sum_return = sum_return + excluded.sum_return',
+            (result['stock_code'], correct, ret)
+        )
+
+    def rebuild_rollups(self):
+        """由驗證結果全量重建彙總（舊帳本升級或一致性修復時使用）"""
+        with self.conn:
+            self.conn.execute('DELETE FROM rollups')
+            self.conn.execute('DELETE FROM stock_rollups')
+            for result in self.query_results():
+                self._update_rollups(result, self.conn)
+        logger.info("回測彙總已重建")
+
+    def query_rollups(self, start_date: str = None, end_date: str = None) -> List[Dict]:
+        """讀取日期區間內的彙總列（列數只與天數有關，與預測筆數無關）"""
+        conditions, params = [], []
+        if start_date:
+            conditions.append('verify_date >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append('verify_date <= ?')
+            params.append(end_date)
+
+        sql = 'SELECT * FROM rollups' + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+        cursor = self.conn.execute(sql, params)
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def query_stock_rollups(self, n: int = 10, min_count: int = 1,
+                            best: bool = True) -> List[Dict]:
+        """個股累計彙總：依準確率（同準確率再依平均報酬）排序的前 n 檔"""
+        order = 'DESC' if best else 'ASC'
+        cursor = self.conn.execute(
+            'SELECT stock_code, count, correct, sum_return FROM stock_rollups WHERE count >= ? '
+            f'ORDER BY CAST(correct AS REAL) / count {order}, sum_return / count {order}, '
+            'stock_code LIMIT ?',
+            (min_count, n)
+        )
+        return [{
+            'stock_code': code,
+            'count': count,
+            'accuracy': round(correct / count, 4),
+            'avg_return': round(total / count, 2)
+        } for code, count, correct, total in cursor]
+
+    def query_extreme_results(self, start_date: str, n: int, largest: bool) -> List[Dict]:
+        """區間內報酬最高 / 最低的 n 筆結果"""
+        order = 'DESC' if largest else 'ASC'
+        return [json.loads(row[0]) for row in self.conn.execute(
+            'SELECT data FROM results WHERE verify_date >= ? '
+            f"ORDER BY json_extract(data, '$.actual_return') {order}, seq LIMIT ?",
+            (start_date, n)
+        )]
+
+    def mark_verified(self, prediction: Dict[str, Any], conn=None):
+        """標記預測已驗證"""
+        (conn or self.conn).execute(
+            'UPDATE predictions SET verified = 1, data = ? WHERE id = ?',
+            (json.dumps(prediction, ensure_ascii=False), prediction['id'])
+        )
+
+    def insert_prices(self, date: str, prices: List[Tuple[str, float]]):
+        """批次寫入每日收盤價快照"""
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO daily_prices (date, stock_code, close) VALUES (?, ?, ?)',
+                [(date, code, close) for code, close in prices]
+            )
+
+    def due_predictions(self, as_of: str) -> List[Dict]:
+        """到期未驗證的預測（走 (verified, due_date) 索引）"""
+        return self.query_predictions('verified = 0 AND due_date <= ?', (as_of,))
+
+    def due_predictions_with_prices(self, as_of: str) -> List[Tuple[Dict, float]]:
+        """
+        到期未驗證的預測，並以一次 JOIN 取得出場收盤價
+
+        出場價取到期日至 as_of 之間最近一日的快照；該區間沒有快照的預測不返回（維持未驗證），
+        避免以早於預測的舊快照驗證。
+        """
+        rows = self.conn.execute(
+            'SELECT p.data, d.close FROM predictions p '
+            'JOIN daily_prices d ON d.stock_code = p.stock_code '
+            'AND d.date = (SELECT MAX(d2.date) FROM daily_prices d2 '
+            'WHERE d2.stock_code = p.stock_code AND d2.date BETWEEN p.due_date AND ?) '
+            'WHERE p.verified = 0 AND p.due_date <= ? ORDER BY p.seq',
+            (as_of, as_of)
+        )
+        return [(json.loads(data), close) for data, close in rows]
+
+    def query_predictions(self, where: str = '', params: Tuple = ()) -> List[Dict]:
+        """查詢預測（where 為 SQL 條件）"""
+        sql = 'SELECT data FROM predictions' + (f' WHERE {where}' if where else '') + ' ORDER BY seq'
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+
+    def query_results(self, where: str = '', params: Tuple = ()) -> List[Dict]:
+        """查詢驗證結果（where 為 SQL 條件）"""
+        sql = 'SELECT data FROM results' + (f' WHERE {where}' if where else '') + ' ORDER BY seq'
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+
+    def count(self, table: str, where: str = '', params: Tuple = ()) -> int:
+        """計數"""
+        sql = f'SELECT COUNT(*) FROM {table}' + (f' WHERE {where}' if where else '')
+        return self.conn.execute(sql, params).fetchone()[0]
+
+
 class PredictionTracker:
     """
     預測追蹤器
-    記錄和追蹤所有預測結果
+    記錄和追蹤所有預測結果（存放於 SQLite 帳本 predictions.db）
     """
 
     def __init__(self, data_dir: str = './data/predictions'):
@@ -32,39 +307,59 @@ class PredictionTracker:
 
         self.predictions_file = os.path.join(data_dir, 'predictions.json')
         self.results_file = os.path.join(data_dir, 'results.json')
-
-        self.predictions = self._load_predictions()
-        self.results = self._load_results()
-
-    def _load_predictions(self) -> List[Dict]:
-        """載入預測記錄"""
-        if os.path.exists(self.predictions_file):
-            try:
-                with open(self.predictions_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-
-    def _load_results(self) -> List[Dict]:
-        """載入驗證結果"""
-        if os.path.exists(self.results_file):
-            try:
-                with open(self.results_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-
-    def _save_predictions(self):
-        """保存預測記錄"""
-        with open(self.predictions_file, 'w', encoding='utf-8') as f:
-            json.dump(self.predictions, f, ensure_ascii=False, indent=2)
-
-    def _save_results(self):
-        """保存驗證結果"""
-        with open(self.results_file, 'w', encoding='utf-8') as f:
-            json.dump(self.results, f, ensure_ascii=False, indent=2)
+        self.db_file = os.path.join(data_dir, 'predictions.db')
+
+        self.ledger = PredictionLedger(self.db_file)
+        self._migrate_json_files()
+
+    def _migrate_json_files(self):
+        """將舊版 predictions.json / results.json 匯入帳本（只執行一次）"""
+        legacy = [(self.predictions_file, self.ledger.insert_prediction),
+                  (self.results_file, self.ledger.insert_result)]
+        if not any(os.path.exists(path) for path, _ in legacy):
+            return
+
+        with self.ledger.lock, self.ledger.conn as conn:
+            for path, insert in legacy:
+                if not os.path.exists(path):
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        records = json.load(f)
+                except:
+                    records = []
+                for record in records:
+                    try:
+                        insert(record, conn)
+                    except sqlite3.IntegrityError:
+                        continue
+
+        for path, _ in legacy:
+            if os.path.exists(path):
+                os.replace(path, path + '.migrated')
+        logger.info("舊版預測記錄已匯入帳本")
+
+    @property
+    def predictions(self) -> List[Dict]:
+        """所有預測記錄（需要時才從帳本讀取）"""
+        return self.ledger.query_predictions()
+
+    @property
+    def results(self) -> List[Dict]:
+        """所有驗證結果（需要時才從帳本讀取）"""
+        return self.ledger.query_results()
+
+    def get_results_since(self, start_date: str) -> List[Dict]:
+        """獲取驗證日期 >= start_date 的結果（走 verify_date 索引）"""
+        return self.ledger.query_results('verify_date >= ?', (start_date,))
+
+    def get_stats_counts(self) -> Dict[str, int]:
+        """預測 / 驗證筆數統計"""
+        return {
+            'total_predictions': self.ledger.count('predictions'),
+            'verified_predictions': self.ledger.count('results'),
+            'pending_verification': self.ledger.count('predictions', 'verified = 0'),
+        }
 
     def record_prediction(self, prediction: Dict[str, Any]):
         """
@@ -82,82 +377,93 @@ class PredictionTracker:
         - confidence: float
         - reasoning: List[str]
         """
-        prediction['id'] = f"{prediction['stock_code']}_{prediction['prediction_date']}_{len(self.predictions)}"
-        prediction['recorded_at'] = datetime.now().isoformat()
-        prediction['verified'] = False
+        with self.ledger.lock, self.ledger.conn as conn:
+            prediction['id'] = f"{prediction['stock_code']}_{prediction['prediction_date']}_{self.ledger.next_sequence()}"
+            prediction['recorded_at'] = datetime.now().isoformat()
+            prediction['verified'] = False
 
-        self.predictions.append(prediction)
-        self._save_predictions()
+            self.ledger.insert_prediction(prediction, conn)
 
         logger.info(f"記錄預測: {prediction['stock_code']} - {prediction['direction']}")
 
-    def verify_predictions(self, current_prices: Dict[str, float],
-                          days_elapsed: int = 5):
+    def record_price_snapshot(self, stocks: List[Dict[str, Any]], date: str = None):
         """
-        驗證過期預測
+        保存每日收盤價快照（供驗證時批次查價）
 
         Args:
-            current_prices: {stock_code: current_price}
-            days_elapsed: 預測後經過的天數
+            stocks: TWStockDataFetcher 回傳的股票列表（需含 code, close）
+            date: 快照日期 YYYY-MM-DD，預設取股票資料的 date 欄位或今天
         """
-        today = datetime.now().date()
+        if not stocks:
+            return
 
-        for pred in self.predictions:
-            if pred.get('verified'):
-                continue
+        date = date or stocks[0].get('date') or datetime.now().date().isoformat()
+        prices = [(s['code'], float(s['close'])) for s in stocks if (s.get('close') or 0) > 0]
+        self.ledger.insert_prices(date, prices)
 
-            # 檢查是否到驗證時間
-            pred_date = datetime.strptime(pred['prediction_date'], '%Y-%m-%d').date()
-            if pred['prediction_type'] == 'short_term':
-                verify_after = 5  # 短線5天後驗證
-            else:
-                verify_after = 20  # 長線20天後驗證
-
-            if (today - pred_date).days < verify_after:
-                continue
+        logger.info(f"收盤價快照已保存: {date} ({len(prices)} 支)")
 
-            stock_code = pred['stock_code']
-            if stock_code not in current_prices:
-                continue
+    def verify_predictions(self, current_prices: Dict[str, float] = None,
+                          days_elapsed: int = 5, as_of: str = None):
+        """
+        驗證到期預測
 
-            current_price = current_prices[stock_code]
-            entry_price = pred['entry_price']
+        只處理 due_date 已到期且尚未驗證的預測。
 
-            # 計算實際報酬
-            actual_return = (current_price / entry_price - 1) * 100
+        Args:
+            current_prices: {stock_code: current_price}，未提供時改用每日快照批次查價
+            days_elapsed: 預測後經過的天數
+            as_of: 驗證日期 YYYY-MM-DD，預設為今天
+        """
+        today = datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else datetime.now().date()
 
-            # 判斷預測是否正確
-            predicted_direction = pred['direction']
-            if predicted_direction == 'bullish':
-                is_correct = actual_return > 0
-            elif predicted_direction == 'bearish':
-                is_correct = actual_return < 0
+        with self.ledger.lock, self.ledger.conn as conn:
+            if current_prices is None:
+                due = self.ledger.due_predictions_with_prices(today.isoformat())
             else:
-                is_correct = abs(actual_return) < 3  # 中性預測，波動小於3%
-
-            # 記錄結果
-            result = {
-                'prediction_id': pred['id'],
-                'stock_code': stock_code,
-                'stock_name': pred.get('stock_name', ''),
-                'prediction_date': pred['prediction_date'],
-                'verify_date': today.isoformat(),
-                'predicted_direction': predicted_direction,
-                'predicted_score': pred['score'],
-                'entry_price': entry_price,
-                'exit_price': current_price,
-                'actual_return': round(actual_return, 2),
-                'is_correct': is_correct,
-                'prediction_type': pred['prediction_type']
-            }
+                due = [(pred, current_prices[pred['stock_code']])
+                       for pred in self.ledger.due_predictions(today.isoformat())
+                       if pred['stock_code'] in current_prices]
+
+            for pred, current_price in due:
+                result = self._build_result(pred, current_price, today)
+
+                pred['verified'] = True
+                self.ledger.insert_result(result, conn)
+                self.ledger.mark_verified(pred, conn)
 
-            self.results.append(result)
-            pred['verified'] = True
+                logger.info(f"驗證完成: {result['stock_code']} - {'正確' if result['is_correct'] else '錯誤'} ({result['actual_return']:.2f}%)")
 
-            logger.info(f"驗證完成: {stock_code} - {'正確' if is_correct else '錯誤'} ({actual_return:.2f}%)")
+    def _build_result(self, pred: Dict[str, Any], current_price: float, today) -> Dict[str, Any]:
+        """根據出場價格建立驗證結果"""
+        entry_price = pred['entry_price']
 
-        self._save_predictions()
-        self._save_results()
+        # 計算實際報酬
+        actual_return = (current_price / entry_price - 1) * 100
+
+        # 判斷預測是否正確
+        predicted_direction = pred['direction']
+        if predicted_direction == 'bullish':
+            is_correct = actual_return > 0
+        elif predicted_direction == 'bearish':
+            is_correct = actual_return < 0
+        else:
+            is_correct = abs(actual_return) < 3  # 中性預測，波動小於3%
+
+        return {
+            'prediction_id': pred['id'],
+            'stock_code': pred['stock_code'],
+            'stock_name': pred.get('stock_name', ''),
+            'prediction_date': pred['prediction_date'],
+            'verify_date': today.isoformat(),
+            'predicted_direction': predicted_direction,
+            'predicted_score': pred['score'],
+            'entry_price': entry_price,
+            'exit_price': current_price,
+            'actual_return': round(actual_return, 2),
+            'is_correct': is_correct,
+            'prediction_type': pred['prediction_type']
+        }
 
 
 class BacktestAnalyzer:
@@ -308,6 +614,129 @@ class BacktestAnalyzer:
         return worst.to_dict('records')
 
 
+class RollupAnalyzer:
+    """
+    彙總分析器
+    讀取帳本中隨驗證即時更新的彙總列，提供與 BacktestAnalyzer 相同的指標，
+    計算成本只與區間天數有關；BacktestAnalyzer 的全量掃描保留作為一致性檢查
+    """
+
+    def __init__(self, ledger: PredictionLedger, start_date: str = None,
+                 end_date: str = None):
+        self.ledger = ledger
+        self.start_date = start_date
+        self.rows = ledger.query_rollups(start_date, end_date)
+
+    def _select(self, prediction_type: str = None, direction: str = None,
+                confidence: str = None) -> List[Dict]:
+        return [r for r in self.rows
+                if (prediction_type is None or r['prediction_type'] == prediction_type)
+                and (direction is None or r['direction'] == direction)
+                and (confidence is None or r['confidence'] == confidence)]
+
+    @staticmethod
+    def _sum(rows: List[Dict], key: str):
+        return sum(r[key] for r in rows)
+
+    def calculate_accuracy(self, prediction_type: str = None) -> Dict[str, float]:
+        """計算預測準確率（欄位同 BacktestAnalyzer.calculate_accuracy）"""
+        rows = self._select(prediction_type)
+        total = self._sum(rows, 'count')
+        if total == 0:
+            return {'accuracy': 0, 'total_predictions': 0}
+
+        correct = self._sum(rows, 'correct')
+
+        def direction_accuracy(direction):
+            subset = [r for r in rows if r['direction'] == direction]
+            count = self._sum(subset, 'count')
+            return self._sum(subset, 'correct') / count if count > 0 else 0
+
+        return {
+            'total_predictions': total,
+            'correct_predictions': int(correct),
+            'accuracy': round(correct / total, 4),
+            'bullish_accuracy': round(direction_accuracy('bullish'), 4),
+            'bearish_accuracy': round(direction_accuracy('bearish'), 4)
+        }
+
+    def calculate_returns(self, prediction_type: str = None) -> Dict[str, float]:
+        """計算報酬統計（欄位同 BacktestAnalyzer.calculate_returns）"""
+        rows = self._select(prediction_type)
+        n = self._sum(rows, 'count')
+        if n == 0:
+            return {}
+
+        total = self._sum(rows, 'sum_return')
+        total_sq = self._sum(rows, 'sum_sq_return')
+        mean = total / n
+        std = np.sqrt(max(total_sq - total * total / n, 0) / (n - 1)) if n > 1 else np.nan
+
+        # 策略報酬（按預測方向操作）：看多取原報酬，看空取反向報酬
+        bullish = [r for r in rows if r['direction'] == 'bullish']
+        bearish = [r for r in rows if r['direction'] == 'bearish']
+        s_n = self._sum(bullish, 'count') + self._sum(bearish, 'count')
+        s_total = self._sum(bullish, 'sum_return') - self._sum(bearish, 'sum_return')
+        s_total_sq = self._sum(bullish, 'sum_sq_return') + self._sum(bearish, 'sum_sq_return')
+        s_wins = self._sum(bullish, 'positive') + self._sum(bearish, 'negative')
+
+        if s_n == 0:
+            s_n, s_total, s_total_sq, s_wins = 1, 0.0, 0.0, 0
+
+        s_mean = s_total / s_n
+        s_std = np.sqrt(max(s_total_sq / s_n - s_mean * s_mean, 0))
+
+        return {
+            'avg_return': round(mean, 2),
+            'max_return': round(max(r['max_return'] for r in rows), 2),
+            'min_return': round(min(r['min_return'] for r in rows), 2),
+            'std_return': round(std, 2),
+            'strategy_avg_return': round(s_mean, 2),
+            'strategy_total_return': round(s_total, 2),
+            'sharpe_ratio': round(s_mean / s_std * np.sqrt(252/5), 2) if s_std > 0 else 0,
+            'win_rate': round(s_wins / s_n, 4)
+        }
+
+    def analyze_by_confidence(self) -> Dict[str, Dict]:
+        """按信心度分析準確率（欄位同 BacktestAnalyzer.analyze_by_confidence）"""
+        results = {}
+        for level in ('high_confidence', 'medium_confidence', 'low_confidence'):
+            rows = self._select(confidence=level)
+            count = self._sum(rows, 'count')
+            if count > 0:
+                results[level] = {
+                    'count': count,
+                    'accuracy': round(self._sum(rows, 'correct') / count, 4),
+                    'avg_return': round(self._sum(rows, 'sum_return') / count, 2)
+                }
+        return results
+
+    def weekly_trend(self) -> List[Dict]:
+        """按 ISO 週彙總（同 BacktestReportGenerator._analyze_weekly_trend）"""
+        weeks = {}
+        for r in self.rows:
+            week = datetime.strptime(r['verify_date'], '%Y-%m-%d').isocalendar()[1]
+            stats = weeks.setdefault(week, [0, 0, 0.0])
+            stats[0] += r['count']
+            stats[1] += r['correct']
+            stats[2] += r['sum_return']
+
+        return [{
+            'week': int(week),
+            'count': count,
+            'accuracy': round(correct / count, 4),
+            'avg_return': round(total / count, 2)
+        } for week, (count, correct, total) in sorted(weeks.items())]
+
+    def get_top_performers(self, n: int = 10) -> List[Dict]:
+        """獲取表現最好的預測"""
+        return self.ledger.query_extreme_results(self.start_date or '', n, largest=True)
+
+    def get_worst_performers(self, n: int = 10) -> List[Dict]:
+        """獲取表現最差的預測"""
+        return self.ledger.query_extreme_results(self.start_date or '', n, largest=False)
+
+
 class BacktestReportGenerator:
     """
     回測報告生成器
@@ -324,13 +753,8 @@ class BacktestReportGenerator:
         today = datetime.now().date()
         week_ago = today - timedelta(days=7)
 
-        # 篩選本週結果
-        week_results = [
-            r for r in self.tracker.results
-            if datetime.strptime(r['verify_date'], '%Y-%m-%d').date() >= week_ago
-        ]
-
-        analyzer = BacktestAnalyzer(week_results)
+        # 本週彙總
+        analyzer = RollupAnalyzer(self.tracker.ledger, week_ago.isoformat())
 
         # 計算各項指標
         accuracy = analyzer.calculate_accuracy()
@@ -368,19 +792,14 @@ class BacktestReportGenerator:
         today = datetime.now().date()
         month_ago = today - timedelta(days=30)
 
-        # 篩選本月結果
-        month_results = [
-            r for r in self.tracker.results
-            if datetime.strptime(r['verify_date'], '%Y-%m-%d').date() >= month_ago
-        ]
-
-        analyzer = BacktestAnalyzer(month_results)
+        # 本月彙總
+        analyzer = RollupAnalyzer(self.tracker.ledger, month_ago.isoformat())
 
         accuracy = analyzer.calculate_accuracy()
         returns = analyzer.calculate_returns()
 
         # 按週分析趨勢
-        weekly_trend = self._analyze_weekly_trend(month_results)
+        weekly_trend = analyzer.weekly_trend()
 
         report = {
             'report_type': 'monthly',
@@ -398,11 +817,22 @@ class BacktestReportGenerator:
             'returns': returns,
             'weekly_trend': weekly_trend,
             'confidence_analysis': analyzer.analyze_by_confidence(),
+            'stock_performance': self.stock_performance(),
             'recommendations': self._generate_recommendations(accuracy, returns, {})
         }
 
         return report
 
+    def stock_performance(self, n: int = 5, min_count: int = 3) -> Dict[str, List[Dict]]:
+        """個股累計表現（自帳本建立以來，至少 min_count 次驗證的股票）"""
+        ledger = self.tracker.ledger
+        best = ledger.query_stock_rollups(n, min_count, best=True)
+        # 股票數不多時最佳與最差會重疊，最差名單不重複列出
+        best_codes = {stats['stock_code'] for stats in best}
+        worst = [stats for stats in ledger.query_stock_rollups(n + len(best), min_count, best=False)
+                 if stats['stock_code'] not in best_codes][:n]
+        return {'min_count': min_count, 'best': best, 'worst': worst}
+
     def _analyze_weekly_trend(self, results: List[Dict]) -> List[Dict]:
         """分析週趨勢"""
         if not results:
@@ -495,6 +925,15 @@ class BacktestReportGenerator:
                 level_name = {'high_confidence': '高信心', 'medium_confidence': '中信心', 'low_confidence': '低信心'}.get(level, level)
                 lines.append(f"{level_name}: 準確率 {stats['accuracy']:.1%}, 平均報酬 {stats['avg_return']:.2f}%")
 
+        # 個股累計表現
+        stock_performance = report.get('stock_performance') or {}
+        if stock_performance.get('best'):
+            lines.append(f"\n🏷️ 個股累計表現（至少 {stock_performance['min_count']} 次驗證）")
+            for label, key in (('最佳', 'best'), ('最差', 'worst')):
+                for stats in stock_performance[key]:
+                    lines.append(f"{label} {stats['stock_code']}: 準確率 {stats['accuracy']:.1%}, "
+                                 f"平均報酬 {stats['avg_return']:.2f}% ({stats['count']} 次)")
+
         # 優化建議
         if report.get('recommendations'):
             lines.append("\n💡 優化建議")
@@ -516,10 +955,17 @@ class AutoBacktestRunner:
         self.tracker = PredictionTracker(data_dir)
         self.report_generator = BacktestReportGenerator(self.tracker)
 
-    def run_daily_verification(self, current_prices: Dict[str, float]):
+    def run_daily_verification(self, current_prices: Dict[str, float] = None,
+                               snapshot: List[Dict[str, Any]] = None):
         """
         執行每日驗證
+
+        Args:
+            current_prices: {stock_code: current_price}（相容舊呼叫方式）
+            snapshot: 當日全市場股票列表，會先存入快照再批次查價
         """
+        if snapshot:
+            self.tracker.record_price_snapshot(snapshot)
         self.tracker.verify_predictions(current_prices)
         logger.info("每日預測驗證完成")
 
@@ -554,17 +1000,38 @@ class AutoBacktestRunner:
         """
         獲取當前統計資訊
         """
-        analyzer = BacktestAnalyzer(self.tracker.results)
+        analyzer = RollupAnalyzer(self.tracker.ledger)
 
         return {
-            'total_predictions': len(self.tracker.predictions),
-            'verified_predictions': len(self.tracker.results),
-            'pending_verification': len([p for p in self.tracker.predictions if not p.get('verified')]),
+            **self.tracker.get_stats_counts(),
             'accuracy': analyzer.calculate_accuracy(),
-            'returns': analyzer.calculate_returns()
+            'returns': analyzer.calculate_returns(),
+            'stock_performance': self.report_generator.stock_performance()
         }
 
 
+    def check_consistency(self) -> Dict[str, Any]:
+        """
+        一致性檢查：以 BacktestAnalyzer 全量掃描結果比對彙總
+
+        Returns:
+            {'consistent': bool, 'mismatches': {指標: (全量, 彙總)}}
+        """
+        full = BacktestAnalyzer(self.tracker.results)
+        rollup = RollupAnalyzer(self.tracker.ledger)
+
+        mismatches = {}
+        for name in ('calculate_accuracy', 'calculate_returns', 'analyze_by_confidence'):
+            expected = getattr(full, name)()
+            actual = getattr(rollup, name)()
+            if json.dumps(expected, sort_keys=True, default=str) != json.dumps(actual, sort_keys=True, default=str):
+                mismatches[name] = (expected, actual)
+
+        if mismatches:
+            logger.warning(f"回測彙總與全量掃描不一致: {list(mismatches)}")
+
+        return {'consistent': not mismatches, 'mismatches': mismatches}
+
 # ==================== 測試 ====================
 
 if __name__ == '__main__':
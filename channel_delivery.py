@@ -0,0 +1,415 @@
+"""
+channel_delivery.py - LINE / Telegram 推播渠道層
+共用 HTTP 連線池、遵守各 API 的速率限制，並行送往所有渠道
+
+功能：
+1. 連線池 - 每個 API 一個 requests.Session（keep-alive），不再每則訊息重新連線
+2. 速率限制 - 令牌桶控制整體與單一對象的發送速率
+3. LINE multicast - 多位使用者一次呼叫送出（每次最多 500 位）
+4. 並行發送 - send_concurrently 同時送往所有啟用的渠道
+5. 部分成功 - 至少一個對象送達即視為已送出，失敗對象只記錄，避免重送造成重複推播
+6. 本機替身 - LocalHTTPStandIn 可在無網路環境下壓測
+
+使用方式：
+    line = LineMessagingChannel(token)
+    line.send([{'type': 'text', 'text': 'hi'}], user_ids=['U1', 'U2'], group_ids=['C1'])
+
+    results = send_concurrently({
+        'line': lambda: line.send(messages, user_ids=ids),
+        'telegram': lambda: telegram.send_message('hi'),
+    })
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Any, Optional
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+LINE_API_BASE = 'https://api.line.me'
+LINE_NOTIFY_API_BASE = 'https://notify-api.line.me'
+TELEGRAM_API_BASE = 'https://api.telegram.org'
+
+# LINE multicast 每次最多 500 位使用者
+LINE_MULTICAST_LIMIT = 500
+
+
+def split_ids(value) -> List[str]:
+    """解析對象清單：接受清單或以逗號分隔的字串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [item.strip() for item in value if item and str(item).strip()]
+
+
+class TokenBucket:
+    """令牌桶速率限制（執行緒安全，取不到令牌時阻塞等待）"""
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        Args:
+            rate: 每秒補充的令牌數
+            burst: 桶容量（預設等於 rate，至少 1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """每個對象各自一個令牌桶（例如 Telegram 每個聊天室每秒 1 則）"""
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        bucket.acquire()
+
+
+def create_session(pool_size: int = 10, headers: Dict[str, str] = None) -> requests.Session:
+    """建立共用連線池的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def send_concurrently(tasks: Dict[str, Callable[[], bool]],
+                      timeout: float = None) -> Dict[str, bool]:
+    """
+    同時執行各渠道的發送函數
+
+    Returns:
+        {渠道: 是否成功}；拋出例外或逾時視為失敗
+    """
+    if not tasks:
+        return {}
+
+    executor = ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='channel')
+    try:
+        futures = {name: executor.submit(task) for name, task in tasks.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = bool(future.result(timeout=timeout))
+            except Exception as e:
+                logger.error(f"{name} 渠道發送錯誤: {e}")
+                results[name] = False
+        return results
+    finally:
+        executor.shutdown(wait=False)
+
+
+class _Channel:
+    """共用的發送流程：連線池 + 速率限制 + 並行送往多個對象"""
+
+    def __init__(self, api_base: str, rate: float, pool_size: int = 10,
+                 headers: Dict[str, str] = None, timeout: float = 30):
+        self.api_base = api_base.rstrip('/')
+        self.session = create_session(pool_size, headers)
+        self.limiter = TokenBucket(rate)
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+    def _post(self, path: str, **kwargs) -> requests.Response:
+        self.limiter.acquire()
+        return self.session.post(f"{self.api_base}{path}", timeout=self.timeout, **kwargs)
+
+    def _fan_out(self, func: Callable[[Any], bool], targets: List[Any]) -> Dict[Any, bool]:
+        """並行送往多個對象"""
+        if len(targets) <= 1:
+            return {target: func(target) for target in targets}
+        with ThreadPoolExecutor(max_workers=min(len(targets), self.pool_size)) as executor:
+            return dict(zip(targets, executor.map(func, targets)))
+
+    @staticmethod
+    def _settle(label: str, results: Dict[Any, bool]) -> bool:
+        """
+        彙整多個對象的發送結果
+
+        寄件匣以整則訊息為單位重送，部分成功時重送會讓已收到的對象重複收到，
+        因此只要有對象送達即視為已送出，失敗的對象記錄在日誌中。
+        """
+        failed = [target for target, ok in results.items() if not ok]
+        if failed and len(failed) < len(results):
+            logger.warning(f"{label} 部分對象發送失敗（不重送）: {failed}")
+        return len(failed) < len(results)
+
+    def close(self):
+        self.session.close()
+
+
+class LineMessagingChannel(_Channel):
+    """
+    LINE Messaging API
+
+    使用者以 multicast 一次送出（每次最多 500 位），群組 / 聊天室以 push 逐一送出。
+    """
+
+    def __init__(self, channel_access_token: str, api_base: str = LINE_API_BASE,
+                 rate: float = 100, pool_size: int = 10):
+        super().__init__(api_base, rate, pool_size, headers={
+            'Authorization': f'Bearer {channel_access_token}',
+            'Content-Type': 'application/json',
+        })
+
+    def push(self, to: str, messages: List[Dict[str, Any]]) -> bool:
+        try:
+            response = self._post('/v2/bot/message/push',
+                                  data=json.dumps({'to': to, 'messages': messages}))
+            if response.status_code == 200:
+                return True
+            logger.error(f"LINE push 失敗: {response.status_code} - {response.text}")
+        except requests.RequestException as e:
+            logger.error(f"LINE push 錯誤: {e}")
+        return False
+
+    def multicast(self, user_ids: List[str], messages: List[Dict[str, Any]]) -> bool:
+        """送給多位使用者（自動依 500 位分批）"""
+        batches = [user_ids[i:i + LINE_MULTICAST_LIMIT]
+                   for i in range(0, len(user_ids), LINE_MULTICAST_LIMIT)]
+
+        def send_batch(batch: tuple) -> bool:
+            try:
+                response = self._post('/v2/bot/message/multicast',
+                                      data=json.dumps({'to': list(batch), 'messages': messages}))
+                if response.status_code == 200:
+                    return True
+                logger.error(f"LINE multicast 失敗: {response.status_code} - {response.text}")
+            except requests.RequestException as e:
+                logger.error(f"LINE multicast 錯誤: {e}")
+            return False
+
+        results = self._fan_out(send_batch, [tuple(batch) for batch in batches])
+        # 以使用者為單位記錄失敗對象
+        return self._settle('LINE multicast', {user_id: ok for batch, ok in results.items()
+                                               for user_id in batch})
+
+    def send(self, messages: List[Dict[str, Any]], user_ids: List[str] = None,
+             group_ids: List[str] = None) -> bool:
+        """
+        送給所有使用者與群組
+
+        Returns:
+            bool: 至少一個對象送達（部分失敗只記錄，不重送）
+        """
+        user_ids = split_ids(user_ids)
+        group_ids = split_ids(group_ids)
+
+        tasks = {}
+        if len(user_ids) == 1:
+            group_ids = user_ids + group_ids
+        elif user_ids:
+            tasks['multicast'] = lambda: self.multicast(user_ids, messages)
+        if group_ids:
+            tasks['push'] = lambda: self._settle('LINE push', self._fan_out(
+                lambda to: self.push(to, messages), group_ids))
+        if not tasks:
+            return False
+        if len(tasks) == 1:
+            return next(iter(tasks.values()))()
+        return self._settle('LINE', send_concurrently(tasks))
+
+
+class LineNotifyChannel(_Channel):
+    """LINE Notify（每個權杖對應一個接收對象，多個權杖並行送出）"""
+
+    def __init__(self, tokens, api_base: str = LINE_NOTIFY_API_BASE,
+                 rate: float = 10, pool_size: int = 10):
+        super().__init__(api_base, rate, pool_size)
+        self.tokens = split_ids(tokens)
+
+    def send(self, message: str, image_file: str = None) -> bool:
+        if not self.tokens:
+            return False
+
+        def send_one(token: str) -> bool:
+            headers = {'Authorization': f'Bearer {token}'}
+            try:
+                if image_file:
+                    with open(image_file, 'rb') as f:
+                        response = self._post('/api/notify', headers=headers,
+                                              data={'message': message}, files={'imageFile': f})
+                else:
+                    response = self._post('/api/notify', headers=headers, data={'message': message})
+                if response.status_code == 200:
+                    return True
+                logger.error(f"LINE Notify 發送失敗: {response.status_code}")
+            except (requests.RequestException, OSError) as e:
+                logger.error(f"LINE Notify 發送錯誤: {e}")
+            return False
+
+        return self._settle('LINE Notify', self._fan_out(send_one, self.tokens))
+
+
+class TelegramChannel(_Channel):
+    """
+    Telegram Bot API
+
+    整體每秒最多 30 則、每個聊天室每秒 1 則（官方建議上限）。
+    """
+
+    def __init__(self, bot_token: str, chat_ids, api_base: str = TELEGRAM_API_BASE,
+                 rate: float = 30, per_chat_rate: float = 1, pool_size: int = 10):
+        super().__init__(f"{api_base.rstrip('/')}/bot{bot_token}", rate, pool_size)
+        self.chat_ids = split_ids(chat_ids)
+        self.chat_limiter = KeyedRateLimiter(per_chat_rate)
+
+    def _send(self, method: str, chat_id: str, data: Dict[str, Any], files=None) -> bool:
+        self.chat_limiter.acquire(chat_id)
+        try:
+            response = self._post(f'/{method}', data={**data, 'chat_id': chat_id}, files=files)
+            if response.status_code == 200:
+                return True
+            logger.error(f"Telegram {method} 失敗: {response.status_code} - {response.text}")
+        except requests.RequestException as e:
+            logger.error(f"Telegram {method} 錯誤: {e}")
+        return False
+
+    def send_message(self, text: str, parse_mode: str = 'Markdown',
+                     reply_markup: Dict = None) -> bool:
+        data = {'text': text, 'parse_mode': parse_mode}
+        if reply_markup:
+            data['reply_markup'] = json.dumps(reply_markup)
+        if not self.chat_ids:
+            return False
+        return self._settle('Telegram sendMessage', self._fan_out(
+            lambda chat_id: self._send('sendMessage', chat_id, data), self.chat_ids))
+
+    def send_photo(self, photo_path: str, caption: str = '') -> bool:
+        def send_one(chat_id: str) -> bool:
+            try:
+                with open(photo_path, 'rb') as f:
+                    return self._send('sendPhoto', chat_id, {'caption': caption}, files={'photo': f})
+            except OSError as e:
+                logger.error(f"Telegram 圖片讀取錯誤: {e}")
+                return False
+        if not self.chat_ids:
+            return False
+        return self._settle('Telegram sendPhoto', self._fan_out(send_one, self.chat_ids))
+
+
+# ==================== 本機 HTTP 替身 ====================
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self.server.record(self.path, body)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        failed = any(marker.encode() in body for marker in self.server.fail_markers)
+        payload = b'{"message": "stand-in failure"}' if failed else b'{}'
+        self.send_response(500 if failed else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalHTTPStandIn(ThreadingHTTPServer):
+    """
+    本機 HTTP 替身：所有 POST 都回 200，記錄路徑與內容，可設定模擬延遲
+
+    內容含 fail_markers 中任一字串的請求回 500，用來模擬部分對象發送失敗。
+
+    使用方式：
+        with LocalHTTPStandIn(latency=0.05) as server:
+            line = LineMessagingChannel('token', api_base=server.url)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 fail_markers: List[str] = None):
+        super().__init__((host, port), _StandInHandler)
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self.latency = latency
+        self.fail_markers = list(fail_markers or [])
+        self.requests = []
+        self.connections = 0
+        self._record_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def record(self, path: str, body: bytes):
+        with self._record_lock:
+            self.requests.append((path, body))
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='推播渠道離線壓測')
+    parser.add_argument('--messages', type=int, default=20, help='訊息數')
+    parser.add_argument('--users', type=int, default=50, help='LINE 使用者數')
+    parser.add_argument('--chats', type=int, default=5, help='Telegram 聊天室數')
+    parser.add_argument('--latency', type=float, default=0.02, help='替身回應延遲（秒）')
+    args = parser.parse_args()
+
+    user_ids = [f'U{i:032d}' for i in range(args.users)]
+    chat_ids = [str(1000 + i) for i in range(args.chats)]
+
+    with LocalHTTPStandIn(latency=args.latency) as server:
+        line = LineMessagingChannel('token', api_base=server.url)
+        telegram = TelegramChannel('token', chat_ids, api_base=server.url, per_chat_rate=1000)
+
+        start = time.perf_counter()
+        for i in range(args.messages):
+            send_concurrently({
+                'line': lambda: line.send([{'type': 'text', 'text': f'訊息 {i}'}], user_ids=user_ids),
+                'telegram': lambda: telegram.send_message(f'訊息 {i}'),
+            })
+        elapsed = time.perf_counter() - start
+
+    print(f"訊息: {args.messages} 則 → LINE {args.users} 位使用者 + Telegram {args.chats} 個聊天室")
+    print(f"HTTP 請求: {len(server.requests)}，TCP 連線: {server.connections}")
+    print(f"耗時: {elapsed:.3f} 秒")
@@ -0,0 +1,400 @@
+"""
+chart_service.py - 批次圖表渲染服務
+一次掃描的所有圖表在子程序池中以 Agg 後端平行渲染
+
+功能：
+1. 批次渲染 - render_batch 一次送出所有圖表，子程序平行繪製
+2. 圖表樣板 - 每個程序每種圖表只建立一次 Figure，之後清除座標軸重畫
+3. 內容快取 - 以輸入資料雜湊命名 PNG，資料未變的圖表直接沿用
+4. 無 pyplot - 使用 Figure + FigureCanvasAgg，不依賴 GUI 後端與 pyplot 全域狀態
+
+使用方式：
+    from chart_service import get_chart_service, prediction_chart_spec
+    specs = [prediction_chart_spec(code, df, prediction) for code, df, prediction in items]
+    paths = get_chart_service().render_batch(specs)   # {股票代碼: PNG 路徑}
+
+環境變數：
+    CHART_WORKERS  子程序數（預設 min(4, CPU 數)，1 表示不使用子程序）
+"""
+
+import os
+import json
+import time
+import atexit
+import hashlib
+import importlib.util
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 只檢查是否安裝，實際在渲染時才載入 matplotlib
+MATPLOTLIB_AVAILABLE = importlib.util.find_spec('matplotlib') is not None
+
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', '0')) or min(4, os.cpu_count() or 1)
+
+CHART_STYLE = 'dark_background'
+CHART_FACECOLOR = '#1e1e1e'
+CHART_DPI = 100
+
+
+# ==================== 圖表規格 ====================
+# 規格為純資料 dict（可序列化），在主程序建立後送往子程序
+
+def _to_list(values) -> List[Optional[float]]:
+    return [None if v != v else float(v) for v in values]
+
+
+def prediction_chart_spec(stock_code: str, historical_data: 'pd.DataFrame',
+                          prediction: Dict) -> Dict[str, Any]:
+    """預測圖表規格（近 30 日收盤價、均線、成交量與預測目標價）"""
+    close_series = historical_data['close']
+    close = close_series.values[-30:]
+    spec = {
+        'kind': 'prediction',
+        'key': stock_code,
+        'title': f'{stock_code} 價格走勢與預測',
+        'close': _to_list(close),
+        'ma5': _to_list(close_series.rolling(5).mean().values[-30:]) if len(close) >= 5 else None,
+        'ma20': _to_list(close_series.rolling(20).mean().values[-30:]) if len(close) >= 20 else None,
+        'volume': (_to_list(historical_data['volume'].values[-30:])
+                   if 'volume' in historical_data.columns else None),
+        'direction': prediction.get('direction', 'neutral'),
+        'target_price': float(prediction.get('target_price', {}).get('target_mid', close[-1])),
+    }
+    return spec
+
+
+def performance_chart_spec(results: List[Dict]) -> Optional[Dict[str, Any]]:
+    """績效圖表規格（累計報酬率與 10 日滾動準確率）"""
+    if not results:
+        return None
+
+    import pandas as pd
+
+    df = pd.DataFrame(results)
+    df['verify_date'] = pd.to_datetime(df['verify_date'])
+    df = df.sort_values('verify_date')
+    return {
+        'kind': 'performance',
+        'key': 'performance',
+        'dates': [d.isoformat() for d in df['verify_date']],
+        'cumulative_return': _to_list(df['actual_return'].cumsum().values),
+        'rolling_accuracy': _to_list(df['is_correct'].astype(float).rolling(10).mean().values),
+    }
+
+
+def spec_hash(spec: Dict[str, Any]) -> str:
+    """圖表規格的內容雜湊"""
+    raw = json.dumps(spec, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+# ==================== 繪圖（主程序與子程序共用） ====================
+
+# 每個程序的圖表樣板 {kind: (figure, axes)}
+_templates = {}
+_render_lock = threading.Lock()
+
+
+def _init_worker():
+    """子程序初始化：載入 Agg 後端並預先建立樣板"""
+    import matplotlib
+    matplotlib.use('Agg')
+    for kind in _DRAWERS:
+        _get_template(kind)
+
+
+def _get_template(kind: str):
+    template = _templates.get(kind)
+    if template is None:
+        import matplotlib.style
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        with matplotlib.style.context(CHART_STYLE):
+            fig = Figure(figsize=(10, 8))
+            FigureCanvasAgg(fig)
+            height_ratios = [3, 1] if kind == 'prediction' else [1, 1]
+            axes = fig.subplots(2, 1, gridspec_kw={'height_ratios': height_ratios})
+            fig.subplots_adjust(left=0.08, right=0.97, top=0.95, bottom=0.06, hspace=0.3)
+        template = _templates[kind] = (fig, axes)
+    return template
+
+
+def _draw_prediction(axes, spec: Dict[str, Any]):
+    import numpy as np
+
+    ax1, ax2 = axes
+    close = np.array(spec['close'], dtype=float)
+    dates = range(len(close))
+
+    ax1.plot(dates, close, 'w-', linewidth=1.5, label='收盤價')
+    if spec['ma5'] is not None:
+        ax1.plot(dates, np.array(spec['ma5'], dtype=float), 'y--', linewidth=1, alpha=0.7, label='MA5')
+    if spec['ma20'] is not None:
+        ax1.plot(dates, np.array(spec['ma20'], dtype=float), 'c--', linewidth=1, alpha=0.7, label='MA20')
+
+    # 預測方向
+    direction = spec['direction']
+    target_price = spec['target_price']
+    color = ('g' if direction in ['bullish', 'strong_buy', 'buy']
+             else 'r' if direction in ['bearish', 'strong_sell', 'sell'] else None)
+    if color:
+        ax1.axhline(y=target_price, color=color, linestyle=':', alpha=0.7, label=f'目標價 {target_price:.0f}')
+        ax1.fill_between(dates[-5:], close[-5:], target_price, alpha=0.2, color=color)
+
+    ax1.set_title(spec['title'], fontsize=12, color='white')
+    ax1.legend(loc='upper left', fontsize=8)
+    ax1.grid(True, alpha=0.3)
+
+    # 成交量圖
+    if spec['volume'] is not None:
+        colors = ['g'] + ['g' if close[i] >= close[i - 1] else 'r' for i in range(1, len(close))]
+        ax2.bar(dates, spec['volume'], color=colors, alpha=0.7)
+        ax2.set_title('成交量', fontsize=10, color='white')
+        ax2.grid(True, alpha=0.3)
+
+
+def _draw_performance(axes, spec: Dict[str, Any]):
+    import numpy as np
+
+    ax1, ax2 = axes
+    dates = [datetime.fromisoformat(d) for d in spec['dates']]
+    cumulative_return = np.array(spec['cumulative_return'], dtype=float)
+
+    # 累計報酬
+    ax1.plot(dates, cumulative_return, 'g-', linewidth=2)
+    ax1.fill_between(dates, 0, cumulative_return, where=(cumulative_return >= 0), alpha=0.3, color='g')
+    ax1.fill_between(dates, 0, cumulative_return, where=(cumulative_return < 0), alpha=0.3, color='r')
+    ax1.axhline(y=0, color='white', linestyle='--', alpha=0.5)
+    ax1.set_title('累計報酬率 (%)', fontsize=12, color='white')
+    ax1.grid(True, alpha=0.3)
+
+    # 準確率滾動
+    ax2.plot(dates, np.array(spec['rolling_accuracy'], dtype=float), 'y-', linewidth=2)
+    ax2.axhline(y=0.5, color='r', linestyle='--', alpha=0.5, label='50%基準')
+    ax2.set_title('10日滾動準確率', fontsize=12, color='white')
+    ax2.set_ylim(0, 1)
+    ax2.grid(True, alpha=0.3)
+    ax2.legend()
+
+
+_DRAWERS = {
+    'prediction': _draw_prediction,
+    'performance': _draw_performance,
+}
+
+
+def _render_chart(job: Tuple[Dict[str, Any], str]) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    渲染單張圖表到指定路徑（先寫暫存檔再改名，快取中不會出現不完整的 PNG）
+
+    Returns:
+        (key, 路徑或 None, 錯誤訊息或 None)
+    """
+    spec, filepath = job
+    try:
+        import matplotlib.style
+
+        with _render_lock, matplotlib.style.context(CHART_STYLE):
+            fig, axes = _get_template(spec['kind'])
+            for ax in axes:
+                ax.clear()
+            _DRAWERS[spec['kind']](axes, spec)
+
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            # 樣板已固定邊界，不使用 bbox_inches='tight'（會多繪製一次）
+            fig.savefig(tmp_path, format='png', dpi=CHART_DPI, facecolor=CHART_FACECOLOR)
+        os.replace(tmp_path, filepath)
+        return spec['key'], filepath, None
+    except Exception as e:
+        return spec['key'], None, str(e)
+
+
+def _noop(_=None) -> int:
+    return os.getpid()
+
+
+# ==================== 子程序池 ====================
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """共用的子程序池（spawn 啟動，避免 fork 複製背景執行緒的鎖狀態）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+            atexit.register(shutdown_pool)
+        return _pool
+
+
+def shutdown_pool():
+    """關閉子程序池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ==================== 圖表服務 ====================
+
+class ChartService:
+    """
+    批次圖表渲染服務
+
+    PNG 以「種類_代碼_資料雜湊.png」命名；同樣資料再次請求時直接返回既有檔案。
+    """
+
+    def __init__(self, output_dir: str = './data/charts', max_workers: int = None,
+                 retention_days: int = 7):
+        self.output_dir = output_dir
+        self.max_workers = max_workers or CHART_WORKERS
+        self.stats = {'rendered': 0, 'cached': 0, 'failed': 0, 'batches': 0, 'seconds': 0.0}
+        os.makedirs(output_dir, exist_ok=True)
+        self.prune(retention_days)
+
+    def _path(self, spec: Dict[str, Any], digest: str) -> str:
+        return os.path.join(self.output_dir, f"{spec['kind']}_{spec['key']}_{digest[:16]}.png")
+
+    def render_batch(self, specs: List[Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """
+        渲染一批圖表
+
+        Returns:
+            {規格 key: PNG 路徑}；渲染失敗或 matplotlib 未安裝時為 None
+        """
+        results = {}
+        pending = []
+        for spec in specs:
+            if spec is None:
+                continue
+            filepath = self._path(spec, spec_hash(spec))
+            if os.path.exists(filepath):
+                results[spec['key']] = filepath
+                self.stats['cached'] += 1
+            else:
+                results[spec['key']] = None
+                pending.append((spec, filepath))
+
+        if not pending or not MATPLOTLIB_AVAILABLE:
+            return results
+
+        start = time.perf_counter()
+        for key, filepath, error in self._render(pending):
+            results[key] = filepath
+            if filepath:
+                self.stats['rendered'] += 1
+            else:
+                self.stats['failed'] += 1
+                logger.error(f"圖表生成失敗 {key}: {error}")
+
+        self.stats['batches'] += 1
+        self.stats['seconds'] += time.perf_counter() - start
+        return results
+
+    def _render(self, jobs: List[Tuple[Dict[str, Any], str]]):
+        """多張圖表交給子程序池，單張或子程序不可用時在本程序繪製"""
+        if len(jobs) > 1 and self.max_workers > 1:
+            try:
+                pool = _get_pool(self.max_workers)
+                chunksize = max(1, -(-len(jobs) // self.max_workers))
+                return list(pool.map(_render_chart, jobs, chunksize=chunksize))
+            except Exception as e:
+                logger.warning(f"圖表子程序池無法使用，改在本程序繪製: {e}")
+                shutdown_pool()
+        return [_render_chart(job) for job in jobs]
+
+    def render(self, spec: Dict[str, Any]) -> Optional[str]:
+        """渲染單張圖表"""
+        if spec is None:
+            return None
+        return self.render_batch([spec]).get(spec['key'])
+
+    def warm_up(self) -> bool:
+        """預先建立本程序的圖表樣板並啟動子程序池"""
+        if not MATPLOTLIB_AVAILABLE:
+            return False
+        with _render_lock:
+            _init_worker()
+        if self.max_workers > 1:
+            pool = _get_pool(self.max_workers)
+            list(pool.map(_noop, range(self.max_workers)))
+        return True
+
+    def prune(self, retention_days: int) -> int:
+        """刪除超過保存天數的圖表，返回刪除數"""
+        cutoff = time.time() - retention_days * 86400
+        removed = 0
+        for filename in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, filename)
+            try:
+                if filename.endswith('.png') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+# ==================== 簡易整合函數 ====================
+
+# 全局圖表服務 {輸出目錄: 服務}
+_services = {}
+
+def get_chart_service(output_dir: str = './data/charts') -> ChartService:
+    """獲取圖表服務實例（同一輸出目錄共用）"""
+    service = _services.get(output_dir)
+    if service is None:
+        service = _services[output_dir] = ChartService(output_dir)
+    return service
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import numpy as np
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='批次圖表渲染壓測')
+    parser.add_argument('--charts', type=int, default=10, help='圖表數')
+    parser.add_argument('--workers', type=int, default=CHART_WORKERS, help='子程序數')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    items = []
+    for i in range(args.charts):
+        close = 100 + rng.normal(0, 1, 60).cumsum()
+        df = pd.DataFrame({'close': close, 'volume': rng.integers(1000, 5000, 60)})
+        items.append((f'{2000 + i}', df, {'direction': 'bullish', 'target_price': {'target_mid': close[-1] * 1.05}}))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = ChartService(tmp, max_workers=args.workers)
+        specs = [prediction_chart_spec(*item) for item in items]
+
+        start = time.perf_counter()
+        service.warm_up()
+        warm = time.perf_counter() - start
+
+        start = time.perf_counter()
+        service.render_batch(specs)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        service.render_batch(specs)
+        cached = time.perf_counter() - start
+
+    shutdown_pool()
+    print(f"圖表: {args.charts} 張，子程序: {args.workers}")
+    print(f"預熱: {warm:.3f} 秒，首次渲染: {cold:.3f} 秒，快取命中: {cached:.4f} 秒")
+    print(f"統計: {service.stats}")
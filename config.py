@@ -5,16 +5,19 @@ enhanced_config.py - 台股分析機器人的優化配置檔案
 """
 import os
 import sys
+import logging
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # 首先嘗試從.env文件加載環境變量（若存在）
 # 但如果變量已經在系統環境中存在，則優先使用系統環境中的變量（如GitHub Secrets）
 dotenv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
 if os.path.exists(dotenv_path):
     load_dotenv(dotenv_path)
-    print(f"已從 {dotenv_path} 加載環境變量配置")
+    logger.debug(f"已從 {dotenv_path} 加載環境變量配置")
 else:
-    print("未找到.env文件，將使用系統環境變量")
+    logger.debug("未找到.env文件，將使用系統環境變量")
 
 # 日誌和緩存目錄
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,9 +25,11 @@ LOG_DIR = os.path.join(BASE_DIR, 'logs')
 CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 
-# 確保必要的目錄存在
-for directory in [LOG_DIR, CACHE_DIR, DATA_DIR]:
-    os.makedirs(directory, exist_ok=True)
+
+def ensure_directories():
+    """確保必要的目錄存在（由需要寫入的入口呼叫，導入配置本身不建立目錄）"""
+    for directory in [LOG_DIR, CACHE_DIR, DATA_DIR]:
+        os.makedirs(directory, exist_ok=True)
 
 # 通知配置
 EMAIL_CONFIG = {
@@ -34,16 +39,18 @@ EMAIL_CONFIG = {
     'receiver': os.getenv('EMAIL_RECEIVER'),
     'smtp_server': os.getenv('EMAIL_SMTP_SERVER', 'smtp.gmail.com'),
     'smtp_port': int(os.getenv('EMAIL_SMTP_PORT', '587')),
-    'use_tls': os.getenv('EMAIL_USE_TLS', 'True').lower() in ('true', '1', 't')
+    'use_tls': os.getenv('EMAIL_USE_TLS', 'True').lower() in ('true', '1', 't'),
+    'max_recipients': int(os.getenv('EMAIL_MAX_RECIPIENTS', '50')),  # 每封郵件收件人上限，超過時分批
 }
 
 # LINE通知配置
 LINE_CONFIG = {
     'enabled': os.getenv('LINE_ENABLED', 'True').lower() in ('true', '1', 't'),  # 默認啟用
     'channel_access_token': os.getenv('LINE_CHANNEL_ACCESS_TOKEN'),
-    'user_id': os.getenv('LINE_USER_ID'),
-    'group_id': os.getenv('LINE_GROUP_ID'),  # 支援群組推播
-    'api_url': 'https://api.line.me/v2/bot/message/push'
+    'user_id': os.getenv('LINE_USER_ID'),  # 可用逗號分隔多位使用者（以 multicast 一次送出）
+    'group_id': os.getenv('LINE_GROUP_ID'),  # 支援群組推播，可用逗號分隔多個群組
+    'api_url': 'https://api.line.me/v2/bot/message/push',
+    'api_base': os.getenv('LINE_API_BASE', 'https://api.line.me'),  # 可指向本機替身壓測
 }
 
 # 通知渠道配置（啟用LINE）
@@ -80,6 +87,15 @@ RETRY_CONFIG = {
     'max_delay': 60,
 }
 
+# 通知寄件匣（背景派送，未送達的通知在之後的執行中重送）
+NOTIFICATION_OUTBOX = {
+    'enabled': os.getenv('NOTIFICATION_ASYNC', 'True').lower() in ('true', '1', 't'),
+    'db_path': os.path.join(CACHE_DIR, 'notification_outbox.db'),
+    'max_delay': 1800,      # 重試間隔上限（秒）
+    'max_age_hours': 24,    # 超過此時間仍未送達即放棄
+    'flush_timeout': 60,    # 程序結束前等待送出的秒數
+}
+
 # 市場環境配置
 MARKET_ENVIRONMENTS = {
     'bullish': {  # 牛市配置
@@ -260,6 +276,16 @@ STOCK_ANALYSIS = {
     'use_white_text': True,
 }
 
+# 盤中增量重掃（常駐模式）：只重新分析報價變動超過容許範圍或新進入成交金額前N名的股票
+DELTA_SCAN = {
+    'enabled': os.getenv('DELTA_SCAN_ENABLED', 'True').lower() in ('true', '1', 't'),
+    'time_slots': ['mid_morning_scan', 'mid_day_scan'],
+    'close_tolerance': float(os.getenv('DELTA_CLOSE_TOLERANCE', '0.005')),         # 收盤價相對變動（0.5%）
+    'volume_tolerance': float(os.getenv('DELTA_VOLUME_TOLERANCE', '0.10')),        # 成交量相對變動（10%）
+    'trade_value_tolerance': float(os.getenv('DELTA_TRADE_VALUE_TOLERANCE', '0.10')),  # 成交金額相對變動（10%）
+    'top_n': int(os.getenv('DELTA_TOP_N', '50')),  # 新進入成交金額前N名的股票一律重新分析
+}
+
 # 股市交易時間
 MARKET_HOURS = {
     'morning_start': '09:00',
@@ -0,0 +1,242 @@
+"""
+day_state.py - 常駐程序的當日狀態
+在同一個交易日的各排程時段之間保留全市場快照、個股數據與分析結果
+
+功能：
+1. 全市場快照 - 保留最近一次取得的快照；重新抓取失敗時沿用當日快照
+2. 個股數據快取 - 技術面（歷史數據）、基本面、法人數據在當日內共用，換日自動清空
+3. 分析結果沿用 - 報價與分析重點都未變的股票直接沿用上一個時段的分析
+4. 盤中增量重掃 - 以向量化比對收盤價、成交量、成交金額，只重新分析變動超過容許範圍
+   或新進入成交金額前N名的股票，其餘沿用快取結果（僅更新報價欄位）
+5. 統計 - 記錄每個時段沿用與重新計算的數量
+
+使用方式：
+    state = DayState()                # run_daemon 啟動時建立，設定到 bot.day_state
+    universe = state.get_universe(lambda: fetcher.get_all_stocks_by_volume())
+    analysis = state.get_analysis(stock, 'short_term')
+    if analysis is None:
+        analysis = analyze(stock)
+        state.put_analysis(stock, 'short_term', analysis)
+
+    # 盤中增量重掃
+    needs_analysis = state.plan_delta(stocks, 'short_term', close_tolerance=0.005, top_n=50)
+
+環境變數：
+    DAY_STATE_SNAPSHOT_TTL  全市場快照的重用時間（分鐘，預設 10；0 表示每個時段都重新抓取）
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_MINUTES = float(os.getenv('DAY_STATE_SNAPSHOT_TTL', '10'))
+
+# 判斷報價是否變動的欄位
+QUOTE_FIELDS = ('close', 'change_percent', 'volume', 'trade_value')
+
+# 增量重掃比對的欄位（在報價簽章中的位置）
+DELTA_FIELDS = ('close', 'volume', 'trade_value')
+_DELTA_INDEX = [QUOTE_FIELDS.index(field) for field in DELTA_FIELDS]
+
+# 沿用分析時依最新報價更新的欄位 {分析結果欄位: 報價欄位}
+_CARRY_FIELDS = {'current_price': 'close', 'change_percent': 'change_percent',
+                 'volume': 'volume', 'trade_value': 'trade_value'}
+
+
+def quote_signature(stock: Dict[str, Any]) -> Tuple:
+    """報價簽章（欄位完全相同時視為未變動）"""
+    return tuple(stock.get(field) for field in QUOTE_FIELDS)
+
+
+class DayState:
+    """
+    當日狀態
+
+    所有資料以交易日為範圍，日期改變時自動清空；可由多個排程執行緒共用。
+    """
+
+    def __init__(self, snapshot_ttl_minutes: float = SNAPSHOT_TTL_MINUTES,
+                 today: Callable[[], str] = None):
+        """
+        Args:
+            snapshot_ttl_minutes: 全市場快照在此時間內直接重用，不重新抓取
+            today: 返回目前日期字串的函數（預設為本機日期 YYYY-MM-DD）
+        """
+        self.snapshot_ttl = snapshot_ttl_minutes * 60
+        self._today = today or (lambda: datetime.now().strftime('%Y-%m-%d'))
+        self._lock = threading.RLock()
+
+        self.day = None
+        self.universe = []
+        self.universe_fetched_at = None  # time.monotonic()
+        self.stock_data = {}  # 個股數據快取（技術面 / 基本面 / 法人），鍵由分析器決定
+        self.analyses = {}  # {代碼: (報價簽章, 分析重點, 分析結果)}
+        self.top_codes = set()  # 上一個時段成交金額前N名
+        self.slot_stats = {}
+        self.ensure_day()
+
+    # ---------- 日期 ----------
+
+    def ensure_day(self) -> bool:
+        """
+        確認仍是同一個交易日，換日時清空所有資料
+
+        Returns:
+            bool: 是否剛換日（已清空）
+        """
+        today = self._today()
+        with self._lock:
+            if today == self.day:
+                return False
+            if self.day is not None:
+                logger.info(f"換日 {self.day} -> {today}，清空當日狀態")
+            self.day = today
+            self.universe = []
+            self.universe_fetched_at = None
+            self.stock_data.clear()
+            self.analyses.clear()
+            self.top_codes = set()
+            self.slot_stats = {}
+            return True
+
+    # ---------- 全市場快照 ----------
+
+    def get_universe(self, fetch: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        取得全市場快照
+
+        快照仍在重用時間內時直接返回；否則重新抓取，抓取失敗或為空時沿用當日快照。
+        """
+        self.ensure_day()
+        with self._lock:
+            if (self.universe and self.universe_fetched_at is not None
+                    and time.monotonic() - self.universe_fetched_at < self.snapshot_ttl):
+                logger.info(f"沿用 {time.monotonic() - self.universe_fetched_at:.0f} 秒前的全市場快照")
+                return self.universe
+
+        try:
+            universe = fetch()
+        except Exception as e:
+            logger.warning(f"全市場快照抓取失敗: {e}")
+            universe = []
+
+        with self._lock:
+            if universe:
+                self.universe = universe
+                self.universe_fetched_at = time.monotonic()
+            elif self.universe:
+                logger.warning(f"全市場快照抓取失敗，沿用當日快照（{len(self.universe)} 支）")
+            return self.universe
+
+    # ---------- 分析結果 ----------
+
+    def get_analysis(self, stock: Dict[str, Any], analysis_focus: str) -> Optional[Dict[str, Any]]:
+        """報價與分析重點都未變時返回上一次的分析結果，否則返回 None"""
+        with self._lock:
+            cached = self.analyses.get(stock.get('code'))
+        if cached is None:
+            return None
+        signature, focus, analysis = cached
+        if focus != analysis_focus or signature != quote_signature(stock):
+            return None
+        return analysis
+
+    def put_analysis(self, stock: Dict[str, Any], analysis_focus: str, analysis: Dict[str, Any]):
+        with self._lock:
+            self.analyses[stock.get('code')] = (quote_signature(stock), analysis_focus, analysis)
+
+    # ---------- 盤中增量重掃 ----------
+
+    def plan_delta(self, stocks: List[Dict[str, Any]], analysis_focus: str,
+                   close_tolerance: float = 0.005, volume_tolerance: float = 0.10,
+                   trade_value_tolerance: float = 0.10, top_n: int = 50) -> np.ndarray:
+        """
+        比對上一次分析時的報價，決定哪些股票需要重新分析
+
+        以分析當時的報價為基準，沿用期間的累積變動超過容許範圍（相對變動）即重新分析；
+        沒有快取、分析重點不同，或新進入成交金額前N名的股票也重新分析。
+
+        Returns:
+            np.ndarray: 與 stocks 對齊的布林陣列，True 表示需要重新分析
+        """
+        codes = [stock.get('code') for stock in stocks]
+        current = np.array([[stock.get(field) or 0 for field in DELTA_FIELDS] for stock in stocks],
+                           dtype=float).reshape(len(stocks), len(DELTA_FIELDS))
+        previous = np.full_like(current, np.nan)
+
+        with self._lock:
+            for i, code in enumerate(codes):
+                cached = self.analyses.get(code)
+                if cached is not None and cached[1] == analysis_focus:
+                    previous[i] = [cached[0][k] or 0 for k in _DELTA_INDEX]
+            top_codes = set(self.top_codes)
+
+        tolerance = np.array([close_tolerance, volume_tolerance, trade_value_tolerance])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.where(current == previous, 0.0,
+                                np.abs(current - previous) / np.abs(previous))
+        # NaN（沒有快取）與除以零都視為超過容許範圍
+        changed = ~(relative <= tolerance).all(axis=1)
+
+        if top_n and top_codes:
+            top = np.argsort(-current[:, DELTA_FIELDS.index('trade_value')], kind='stable')[:top_n]
+            entered = np.fromiter((codes[i] not in top_codes for i in top), dtype=bool, count=len(top))
+            changed[top[entered]] = True
+
+        return changed
+
+    def carry_forward(self, stock: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """沿用快取的分析結果，報價欄位更新為最新值（不修改快取）"""
+        with self._lock:
+            cached = self.analyses.get(stock.get('code'))
+        if cached is None:
+            return None
+        analysis = dict(cached[2])
+        for analysis_field, quote_field in _CARRY_FIELDS.items():
+            if analysis_field in analysis and quote_field in stock:
+                analysis[analysis_field] = stock[quote_field]
+        if isinstance(analysis.get('change_percent'), float):
+            analysis['change_percent'] = round(analysis['change_percent'], 1)
+        return analysis
+
+    def remember_top(self, stocks: List[Dict[str, Any]], top_n: int = 50):
+        """記錄本時段成交金額前N名，供下一個時段判斷新進榜股票"""
+        ranked = sorted(stocks, key=lambda stock: stock.get('trade_value') or 0, reverse=True)
+        with self._lock:
+            self.top_codes = {stock.get('code') for stock in ranked[:top_n]}
+
+    # ---------- 統計 ----------
+
+    def record_slot(self, time_slot: str, reused: int, analyzed: int):
+        """記錄時段的沿用 / 重新計算數量"""
+        with self._lock:
+            self.slot_stats[time_slot] = {
+                'reused': reused,
+                'analyzed': analyzed,
+                'finished_at': datetime.now().strftime('%H:%M:%S'),
+            }
+
+    def get_report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'day': self.day,
+                'universe_size': len(self.universe),
+                'cached_analyses': len(self.analyses),
+                'cached_stock_data': len(self.stock_data),
+                'slots': dict(self.slot_stats),
+            }
+
+    def format_report(self) -> str:
+        report = self.get_report()
+        slots = ', '.join(f"{slot} 沿用 {s['reused']} / 重算 {s['analyzed']}"
+                          for slot, s in report['slots'].items())
+        return (f"{report['day']} 快照 {report['universe_size']} 支，"
+                f"分析快取 {report['cached_analyses']} 支，個股數據 {report['cached_stock_data']} 筆"
+                + (f"；{slots}" if slots else ''))
@@ -0,0 +1,336 @@
+"""
+email_sender.py - 共用 SMTP 連線的郵件發送器
+同一次執行中重複使用已登入的 SMTP 連線，郵件只組裝一次即可寄給多位收件人
+
+功能：
+1. 連線共用 - STARTTLS 與登入只做一次，閒置過久時以 NOOP 檢查，斷線自動重連
+2. 單次組裝 - MIME 內容只產生一次，依伺服器每封收件人上限分批寄出
+3. 離線測試 - LocalSMTPServer 提供本機 SMTP 替身，可在無網路環境下壓測
+
+使用方式：
+    sender = PooledSMTPSender('smtp.gmail.com', 587, 'me@gmail.com', 'app-password')
+    sender.send('內容', '主旨', recipients=['a@example.com', 'b@example.com'])
+    sender.close()
+
+    # 離線壓測
+    python email_sender.py --messages 200 --recipients 120
+"""
+
+import re
+import ssl
+import time
+import smtplib
+import socket
+import socketserver
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formatdate, make_msgid
+from typing import Dict, List, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_recipients(value) -> List[str]:
+    """解析收件人：接受清單或以逗號 / 分號分隔的字串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[,;]', value)
+    return [addr.strip() for addr in value if addr and addr.strip()]
+
+
+class PooledSMTPSender:
+    """
+    共用連線的 SMTP 發送器
+
+    執行緒安全：同一時間只有一個執行緒使用連線。
+    """
+
+    def __init__(self, host: str, port: int = 587, username: str = None, password: str = None,
+                 use_tls: bool = True, sender: str = None, max_recipients: int = 50,
+                 idle_check_seconds: float = 60, timeout: float = 30):
+        """
+        Args:
+            host / port: SMTP 伺服器
+            username / password: 登入帳密（未提供密碼時不登入）
+            use_tls: 是否執行 STARTTLS
+            sender: 寄件人（預設為 username）
+            max_recipients: 每封郵件的收件人上限，超過時分批寄出
+            idle_check_seconds: 連線閒置超過此秒數時，先以 NOOP 確認仍可用
+            timeout: 連線逾時（秒）
+        """
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender or username
+        self.max_recipients = max(int(max_recipients), 1)
+        self.idle_check_seconds = idle_check_seconds
+        self.timeout = timeout
+
+        self._server = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'connections': 0, 'messages': 0, 'batches': 0, 'recipients': 0}
+
+    # ---------- 連線 ----------
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if self.use_tls:
+            server.starttls(context=ssl.create_default_context())
+            server.ehlo()
+        if self.password:
+            server.login(self.username, self.password)
+        self.stats['connections'] += 1
+        logger.debug(f"SMTP 連線已建立: {self.host}:{self.port}")
+        return server
+
+    def _get_server(self) -> smtplib.SMTP:
+        """取得可用連線（閒置過久時先檢查）"""
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_check_seconds:
+            try:
+                if self._server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected('NOOP 失敗')
+            except (smtplib.SMTPException, OSError):
+                self._discard()
+
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def _discard(self):
+        """丟棄目前連線（不拋出例外）"""
+        if self._server is not None:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+            self._server = None
+
+    def close(self):
+        """結束連線"""
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except Exception:
+                    pass
+                self._server = None
+
+    # ---------- 郵件 ----------
+
+    def build_message(self, message: str, subject: str, html_body: str = None,
+                      urgent: bool = False, to_header: str = None) -> bytes:
+        """組裝 MIME 郵件（所有收件人共用同一份內容）"""
+        if html_body:
+            msg = MIMEMultipart('alternative')
+            msg.attach(MIMEText(message, 'plain', 'utf-8'))
+            msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+        else:
+            msg = MIMEMultipart()
+            msg.attach(MIMEText(message, 'plain', 'utf-8'))
+
+        msg['Subject'] = f"{'[緊急] ' if urgent else ''}{subject}"
+        msg['From'] = self.sender
+        msg['To'] = to_header or self.sender
+        msg['Date'] = formatdate(localtime=True)
+        msg['Message-ID'] = make_msgid()
+        return msg.as_bytes()
+
+    def send(self, message: str, subject: str, recipients, html_body: str = None,
+             urgent: bool = False) -> Dict[str, Any]:
+        """
+        寄出郵件
+
+        收件人不超過上限時 To 標頭列出所有收件人；
+        超過時 To 只列寄件人，收件人放在信封中（等同密件副本）。
+        分批寄送時只要有一批送出即視為成功，失敗批次的收件人列入 refused，
+        避免呼叫端重試整封郵件讓已送達的批次收到重複郵件。
+
+        Returns:
+            {'recipients': int, 'batches': int, 'refused': {地址: 錯誤}}
+
+        Raises:
+            smtplib.SMTPException / OSError: 所有批次都寄送失敗（已斷開的連線會被丟棄）
+        """
+        recipients = parse_recipients(recipients)
+        if not recipients:
+            raise ValueError("沒有收件人")
+
+        to_header = ', '.join(recipients) if len(recipients) <= self.max_recipients else None
+        data = self.build_message(message, subject, html_body, urgent, to_header)
+        batches = [recipients[i:i + self.max_recipients]
+                   for i in range(0, len(recipients), self.max_recipients)]
+
+        refused = {}
+        last_error = None
+        with self._lock:
+            for batch in batches:
+                try:
+                    refused.update(self._send_batch(data, batch))
+                except (smtplib.SMTPException, OSError) as e:
+                    last_error = e
+                    refused.update({address: str(e) for address in batch})
+            self._last_used = time.monotonic()
+
+        if last_error is not None and len(refused) == len(recipients):
+            raise last_error
+
+        self.stats['messages'] += 1
+        self.stats['batches'] += len(batches)
+        self.stats['recipients'] += len(recipients) - len(refused)
+        return {'recipients': len(recipients) - len(refused), 'batches': len(batches),
+                'refused': refused}
+
+    def _send_batch(self, data: bytes, batch: List[str]) -> Dict[str, Any]:
+        """寄出一批；連線中斷時重連一次"""
+        for attempt in range(2):
+            server = self._get_server()
+            try:
+                return server.sendmail(self.sender, batch, data)
+            except smtplib.SMTPServerDisconnected:
+                self._discard()
+                if attempt:
+                    raise
+            except (smtplib.SMTPException, OSError):
+                self._discard()
+                raise
+        return {}
+
+
+# ==================== 本機 SMTP 替身 ====================
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """最小的 SMTP 協定處理（EHLO / MAIL / RCPT / DATA / NOOP / RSET / QUIT）"""
+
+    def _reply(self, line: str):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self._reply('220 localhost SMTP stand-in')
+        rcpts = []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self._reply('250-localhost')
+                self._reply('250 SIZE 104857600')
+            elif verb == 'MAIL':
+                rcpts = []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip(' <>')
+                if address in self.server.reject:
+                    self._reply('550 No such user')
+                    continue
+                rcpts.append(address)
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(line)
+                self.server.record(rcpts, size)
+                self._reply('250 OK')
+            elif verb in ('NOOP', 'RSET'):
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    本機 SMTP 替身（不需 TLS、不驗證帳密），記錄收到的郵件供測試比對
+
+    reject 中的地址在 RCPT 階段回 550；disconnect_clients() 由伺服器端切斷現有連線，
+    用來模擬寄送失敗與連線中斷。
+
+    使用方式：
+        with LocalSMTPServer() as server:
+            sender = PooledSMTPSender('127.0.0.1', server.port, use_tls=False, sender='bot@local')
+            ...
+            print(server.received)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, reject: List[str] = None):
+        super().__init__((host, port), _SMTPHandler)
+        self.port = self.server_address[1]
+        self.reject = set(reject or [])
+        self.received = []
+        self.connections = 0
+        self._sockets = []
+        self._record_lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def record(self, rcpts: List[str], size: int):
+        with self._record_lock:
+            self.received.append({'rcpts': list(rcpts), 'size': size})
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        with self._record_lock:
+            self._sockets.append(request)
+        super().process_request(request, client_address)
+
+    def disconnect_clients(self):
+        """切斷所有現有的用戶端連線"""
+        with self._record_lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SMTP 發送器離線壓測')
+    parser.add_argument('--messages', type=int, default=100, help='郵件數')
+    parser.add_argument('--recipients', type=int, default=10, help='每封收件人數')
+    parser.add_argument('--max-recipients', type=int, default=50, help='每批收件人上限')
+    args = parser.parse_args()
+
+    html = '<html><body>' + '<p>測試內容</p>' * 500 + '</body></html>'
+    recipients = [f'user{i}@example.com' for i in range(args.recipients)]
+
+    with LocalSMTPServer() as server:
+        sender = PooledSMTPSender('127.0.0.1', server.port, use_tls=False,
+                                  sender='bot@localhost', max_recipients=args.max_recipients)
+        start = time.perf_counter()
+        for i in range(args.messages):
+            sender.send(f'測試訊息 {i}', f'壓測 {i}', recipients, html_body=html)
+        sender.close()
+        elapsed = time.perf_counter() - start
+
+    print(f"郵件: {args.messages} 封 × {args.recipients} 位收件人")
+    print(f"SMTP 連線: {sender.stats['connections']}，批次: {sender.stats['batches']}，"
+          f"替身收到: {len(server.received)} 批")
+    print(f"耗時: {elapsed:.3f} 秒（{args.messages / elapsed:.1f} 封/秒）")
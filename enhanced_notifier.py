@@ -6,28 +6,27 @@ enhanced_notifier.py - 增強版推播系統
 1. 增強版訊息格式
 2. ML 評分和信心度顯示
 3. 互動式按鈕（Telegram）
-4. 圖表生成
+4. 圖表生成（批次平行渲染）
 5. 定期報告推播
+6. 共用連線池並行推播（channel_delivery）
 """
 
 import os
 import json
-import requests
 import logging
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 from io import BytesIO
 
+from channel_delivery import LineNotifyChannel, TelegramChannel, send_concurrently
+
 logger = logging.getLogger(__name__)
 
-# 嘗試導入圖表庫
-try:
-    import matplotlib
-    matplotlib.use('Agg')  # 使用非互動式後端
-    import matplotlib.pyplot as plt
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
+# 圖表在 chart_service 的子程序中以 Agg 後端渲染，本模組不直接載入 matplotlib
+from chart_service import (
+    MATPLOTLIB_AVAILABLE, get_chart_service, prediction_chart_spec, performance_chart_spec,
+)
+if not MATPLOTLIB_AVAILABLE:
     logger.info("matplotlib 未安裝，圖表功能停用")
 
 
@@ -240,54 +239,30 @@ class EnhancedMessageFormatter:
 class EnhancedLineNotifier:
     """
     增強版 LINE 通知器
+    LINE_NOTIFY_TOKEN 可用逗號分隔多個權杖，並行送往所有對象
     """
 
     def __init__(self, token: str = None):
         self.token = token or os.environ.get('LINE_NOTIFY_TOKEN', '')
-        self.api_url = "https://notify-api.line.me/api/notify"
+        self.channel = LineNotifyChannel(self.token)
         self.formatter = EnhancedMessageFormatter()
 
     def send_message(self, message: str) -> bool:
         """發送文字訊息"""
-        if not self.token:
+        if not self.channel.tokens:
             logger.warning("LINE Token 未設定")
             return False
 
-        headers = {
-            'Authorization': f'Bearer {self.token}'
-        }
-        data = {'message': f"\n{message}"}
-
-        try:
-            response = requests.post(self.api_url, headers=headers, data=data, timeout=10)
-            if response.status_code == 200:
-                logger.info("LINE 訊息發送成功")
-                return True
-            else:
-                logger.error(f"LINE 訊息發送失敗: {response.status_code}")
-                return False
-        except Exception as e:
-            logger.error(f"LINE 訊息發送錯誤: {e}")
-            return False
+        if self.channel.send(f"\n{message}"):
+            logger.info("LINE 訊息發送成功")
+            return True
+        return False
 
     def send_image(self, image_file: str) -> bool:
         """發送圖片"""
-        if not self.token:
-            return False
-
-        headers = {
-            'Authorization': f'Bearer {self.token}'
-        }
-
-        try:
-            with open(image_file, 'rb') as f:
-                files = {'imageFile': f}
-                data = {'message': ' '}
-                response = requests.post(self.api_url, headers=headers, data=data, files=files, timeout=30)
-                return response.status_code == 200
-        except Exception as e:
-            logger.error(f"LINE 圖片發送錯誤: {e}")
+        if not self.channel.tokens:
             return False
+        return self.channel.send(' ', image_file=image_file)
 
     def send_daily_report(self, recommendations: Dict[str, List],
                          market_sentiment: Dict = None) -> bool:
@@ -315,57 +290,26 @@ class EnhancedTelegramNotifier:
     def __init__(self, bot_token: str = None, chat_id: str = None):
         self.bot_token = bot_token or os.environ.get('TELEGRAM_BOT_TOKEN', '')
         self.chat_id = chat_id or os.environ.get('TELEGRAM_CHAT_ID', '')
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.channel = TelegramChannel(self.bot_token, self.chat_id)
         self.formatter = EnhancedMessageFormatter()
 
     def send_message(self, message: str, parse_mode: str = 'Markdown',
                     reply_markup: Dict = None) -> bool:
-        """發送訊息"""
-        if not self.bot_token or not self.chat_id:
+        """發送訊息（TELEGRAM_CHAT_ID 可用逗號分隔多個聊天室）"""
+        if not self.bot_token or not self.channel.chat_ids:
             logger.warning("Telegram 設定不完整")
             return False
 
-        url = f"{self.base_url}/sendMessage"
-        data = {
-            'chat_id': self.chat_id,
-            'text': message,
-            'parse_mode': parse_mode
-        }
-
-        if reply_markup:
-            data['reply_markup'] = json.dumps(reply_markup)
-
-        try:
-            response = requests.post(url, data=data, timeout=10)
-            if response.status_code == 200:
-                logger.info("Telegram 訊息發送成功")
-                return True
-            else:
-                logger.error(f"Telegram 訊息發送失敗: {response.status_code} - {response.text}")
-                return False
-        except Exception as e:
-            logger.error(f"Telegram 訊息發送錯誤: {e}")
-            return False
+        if self.channel.send_message(message, parse_mode, reply_markup):
+            logger.info("Telegram 訊息發送成功")
+            return True
+        return False
 
     def send_photo(self, photo_path: str, caption: str = "") -> bool:
         """發送圖片"""
-        if not self.bot_token or not self.chat_id:
-            return False
-
-        url = f"{self.base_url}/sendPhoto"
-
-        try:
-            with open(photo_path, 'rb') as f:
-                files = {'photo': f}
-                data = {
-                    'chat_id': self.chat_id,
-                    'caption': caption
-                }
-                response = requests.post(url, data=data, files=files, timeout=30)
-                return response.status_code == 200
-        except Exception as e:
-            logger.error(f"Telegram 圖片發送錯誤: {e}")
+        if not self.bot_token or not self.channel.chat_ids:
             return False
+        return self.channel.send_photo(photo_path, caption)
 
     def send_with_buttons(self, message: str, buttons: List[List[Dict]]) -> bool:
         """
@@ -419,12 +363,22 @@ class EnhancedTelegramNotifier:
 class ChartGenerator:
     """
     圖表生成器
-    生成預測和績效圖表
+    生成預測和績效圖表（由 chart_service 在子程序池批次渲染並快取）
     """
 
     def __init__(self, output_dir: str = './data/charts'):
         self.output_dir = output_dir
-        os.makedirs(output_dir, exist_ok=True)
+        self.service = get_chart_service(output_dir)
+
+    @staticmethod
+    def warm_up() -> bool:
+        """
+        預先建立圖表樣板並啟動渲染子程序池
+
+        Returns:
+            bool: matplotlib 未安裝時返回 False
+        """
+        return get_chart_service().warm_up()
 
     def generate_prediction_chart(self, stock_code: str,
                                   historical_data: 'pd.DataFrame',
@@ -432,64 +386,28 @@ class ChartGenerator:
         """
         生成預測圖表
         """
-        if not MATPLOTLIB_AVAILABLE:
-            return None
-
-        try:
-            plt.style.use('dark_background')
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), height_ratios=[3, 1])
-
-            # 價格圖
-            close = historical_data['close'].values[-30:]
-            dates = range(len(close))
-
-            ax1.plot(dates, close, 'w-', linewidth=1.5, label='收盤價')
-
-            # 均線
-            if len(close) >= 5:
-                ma5 = historical_data['close'].rolling(5).mean().values[-30:]
-                ax1.plot(dates, ma5, 'y--', linewidth=1, alpha=0.7, label='MA5')
-
-            if len(close) >= 20:
-                ma20 = historical_data['close'].rolling(20).mean().values[-30:]
-                ax1.plot(dates, ma20, 'c--', linewidth=1, alpha=0.7, label='MA20')
+        return self.generate_prediction_charts([(stock_code, historical_data, prediction)]).get(stock_code)
 
-            # 預測方向
-            pred_direction = prediction.get('direction', 'neutral')
-            target_price = prediction.get('target_price', {}).get('target_mid', close[-1])
-
-            if pred_direction in ['bullish', 'strong_buy', 'buy']:
-                ax1.axhline(y=target_price, color='g', linestyle=':', alpha=0.7, label=f'目標價 {target_price:.0f}')
-                ax1.fill_between(dates[-5:], close[-5:], target_price, alpha=0.2, color='g')
-            elif pred_direction in ['bearish', 'strong_sell', 'sell']:
-                ax1.axhline(y=target_price, color='r', linestyle=':', alpha=0.7, label=f'目標價 {target_price:.0f}')
-                ax1.fill_between(dates[-5:], close[-5:], target_price, alpha=0.2, color='r')
-
-            ax1.set_title(f'{stock_code} 價格走勢與預測', fontsize=12, color='white')
-            ax1.legend(loc='upper left', fontsize=8)
-            ax1.grid(True, alpha=0.3)
-
-            # 成交量圖
-            if 'volume' in historical_data.columns:
-                volume = historical_data['volume'].values[-30:]
-                colors = ['g' if close[i] >= close[i-1] else 'r' for i in range(1, len(close))]
-                colors.insert(0, 'g')
-                ax2.bar(dates, volume, color=colors, alpha=0.7)
-                ax2.set_title('成交量', fontsize=10, color='white')
-                ax2.grid(True, alpha=0.3)
-
-            plt.tight_layout()
+    def generate_prediction_charts(self, items: List[tuple]) -> Dict[str, Optional[str]]:
+        """
+        批次生成預測圖表（一次平行渲染，資料未變的圖表直接沿用快取）
 
-            # 保存
-            filepath = os.path.join(self.output_dir, f'{stock_code}_prediction.png')
-            plt.savefig(filepath, dpi=100, bbox_inches='tight', facecolor='#1e1e1e')
-            plt.close()
+        Args:
+            items: [(股票代碼, 歷史資料, 預測結果), ...]
 
-            return filepath
+        Returns:
+            {股票代碼: 圖表路徑或 None}
+        """
+        if not MATPLOTLIB_AVAILABLE:
+            return {}
 
-        except Exception as e:
-            logger.error(f"圖表生成失敗: {e}")
-            return None
+        specs = []
+        for stock_code, historical_data, prediction in items:
+            try:
+                specs.append(prediction_chart_spec(stock_code, historical_data, prediction or {}))
+            except Exception as e:
+                logger.error(f"圖表資料整理失敗 {stock_code}: {e}")
+        return self.service.render_batch(specs)
 
     def generate_performance_chart(self, results: List[Dict]) -> Optional[str]:
         """
@@ -499,43 +417,7 @@ class ChartGenerator:
             return None
 
         try:
-            import pandas as pd
-
-            df = pd.DataFrame(results)
-            df['verify_date'] = pd.to_datetime(df['verify_date'])
-            df = df.sort_values('verify_date')
-
-            plt.style.use('dark_background')
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-
-            # 累計報酬
-            cumulative_return = df['actual_return'].cumsum()
-            ax1.plot(df['verify_date'], cumulative_return, 'g-', linewidth=2)
-            ax1.fill_between(df['verify_date'], 0, cumulative_return,
-                           where=(cumulative_return >= 0), alpha=0.3, color='g')
-            ax1.fill_between(df['verify_date'], 0, cumulative_return,
-                           where=(cumulative_return < 0), alpha=0.3, color='r')
-            ax1.axhline(y=0, color='white', linestyle='--', alpha=0.5)
-            ax1.set_title('累計報酬率 (%)', fontsize=12, color='white')
-            ax1.grid(True, alpha=0.3)
-
-            # 準確率滾動
-            rolling_accuracy = df['is_correct'].rolling(10).mean()
-            ax2.plot(df['verify_date'], rolling_accuracy, 'y-', linewidth=2)
-            ax2.axhline(y=0.5, color='r', linestyle='--', alpha=0.5, label='50%基準')
-            ax2.set_title('10日滾動準確率', fontsize=12, color='white')
-            ax2.set_ylim(0, 1)
-            ax2.grid(True, alpha=0.3)
-            ax2.legend()
-
-            plt.tight_layout()
-
-            filepath = os.path.join(self.output_dir, 'performance.png')
-            plt.savefig(filepath, dpi=100, bbox_inches='tight', facecolor='#1e1e1e')
-            plt.close()
-
-            return filepath
-
+            return self.service.render(performance_chart_spec(results))
         except Exception as e:
             logger.error(f"績效圖表生成失敗: {e}")
             return None
@@ -561,56 +443,84 @@ class UnifiedNotifier:
         # 啟用的渠道
         self.enabled_channels = config.get('enabled_channels', ['line', 'telegram'])
 
+    def _send_enabled(self, tasks: Dict[str, Any]) -> Dict[str, bool]:
+        """並行執行已啟用渠道的發送函數"""
+        return send_concurrently({name: task for name, task in tasks.items()
+                                  if name in self.enabled_channels})
+
     def send_all(self, message: str) -> Dict[str, bool]:
         """發送到所有渠道"""
-        results = {}
-
-        if 'line' in self.enabled_channels:
-            results['line'] = self.line.send_message(message)
-
-        if 'telegram' in self.enabled_channels:
-            results['telegram'] = self.telegram.send_message(message)
-
-        return results
+        return self._send_enabled({
+            'line': lambda: self.line.send_message(message),
+            'telegram': lambda: self.telegram.send_message(message),
+        })
 
     def send_daily_report(self, recommendations: Dict[str, List],
                          market_sentiment: Dict = None) -> Dict[str, bool]:
         """發送每日報告到所有渠道"""
-        results = {}
-
-        if 'line' in self.enabled_channels:
-            results['line'] = self.line.send_daily_report(recommendations, market_sentiment)
-
-        if 'telegram' in self.enabled_channels:
-            results['telegram'] = self.telegram.send_daily_report(recommendations, market_sentiment)
-
-        return results
+        return self._send_enabled({
+            'line': lambda: self.line.send_daily_report(recommendations, market_sentiment),
+            'telegram': lambda: self.telegram.send_daily_report(recommendations, market_sentiment),
+        })
 
     def send_alert(self, analysis: Dict, with_chart: bool = True,
                   historical_data: 'pd.DataFrame' = None) -> Dict[str, bool]:
         """發送個股提醒"""
-        results = {}
-
-        # 生成圖表
         chart_path = None
         if with_chart and historical_data is not None:
             stock_code = analysis.get('stock_info', {}).get('code', '')
-            prediction = analysis.get('ml_enhanced', {}).get('prediction', {})
-            chart_path = self.chart_generator.generate_prediction_chart(
-                stock_code, historical_data, prediction
-            )
+            chart_path = self._render_alert_charts([analysis], {stock_code: historical_data}).get(stock_code)
+
+        return self._send_alert_with_chart(analysis, chart_path)
+
+    def send_alerts(self, analyses: List[Dict], with_chart: bool = True,
+                    historical_data: Dict[str, 'pd.DataFrame'] = None) -> Dict[str, Dict[str, bool]]:
+        """
+        批次發送個股提醒（所有圖表先以一個批次平行渲染）
+
+        Args:
+            analyses: 個股分析結果列表
+            historical_data: {股票代碼: 歷史資料}
 
-        if 'line' in self.enabled_channels:
-            results['line'] = self.line.send_stock_alert(analysis)
+        Returns:
+            {股票代碼: {渠道: 是否成功}}
+        """
+        chart_paths = {}
+        if with_chart and historical_data:
+            chart_paths = self._render_alert_charts(analyses, historical_data)
+
+        results = {}
+        for analysis in analyses:
+            stock_code = analysis.get('stock_info', {}).get('code', '')
+            results[stock_code] = self._send_alert_with_chart(analysis, chart_paths.get(stock_code))
+        return results
+
+    def _render_alert_charts(self, analyses: List[Dict],
+                             historical_data: Dict[str, 'pd.DataFrame']) -> Dict[str, Optional[str]]:
+        """渲染提醒用的預測圖表"""
+        items = []
+        for analysis in analyses:
+            stock_code = analysis.get('stock_info', {}).get('code', '')
+            if historical_data.get(stock_code) is not None:
+                prediction = analysis.get('ml_enhanced', {}).get('prediction', {})
+                items.append((stock_code, historical_data[stock_code], prediction))
+        return self.chart_generator.generate_prediction_charts(items) if items else {}
+
+    def _send_alert_with_chart(self, analysis: Dict, chart_path: Optional[str]) -> Dict[str, bool]:
+        # 各渠道內先文字後圖片，渠道之間並行
+        def send_line() -> bool:
+            ok = self.line.send_stock_alert(analysis)
             if chart_path:
                 self.line.send_image(chart_path)
+            return ok
 
-        if 'telegram' in self.enabled_channels:
-            results['telegram'] = self.telegram.send_stock_recommendation(analysis)
+        def send_telegram() -> bool:
+            ok = self.telegram.send_stock_recommendation(analysis)
             if chart_path:
                 self.telegram.send_photo(chart_path)
+            return ok
 
-        return results
+        return self._send_enabled({'line': send_line, 'telegram': send_telegram})
 
 
 # ==================== 測試 ====================
@@ -6,8 +6,6 @@ import os
 import time
 import json
 import logging
-import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
@@ -17,20 +15,30 @@ from config import (
     NOTIFICATION_SCHEDULE, 
     LOG_CONFIG, 
     DATA_DIR,
-    LOG_DIR
+    LOG_DIR,
+    ensure_directories
 )
 import notifier
-from twse_data_fetcher import TWStockDataFetcher
 
-# 設置日誌
-logging.basicConfig(
-    filename=LOG_CONFIG['filename'],
-    level=getattr(logging, LOG_CONFIG['level']),
-    format=LOG_CONFIG['format']
-)
+_logging_ready = False
+
+def setup_logging():
+    """建立目錄並設置日誌（第一次記錄事件時才執行，導入模組不產生副作用）"""
+    global _logging_ready
+    if _logging_ready:
+        return
+    _logging_ready = True
+
+    ensure_directories()
+    logging.basicConfig(
+        filename=LOG_CONFIG['filename'],
+        level=getattr(logging, LOG_CONFIG['level']),
+        format=LOG_CONFIG['format']
+    )
 
 def log_event(message, level='info'):
     """記錄事件並打印到控制台"""
+    setup_logging()
     timestamp = datetime.now().strftime('%H:%M:%S')
     if level == 'error':
         logging.error(message)
@@ -47,6 +55,8 @@ class OptimizedStockBot:
     
     def __init__(self):
         """初始化機器人"""
+        from twse_data_fetcher import TWStockDataFetcher
+
         self.data_fetcher = TWStockDataFetcher()
         self.cache_dir = os.path.join(DATA_DIR, 'cache')
         os.makedirs(self.cache_dir, exist_ok=True)
@@ -1116,32 +1126,37 @@ class OptimizedStockBot:
     def save_analysis_results(self, analyses: List[Dict[str, Any]], recommendations: Dict[str, List], time_slot: str) -> None:
         """保存分析結果"""
         try:
-            # 創建日期目錄
-            date_str = datetime.now().strftime('%Y%m%d')
-            results_dir = os.path.join(DATA_DIR, 'analysis_results_optimized', date_str)
-            os.makedirs(results_dir, exist_ok=True)
+            from results_store import AnalysisResultsStore
             
-            # 保存分析結果
-            analyses_path = os.path.join(results_dir, f"{time_slot}_analyses_optimized.json")
-            with open(analyses_path, 'w', encoding='utf-8') as f:
-                json.dump(analyses, f, ensure_ascii=False, indent=2)
-            
-            # 保存推薦結果
-            recommendations_path = os.path.join(results_dir, f"{time_slot}_recommendations_optimized.json")
-            with open(recommendations_path, 'w', encoding='utf-8') as f:
-                json.dump(recommendations, f, ensure_ascii=False, indent=2)
+            # 分析結果存成欄式表格，推薦結果只保存代碼引用
+            store = AnalysisResultsStore(os.path.join(DATA_DIR, 'analysis_results_optimized'))
+            results_dir = store.write_slot(analyses, recommendations, time_slot, 'optimized')
             
             log_event(f"💾 優化分析結果已保存到 {results_dir}")
             
         except Exception as e:
             log_event(f"⚠️ 保存分析結果時發生錯誤: {e}", level='warning')
 
-# 全域機器人實例
-optimized_bot = OptimizedStockBot()
+# 全域機器人實例（第一次使用時才建立，導入模組不會建立數據獲取器）
+_optimized_bot = None
+
+def get_optimized_bot() -> OptimizedStockBot:
+    """獲取全域機器人實例"""
+    global _optimized_bot
+    if _optimized_bot is None:
+        setup_logging()
+        _optimized_bot = OptimizedStockBot()
+    return _optimized_bot
+
+def __getattr__(name):
+    # 向下相容：enhanced_stock_bot.optimized_bot 仍可使用
+    if name == 'optimized_bot':
+        return get_optimized_bot()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def run_optimized_analysis(time_slot: str) -> None:
     """執行優化分析的包裝函數"""
-    optimized_bot.run_analysis(time_slot)
+    get_optimized_bot().run_analysis(time_slot)
 
 if __name__ == "__main__":
     import sys
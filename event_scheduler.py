@@ -0,0 +1,242 @@
+"""
+event_scheduler.py - 精準排程器
+以單一派送執行緒等待下一個排程時間（Condition.wait 使用單調時鐘），到點即觸發，
+工作在各自的工作執行緒執行，長時間的分析不會拖延其他排程
+
+功能：
+1. 準時觸發 - 計算到下一個排程時間的秒數直接等待，不以固定間隔輪詢
+2. 重疊保護 - 同一個工作上一次尚未結束時，本次觸發會略過並記錄
+3. 錯過處理 - 系統休眠等原因延誤超過寬限時間的觸發會略過，改排下一次
+4. 指標 - 每個工作記錄排隊延遲（實際開始 - 排定時間）、執行時間、次數與錯誤
+
+使用方式：
+    scheduler = EventScheduler()
+    scheduler.add('morning_scan', '09:30', bot.run_analysis, 'morning_scan', days=WEEKDAYS)
+    scheduler.add('heartbeat', '08:30', notifier.send_heartbeat)
+    scheduler.start()
+    print(scheduler.format_report())
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Any, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = (0, 1, 2, 3, 4)      # 週一至週五（datetime.weekday()）
+EVERY_DAY = (0, 1, 2, 3, 4, 5, 6)
+DAY_NAMES = {'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3,
+             'friday': 4, 'saturday': 5, 'sunday': 6}
+
+# 派送執行緒單次等待上限（秒），用來修正系統時間調整造成的偏差
+MAX_WAIT_SECONDS = 60
+
+
+def parse_time_of_day(value: str):
+    """解析 'HH:MM' 或 'HH:MM:SS'，返回 (時, 分, 秒)"""
+    parts = [int(part) for part in value.split(':')]
+    if len(parts) == 2:
+        parts.append(0)
+    hour, minute, second = parts
+    if not (0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60):
+        raise ValueError(f"無效的時間: {value}")
+    return hour, minute, second
+
+
+class ScheduledJob:
+    """排程工作（每天或指定星期幾的固定時間）"""
+
+    def __init__(self, name: str, at: str, func: Callable, args: Sequence = (),
+                 days: Sequence[int] = EVERY_DAY):
+        self.name = name
+        self.at = at
+        self.func = func
+        self.args = tuple(args)
+        self.days = tuple(sorted(set(days)))
+        self.hour, self.minute, self.second = parse_time_of_day(at)
+
+        self.next_run = None
+        self.running = False
+        self.metrics = {
+            'runs': 0,
+            'failures': 0,
+            'skipped_overlap': 0,
+            'missed': 0,
+            'last_scheduled': None,
+            'last_queue_delay': None,   # 秒
+            'max_queue_delay': 0.0,
+            'last_run_time': None,      # 秒
+            'max_run_time': 0.0,
+            'last_error': None,
+        }
+
+    def compute_next_run(self, after: datetime) -> datetime:
+        """after 之後（不含）的下一個排程時間"""
+        candidate = after.replace(hour=self.hour, minute=self.minute, second=self.second,
+                                  microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        while candidate.weekday() not in self.days:
+            candidate += timedelta(days=1)
+        return candidate
+
+
+class EventScheduler:
+    """
+    精準排程器
+
+    派送執行緒只負責計時與觸發；工作交給執行緒池執行，同一工作不會重疊。
+    """
+
+    def __init__(self, max_workers: int = None, misfire_grace_seconds: float = 300,
+                 clock: Callable[[], datetime] = None):
+        """
+        Args:
+            max_workers: 工作執行緒數（預設為工作數量，最少 1）
+            misfire_grace_seconds: 延誤超過此秒數的觸發視為錯過，不補執行
+            clock: 返回目前時間的函數（預設 datetime.now）
+        """
+        self.max_workers = max_workers
+        self.misfire_grace = misfire_grace_seconds
+        self._now = clock or datetime.now
+        self.jobs = {}
+
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    # ---------- 工作 ----------
+
+    def add(self, name: str, at: str, func: Callable, *args,
+            days: Sequence[int] = EVERY_DAY) -> ScheduledJob:
+        """新增排程工作；名稱重複時覆蓋原工作"""
+        job = ScheduledJob(name, at, func, args, days)
+        with self._cond:
+            job.next_run = job.compute_next_run(self._now())
+            self.jobs[name] = job
+            self._cond.notify()
+        logger.info(f"排程 {name}: {at}，下次執行 {job.next_run:%Y-%m-%d %H:%M:%S}")
+        return job
+
+    def next_runs(self) -> List[Dict[str, Any]]:
+        """依時間排序的下次執行時間"""
+        with self._cond:
+            jobs = sorted(self.jobs.values(), key=lambda job: job.next_run)
+            return [{'name': job.name, 'next_run': job.next_run, 'running': job.running}
+                    for job in jobs]
+
+    # ---------- 生命週期 ----------
+
+    def start(self) -> threading.Thread:
+        """啟動派送執行緒（重複呼叫不會重複啟動）"""
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers or max(len(self.jobs), 1),
+                thread_name_prefix='scheduled-job')
+            self._thread = threading.Thread(target=self._run, name='event-scheduler', daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def stop(self, wait: bool = False):
+        """停止觸發新工作；wait=True 時等待執行中的工作結束"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def join(self, poll_seconds: float = 1.0):
+        """阻塞直到排程器停止（主執行緒可用 Ctrl+C 中斷）"""
+        while not self._stop.wait(poll_seconds):
+            pass
+
+    # ---------- 派送 ----------
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._cond:
+                if not self.jobs:
+                    self._cond.wait(MAX_WAIT_SECONDS)
+                    continue
+                job = min(self.jobs.values(), key=lambda j: j.next_run)
+                scheduled = job.next_run
+                delay = (scheduled - self._now()).total_seconds()
+                if delay > 0:
+                    # 新增工作或停止時會被喚醒；醒來後重新計算
+                    self._cond.wait(min(delay, MAX_WAIT_SECONDS))
+                    continue
+                job.next_run = job.compute_next_run(max(scheduled, self._now()))
+
+            self._fire(job, scheduled, -delay)
+
+    def _fire(self, job: ScheduledJob, scheduled: datetime, lateness: float):
+        """觸發工作（派送執行緒呼叫）"""
+        if lateness > self.misfire_grace:
+            job.metrics['missed'] += 1
+            logger.warning(f"排程 {job.name} 延誤 {lateness:.0f} 秒，超過寬限時間，略過本次"
+                           f"（下次 {job.next_run:%Y-%m-%d %H:%M:%S}）")
+            return
+
+        with self._cond:
+            if job.running:
+                job.metrics['skipped_overlap'] += 1
+                logger.warning(f"排程 {job.name} 上一次仍在執行，略過 {scheduled:%H:%M:%S} 的觸發")
+                return
+            job.running = True
+
+        try:
+            self._executor.submit(self._execute, job, scheduled)
+        except RuntimeError:
+            # 執行緒池已關閉（排程器停止中）
+            job.running = False
+
+    def _execute(self, job: ScheduledJob, scheduled: datetime):
+        """在工作執行緒執行，並記錄排隊延遲與執行時間"""
+        metrics = job.metrics
+        queue_delay = (self._now() - scheduled).total_seconds()
+        metrics['last_scheduled'] = scheduled.isoformat(timespec='seconds')
+        metrics['last_queue_delay'] = round(queue_delay, 3)
+        metrics['max_queue_delay'] = round(max(metrics['max_queue_delay'], queue_delay), 3)
+        logger.info(f"排程 {job.name} 開始執行（排隊延遲 {queue_delay:.3f} 秒）")
+
+        start = time.perf_counter()
+        try:
+            job.func(*job.args)
+            metrics['last_error'] = None
+        except Exception as e:
+            metrics['failures'] += 1
+            metrics['last_error'] = str(e)
+            logger.error(f"排程 {job.name} 執行失敗: {e}")
+        finally:
+            run_time = time.perf_counter() - start
+            metrics['runs'] += 1
+            metrics['last_run_time'] = round(run_time, 3)
+            metrics['max_run_time'] = round(max(metrics['max_run_time'], run_time), 3)
+            with self._cond:
+                job.running = False
+            logger.info(f"排程 {job.name} 執行結束，耗時 {run_time:.1f} 秒")
+
+    # ---------- 指標 ----------
+
+    def get_report(self) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            return {name: dict(job.metrics, at=job.at, running=job.running,
+                               next_run=job.next_run.isoformat(timespec='seconds'))
+                    for name, job in self.jobs.items()}
+
+    def format_report(self) -> str:
+        lines = []
+        for name, m in self.get_report().items():
+            delay = '-' if m['last_queue_delay'] is None else f"{m['last_queue_delay']:.3f}s"
+            run_time = '-' if m['last_run_time'] is None else f"{m['last_run_time']:.1f}s"
+            lines.append(f"{name} ({m['at']}): 執行 {m['runs']} 次，排隊延遲 {delay}，"
+                         f"耗時 {run_time}，重疊略過 {m['skipped_overlap']}，錯過 {m['missed']}，"
+                         f"失敗 {m['failures']}，下次 {m['next_run']}")
+        return '\n'.join(lines)
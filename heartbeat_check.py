@@ -2,6 +2,8 @@
 """
 heartbeat_check.py - 心跳檢測腳本
 用於 GitHub Actions 中的心跳檢測，避免 YAML 中嵌入複雜 Python 代碼
+
+加上 --import-time 可輸出啟動導入時間報告
 """
 import sys
 import os
@@ -48,7 +50,17 @@ def main():
         return False
 
 if __name__ == "__main__":
-    success = main()
+    from startup_profile import maybe_report_imports
+    maybe_report_imports()
+    
+    try:
+        success = main()
+    finally:
+        # 結束前送出寄件匣中的通知，不依賴直譯器關閉時的 atexit 掛鉤
+        notifier = sys.modules.get('notifier')
+        if notifier is not None and hasattr(notifier, 'flush_notifications'):
+            notifier.flush_notifications(final=True)
+    
     if not success:
         print("❌ 心跳檢測失敗")
         sys.exit(1)
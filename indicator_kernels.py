@@ -0,0 +1,293 @@
+"""
+indicator_kernels.py - 技術指標 NumPy 運算核心
+供 AdvancedTechnicalIndicators 使用的向量化實作
+
+功能：
+1. 滾動平均 / 滾動總和 / 滾動平均絕對偏差
+2. Wilder 平滑、真實波幅、趨向變動
+3. CCI、ADX、MFI、背離偵測
+
+所有函數同時接受 1-D（單一股票）與 2-D（時間 × 股票）陣列，時間軸為 axis 0。
+滾動視窗內只要有 NaN 結果即為 NaN（與 pandas rolling 預設 min_periods 相同）。
+安裝 Numba 時，逐元素迴圈的核心會在第一次使用時 JIT 編譯（導入本模組不載入 Numba）。
+"""
+
+import numpy as np
+import importlib.util
+from typing import Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+if not NUMBA_AVAILABLE:
+    logger.debug("Numba 未安裝，使用 NumPy 版本")
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# ==================== 輔助函數 ====================
+
+def _as_2d(x) -> Tuple[np.ndarray, bool]:
+    """轉成 (T, N) float 陣列，並返回原本是否為 1-D"""
+    arr = np.asarray(x, dtype=float)
+    is_1d = arr.ndim == 1
+    return (arr.reshape(-1, 1) if is_1d else arr), is_1d
+
+
+def _restore(arr: np.ndarray, is_1d: bool) -> np.ndarray:
+    return arr[:, 0] if is_1d else arr
+
+
+def _shift(arr: np.ndarray, periods: int = 1) -> np.ndarray:
+    """沿時間軸位移（前端補 NaN）"""
+    out = np.full_like(arr, np.nan)
+    if periods < len(arr):
+        out[periods:] = arr[:len(arr) - periods]
+    return out
+
+
+def _diff(arr: np.ndarray) -> np.ndarray:
+    """一階差分（第一筆為 NaN）"""
+    return arr - _shift(arr, 1)
+
+
+def _rolling_windows(arr: np.ndarray, window: int) -> np.ndarray:
+    """(T - window + 1, N, window) 的視窗檢視（不複製資料）"""
+    return sliding_window_view(arr, window, axis=0)
+
+
+# ==================== JIT 迴圈核心 ====================
+
+def _rolling_mad_loop(x, window):
+    T, N = x.shape
+    out = np.full((T, N), np.nan)
+    for j in range(N):
+        for t in range(window - 1, T):
+            total = 0.0
+            valid = True
+            for k in range(t - window + 1, t + 1):
+                v = x[k, j]
+                if np.isnan(v):
+                    valid = False
+                    break
+                total += v
+            if not valid:
+                continue
+            mean = total / window
+            dev = 0.0
+            for k in range(t - window + 1, t + 1):
+                dev += abs(x[k, j] - mean)
+            out[t, j] = dev / window
+    return out
+
+
+def _wilder_loop(x, period):
+    T, N = x.shape
+    out = np.full((T, N), np.nan)
+    alpha = 1.0 / period
+    for j in range(N):
+        prev = np.nan
+        for t in range(T):
+            v = x[t, j]
+            if np.isnan(v):
+                out[t, j] = prev
+            elif np.isnan(prev):
+                prev = v
+                out[t, j] = v
+            else:
+                prev = prev + alpha * (v - prev)
+                out[t, j] = prev
+    return out
+
+
+_kernels = None
+
+
+def _get_kernels():
+    """
+    取得 (滾動 MAD JIT 核心或 None, Wilder 平滑核心)
+
+    Numba 延遲到第一次計算指標時才導入與編譯。
+    """
+    global _kernels
+    if _kernels is None:
+        kernels = (None, _wilder_loop)
+        if NUMBA_AVAILABLE:
+            try:
+                import numba
+                kernels = (numba.njit(cache=True)(_rolling_mad_loop),
+                           numba.njit(cache=True)(_wilder_loop))
+            except ImportError as e:
+                logger.debug(f"Numba 載入失敗，使用 NumPy 版本: {e}")
+        _kernels = kernels
+    return _kernels
+
+
+# ==================== 基礎滾動運算 ====================
+
+def rolling_sum(x, window: int) -> np.ndarray:
+    """滾動總和"""
+    arr, is_1d = _as_2d(x)
+    out = np.full_like(arr, np.nan)
+    if window <= len(arr):
+        out[window - 1:] = _rolling_windows(arr, window).sum(axis=-1)
+    return _restore(out, is_1d)
+
+
+def rolling_mean(x, window: int) -> np.ndarray:
+    """滾動平均"""
+    arr, is_1d = _as_2d(x)
+    out = np.full_like(arr, np.nan)
+    if window <= len(arr):
+        out[window - 1:] = _rolling_windows(arr, window).mean(axis=-1)
+    return _restore(out, is_1d)
+
+
+def rolling_mean_abs_deviation(x, window: int) -> np.ndarray:
+    """滾動平均絕對偏差（CCI 使用）"""
+    arr, is_1d = _as_2d(x)
+
+    _rolling_mad_jit = _get_kernels()[0]
+    if _rolling_mad_jit is not None:
+        return _restore(_rolling_mad_jit(np.ascontiguousarray(arr), window), is_1d)
+
+    out = np.full_like(arr, np.nan)
+    if window <= len(arr):
+        windows = _rolling_windows(arr, window)
+        center = windows.mean(axis=-1, keepdims=True)
+        out[window - 1:] = np.abs(windows - center).mean(axis=-1)
+    return _restore(out, is_1d)
+
+
+def wilder_smooth(x, period: int) -> np.ndarray:
+    """
+    Wilder 平滑（alpha = 1/period 的指數平滑）
+
+    以第一個有效值為起點，NaN 輸入沿用前一個平滑值。
+    """
+    arr, is_1d = _as_2d(x)
+    _wilder_impl = _get_kernels()[1]
+    return _restore(_wilder_impl(np.ascontiguousarray(arr), period), is_1d)
+
+
+# ==================== 指標核心 ====================
+
+def typical_price(high, low, close) -> np.ndarray:
+    """典型價格 (H + L + C) / 3"""
+    return (np.asarray(high, dtype=float) + np.asarray(low, dtype=float)
+            + np.asarray(close, dtype=float)) / 3
+
+
+def true_range(high, low, close) -> np.ndarray:
+    """真實波幅（第一筆只有 high - low）"""
+    h, is_1d = _as_2d(high)
+    l, _ = _as_2d(low)
+    c, _ = _as_2d(close)
+    prev_close = _shift(c, 1)
+
+    tr = np.fmax(np.fmax(h - l, np.abs(h - prev_close)), np.abs(l - prev_close))
+    return _restore(tr, is_1d)
+
+
+def directional_movement(high, low) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    趨向變動 (+DM, -DM)
+
+    與 AdvancedTechnicalIndicators.calculate_adx 原有定義一致：
+    +DM 為最高價上升幅度，-DM 為最低價變動的絕對值。
+    """
+    h, is_1d = _as_2d(high)
+    l, _ = _as_2d(low)
+
+    plus_dm = _diff(h)
+    plus_dm[plus_dm < 0] = 0
+    minus_dm = np.abs(_diff(l))
+
+    return _restore(plus_dm, is_1d), _restore(minus_dm, is_1d)
+
+
+def cci(high, low, close, period: int = 20) -> np.ndarray:
+    """商品通道指標 CCI"""
+    tp = typical_price(high, low, close)
+    sma = rolling_mean(tp, period)
+    mad = rolling_mean_abs_deviation(tp, period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (tp - sma) / (0.015 * mad)
+
+
+def adx(high, low, close, period: int = 14, smoothing: str = 'sma') -> Dict[str, np.ndarray]:
+    """
+    平均趨向指數 ADX
+
+    Args:
+        smoothing: 'sma' 為原有的簡單平均，'wilder' 為 Wilder 平滑
+    """
+    smooth = rolling_mean if smoothing == 'sma' else wilder_smooth
+
+    plus_dm, minus_dm = directional_movement(high, low)
+    atr = smooth(true_range(high, low, close), period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = 100 * (smooth(plus_dm, period) / atr)
+        minus_di = 100 * (smooth(minus_dm, period) / atr)
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+
+    return {'adx': smooth(dx, period), 'plus_di': plus_di, 'minus_di': minus_di}
+
+
+def money_flow_index(high, low, close, volume, period: int = 14) -> np.ndarray:
+    """資金流量指標 MFI"""
+    tp, is_1d = _as_2d(typical_price(high, low, close))
+    vol, _ = _as_2d(volume)
+    money_flow = tp * vol
+
+    tp_diff = _diff(tp)
+    positive_flow = np.where(tp_diff > 0, money_flow, 0.0)
+    negative_flow = np.where(tp_diff < 0, money_flow, 0.0)
+
+    positive_mf = rolling_sum(positive_flow, period)
+    negative_mf = rolling_sum(negative_flow, period)
+    negative_mf = np.where(negative_mf == 0, 1.0, negative_mf)
+
+    mfi = 100 - (100 / (1 + positive_mf / negative_mf))
+    return _restore(mfi, is_1d)
+
+
+def divergence(price, indicator, lookback: int = 10) -> Dict[str, np.ndarray]:
+    """
+    背離偵測（只看最近 lookback 筆）
+
+    牛市背離：價格在最後一筆創新低，但指標未創新低
+    熊市背離：價格在最後一筆創新高，但指標未創新高
+
+    Returns:
+        1-D 輸入返回 bool，2-D 輸入返回每檔股票的 bool 陣列
+    """
+    p, is_1d = _as_2d(price)
+    ind, _ = _as_2d(indicator)
+
+    if len(p) < lookback:
+        if is_1d:
+            return {'bullish_divergence': False, 'bearish_divergence': False}
+        empty = np.zeros(p.shape[1], dtype=bool)
+        return {'bullish_divergence': empty, 'bearish_divergence': empty.copy()}
+
+    recent_price = p[-lookback:]
+    recent_ind = ind[-lookback:]
+    last = lookback - 1
+
+    # NaN 不參與極值判斷（與 Series.idxmin/idxmax 相同）
+    price_min_at_last = np.argmin(np.where(np.isnan(recent_price), np.inf, recent_price), axis=0) == last
+    price_max_at_last = np.argmax(np.where(np.isnan(recent_price), -np.inf, recent_price), axis=0) == last
+
+    with np.errstate(invalid='ignore'):
+        ind_min = np.min(np.where(np.isnan(recent_ind), np.inf, recent_ind), axis=0)
+        ind_max = np.max(np.where(np.isnan(recent_ind), -np.inf, recent_ind), axis=0)
+        bullish = price_min_at_last & (recent_ind[-1] > ind_min)
+        bearish = price_max_at_last & (recent_ind[-1] < ind_max)
+
+    if is_1d:
+        return {'bullish_divergence': bool(bullish[0]), 'bearish_divergence': bool(bearish[0])}
+    return {'bullish_divergence': bullish, 'bearish_divergence': bearish}
@@ -6,12 +6,10 @@ import os
 import sys
 import time
 import json
-import schedule
 import argparse
 import logging
 import importlib
-import numpy as np
-import pandas as pd
+import importlib.util
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
@@ -58,12 +56,10 @@ def log_event(message, level='info'):
 def check_environment():
     """檢查環境是否配置正確"""
     try:
-        # 嘗試導入必要的模塊
-        import requests
-        import pandas
-        import schedule
-        import numpy
-        from dotenv import load_dotenv
+        # 檢查必要的模塊是否已安裝（只查找不導入，避免啟動時載入 pandas 等大型套件）
+        for module_name in ['requests', 'pandas', 'numpy', 'dotenv']:
+            if importlib.util.find_spec(module_name) is None:
+                raise ImportError(f"No module named '{module_name}'")
         
         # 檢查配置文件
         try:
@@ -104,6 +100,136 @@ def check_environment():
         print(f"❌ 錯誤: 環境檢查失敗: {e}")
         return False
 
+def build_time_slot_config(mode='basic') -> Dict[str, Dict[str, Any]]:
+    """各時段的分析配置（股票數、時間預算、分析重點、推薦數量）"""
+    return {
+        'morning_scan': {
+            'name': '早盤掃描',
+            'stock_count': 200 if mode == 'optimized' else (100 if mode == 'basic' else 100),
+            'time_budget': 240,  # 秒（含抓取數據），預算將盡時其餘股票改用基礎分析
+            'analysis_focus': 'short_term',
+            'recommendation_limits': {
+                'short_term': 3,
+                'long_term': 2 if mode != 'optimized' else 3,
+                'weak_stocks': 2
+            }
+        },
+        'mid_morning_scan': {
+            'name': '盤中掃描',
+            'stock_count': 300 if mode == 'optimized' else 150,
+            'time_budget': 300,
+            'analysis_focus': 'short_term',
+            'recommendation_limits': {
+                'short_term': 3,
+                'long_term': 2 if mode != 'optimized' else 3,
+                'weak_stocks': 1
+            }
+        },
+        'mid_day_scan': {
+            'name': '午間掃描',
+            'stock_count': 300 if mode == 'optimized' else 150,
+            'time_budget': 300,
+            'analysis_focus': 'mixed',
+            'recommendation_limits': {
+                'short_term': 3,
+                'long_term': 3 if mode != 'optimized' else 4,
+                'weak_stocks': 2
+            }
+        },
+        'afternoon_scan': {
+            'name': '盤後掃描',
+            'stock_count': 1000 if mode == 'optimized' else 750,
+            'time_budget': 900,
+            'analysis_focus': 'mixed',
+            'recommendation_limits': {
+                'short_term': 3,
+                'long_term': 3 if mode != 'optimized' else 5,
+                'weak_stocks': 2
+            }
+        },
+        'weekly_summary': {
+            'name': '週末總結',
+            'stock_count': 1000 if mode == 'optimized' else 750,
+            'time_budget': 1200,
+            'analysis_focus': 'long_term',
+            'recommendation_limits': {
+                'short_term': 3,
+                'long_term': 4 if mode != 'optimized' else 6,
+                'weak_stocks': 3
+            }
+        }
+    }
+
+def load_delta_scan_config() -> Dict[str, Any]:
+    """盤中增量重掃配置"""
+    try:
+        from config import DELTA_SCAN
+        return DELTA_SCAN
+    except ImportError:
+        return {
+            'enabled': True,
+            'time_slots': ['mid_morning_scan', 'mid_day_scan'],
+            'close_tolerance': 0.005,
+            'volume_tolerance': 0.10,
+            'trade_value_tolerance': 0.10,
+            'top_n': 50,
+        }
+
+def load_priority_stocks() -> List[str]:
+    """優先分析的股票代碼"""
+    try:
+        from config import STOCK_ANALYSIS
+        return list(STOCK_ANALYSIS.get('priority_stocks', []))
+    except ImportError:
+        return []
+
+def prioritize_stocks(stocks: List[Dict[str, Any]], priority_codes: List[str]) -> List[Dict[str, Any]]:
+    """排列分析順序：優先股票在前（依設定順序），其餘依成交金額由大到小"""
+    rank = {code: i for i, code in enumerate(priority_codes)}
+    return sorted(stocks, key=lambda stock: (rank.get(stock.get('code'), len(rank)),
+                                             -(stock.get('trade_value') or 0)))
+
+# 預留給生成推薦與發送通知的時間（秒）
+DEADLINE_RESERVE_SECONDS = 30
+
+class ScanBudget:
+    """
+    掃描時間預算
+    
+    追蹤完整分析的平均耗時（吞吐量），剩餘時間不足以再完成一支完整分析
+    並保留發送通知的時間時，其餘股票改用基礎快速分析，確保通知準時送出。
+    """
+    
+    def __init__(self, time_budget: Optional[float], reserve: float = DEADLINE_RESERVE_SECONDS):
+        self.time_budget = time_budget
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + time_budget if time_budget else None
+        self.reserve = min(reserve, time_budget * 0.25) if time_budget else 0
+        self.full_count = 0
+        self.full_seconds = 0.0
+        self.fallback_count = 0
+        self.exhausted = False
+    
+    def record_full(self, seconds: float) -> None:
+        self.full_count += 1
+        self.full_seconds += seconds
+    
+    def throughput(self) -> float:
+        """完整分析的吞吐量（支/秒）"""
+        return self.full_count / self.full_seconds if self.full_seconds > 0 else 0.0
+    
+    def allows_full(self) -> bool:
+        """是否還有時間做下一支完整分析（一旦用盡就不再恢復）"""
+        if self.deadline is None or self.exhausted:
+            return not self.exhausted
+        average = self.full_seconds / self.full_count if self.full_count else 0.0
+        if time.monotonic() + average + self.reserve >= self.deadline:
+            self.exhausted = True
+        return not self.exhausted
+    
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
 class IntegratedStockBot:
     """整合版股市分析機器人"""
     
@@ -117,6 +243,9 @@ class IntegratedStockBot:
         self.enhanced_analyzer = None
         self.optimized_bot = None
         self.notifier = None
+        self.warmup = None  # 常駐模式由 run_daemon 設定
+        self.day_state = None  # 常駐模式由 run_daemon 設定（attach_day_state）
+        self.ml_plugin = None
         
         # 初始化數據獲取器
         self._init_data_fetcher()
@@ -132,63 +261,15 @@ class IntegratedStockBot:
         # 初始化通知系統
         self._init_notifier()
         
+        # ML 增強插件（ML_ENHANCEMENT_ENABLED=true 時啟用）
+        self._init_ml_plugin()
+        
         # 設置緩存目錄
         self.cache_dir = os.path.join(os.getcwd(), 'data', 'cache')
         os.makedirs(self.cache_dir, exist_ok=True)
         
         # 時段配置
-        self.time_slot_config = {
-            'morning_scan': {
-                'name': '早盤掃描',
-                'stock_count': 200 if mode == 'optimized' else (100 if mode == 'basic' else 100),
-                'analysis_focus': 'short_term',
-                'recommendation_limits': {
-                    'short_term': 3,
-                    'long_term': 2 if mode != 'optimized' else 3,
-                    'weak_stocks': 2
-                }
-            },
-            'mid_morning_scan': {
-                'name': '盤中掃描',
-                'stock_count': 300 if mode == 'optimized' else 150,
-                'analysis_focus': 'short_term',
-                'recommendation_limits': {
-                    'short_term': 3,
-                    'long_term': 2 if mode != 'optimized' else 3,
-                    'weak_stocks': 1
-                }
-            },
-            'mid_day_scan': {
-                'name': '午間掃描',
-                'stock_count': 300 if mode == 'optimized' else 150,
-                'analysis_focus': 'mixed',
-                'recommendation_limits': {
-                    'short_term': 3,
-                    'long_term': 3 if mode != 'optimized' else 4,
-                    'weak_stocks': 2
-                }
-            },
-            'afternoon_scan': {
-                'name': '盤後掃描',
-                'stock_count': 1000 if mode == 'optimized' else 750,
-                'analysis_focus': 'mixed',
-                'recommendation_limits': {
-                    'short_term': 3,
-                    'long_term': 3 if mode != 'optimized' else 5,
-                    'weak_stocks': 2
-                }
-            },
-            'weekly_summary': {
-                'name': '週末總結',
-                'stock_count': 1000 if mode == 'optimized' else 750,
-                'analysis_focus': 'long_term',
-                'recommendation_limits': {
-                    'short_term': 3,
-                    'long_term': 4 if mode != 'optimized' else 6,
-                    'weak_stocks': 3
-                }
-            }
-        }
+        self.time_slot_config = build_time_slot_config(mode)
         
         log_event(f"✅ 整合版股市機器人初始化完成 (模式: {mode.upper()})")
     
@@ -225,6 +306,13 @@ class IntegratedStockBot:
             log_event(f"⚠️ 優化版分析器初始化失敗，回退到增強模式: {e}", level='warning')
             self._init_enhanced_mode()
     
+    def _init_ml_plugin(self):
+        """初始化 ML 增強插件（模組在第一次使用時才載入）"""
+        from ml_enhancement_plugin import ML_ENABLED, get_plugin
+        if ML_ENABLED:
+            self.ml_plugin = get_plugin()
+            log_event("✅ ML 增強插件已啟用")
+    
     def _init_notifier(self):
         """初始化通知系統"""
         try:
@@ -239,12 +327,27 @@ class IntegratedStockBot:
         except Exception as e:
             log_event(f"⚠️ 通知系統初始化失敗: {e}", level='warning')
     
+    def attach_day_state(self, day_state) -> None:
+        """
+        啟用當日狀態（常駐模式）
+        
+        全市場快照與分析結果在同一交易日的各時段之間沿用；
+        優化版分析器的個股數據快取也改用當日狀態，換日時一併清空。
+        """
+        self.day_state = day_state
+        if self.optimized_bot is not None and hasattr(self.optimized_bot, 'data_cache'):
+            self.optimized_bot.data_cache = day_state.stock_data
+    
     def get_stocks_for_analysis(self, time_slot: str, date: str = None) -> List[Dict[str, Any]]:
         """獲取要分析的股票"""
         log_event(f"🔍 開始獲取 {time_slot} 時段的股票數據")
         
         try:
-            if self.data_fetcher:
+            if self.data_fetcher and self.day_state is not None and date is None:
+                # 常駐模式：全市場快照由當日狀態管理（抓取失敗時沿用當日快照）
+                universe = self.day_state.get_universe(self.data_fetcher.get_all_stocks_by_volume)
+                stocks = self.data_fetcher.select_for_time_slot(universe, time_slot)
+            elif self.data_fetcher:
                 stocks = self.data_fetcher.get_stocks_by_time_slot(time_slot, date)
             else:
                 # 如果沒有數據獲取器，創建模擬數據
@@ -528,6 +631,13 @@ class IntegratedStockBot:
         start_time = time.time()
         log_event(f"🚀 開始執行 {time_slot} 分析 (模式: {self.mode.upper()})")
         
+        # 時間預算從開始執行起算（包含抓取數據）
+        budget = ScanBudget(self.time_slot_config.get(time_slot, {}).get('time_budget'))
+        
+        if self.warmup is not None:
+            state = '已就緒' if self.warmup.is_ready() else '尚未完成'
+            log_event(f"🔥 元件預熱{state}: {self.warmup.format_report()}")
+        
         try:
             # 確保通知系統可用
             if self.notifier and hasattr(self.notifier, 'is_notification_available'):
@@ -550,12 +660,38 @@ class IntegratedStockBot:
             log_event(f"📊 成功獲取 {len(stocks)} 支股票（預期 {expected_count} 支）")
             log_event(f"🔍 分析重點: {analysis_focus}")
             log_event(f"🔧 分析模式: {self.mode.upper()}")
+            if budget.time_budget:
+                log_event(f"⏱️ 時間預算: {budget.time_budget} 秒（已用 {budget.elapsed():.1f} 秒）")
+            
+            # 分析順序：優先股票在前，其餘依成交金額，時間不足時重要股票已完成完整分析
+            stocks = prioritize_stocks(stocks, load_priority_stocks())
+            
+            # ML 插件：以本時段股票清單建立共用新聞池與代碼 / 名稱索引（每個時間窗收集一次新聞）
+            if self.ml_plugin is not None:
+                news_count = self.ml_plugin.prepare_scan(stocks)
+                if news_count:
+                    log_event(f"📰 共用新聞池: {news_count} 條新聞")
             
             # 分析股票
             all_analyses = []
             total_stocks = len(stocks)
             batch_size = 50
             method_count = {}
+            reused_count = 0
+            
+            # 盤中增量重掃：只重新分析報價變動超過容許範圍或新進入成交金額前N名的股票
+            delta_config = load_delta_scan_config()
+            needs_analysis = None
+            if (self.day_state is not None and delta_config['enabled']
+                    and time_slot in delta_config['time_slots']):
+                needs_analysis = self.day_state.plan_delta(
+                    stocks, analysis_focus,
+                    close_tolerance=delta_config['close_tolerance'],
+                    volume_tolerance=delta_config['volume_tolerance'],
+                    trade_value_tolerance=delta_config['trade_value_tolerance'],
+                    top_n=delta_config['top_n'],
+                )
+                log_event(f"🔁 增量重掃: {int(needs_analysis.sum())}/{total_stocks} 支股票需要重新分析")
             
             for i in range(0, total_stocks, batch_size):
                 batch = stocks[i:i + batch_size]
@@ -564,9 +700,36 @@ class IntegratedStockBot:
                 log_event(f"🔍 分析第 {i//batch_size + 1} 批次: 股票 {i+1}-{batch_end}/{total_stocks}")
                 
                 # 批次分析
+                batch_analyzed = 0
                 for j, stock in enumerate(batch):
                     try:
-                        analysis = self.analyze_stock(stock, analysis_focus)
+                        # 常駐模式：報價未變（增量重掃時為變動未超過容許範圍）的股票沿用上一個時段的分析
+                        analysis = None
+                        if needs_analysis is not None:
+                            if not needs_analysis[i + j]:
+                                analysis = self.day_state.carry_forward(stock)
+                        elif self.day_state is not None:
+                            analysis = self.day_state.get_analysis(stock, analysis_focus)
+                        if analysis is not None:
+                            reused_count += 1
+                        elif budget.allows_full():
+                            batch_analyzed += 1
+                            analyze_start = time.monotonic()
+                            analysis = self.analyze_stock(stock, analysis_focus)
+                            if self.ml_plugin is not None:
+                                analysis = self.ml_plugin.enhance_analysis(analysis)
+                            budget.record_full(time.monotonic() - analyze_start)
+                            if self.day_state is not None:
+                                self.day_state.put_analysis(stock, analysis_focus, analysis)
+                        else:
+                            # 時間預算將盡：其餘股票改用基礎快速分析（不寫入當日狀態，下個時段重新完整分析）
+                            if budget.fallback_count == 0:
+                                log_event(f"⏰ 時間預算將盡（已用 {budget.elapsed():.1f}/{budget.time_budget} 秒，"
+                                          f"吞吐量 {budget.throughput():.2f} 支/秒），"
+                                          f"其餘 {total_stocks - (i + j)} 支股票改用基礎快速分析", level='warning')
+                            analysis = self._analyze_basic(stock)
+                            analysis['analysis_method'] = 'basic_deadline'
+                            budget.fallback_count += 1
                         all_analyses.append(analysis)
                         
                         # 統計分析方法
@@ -582,8 +745,8 @@ class IntegratedStockBot:
                         log_event(f"⚠️ 分析股票 {stock['code']} 失敗: {e}", level='warning')
                         continue
                 
-                # 批次間短暫休息
-                if i + batch_size < total_stocks:
+                # 批次間短暫休息（整批沿用快取或時間預算已用盡時不需要）
+                if i + batch_size < total_stocks and batch_analyzed and not budget.exhausted:
                     time.sleep(0.5)
             
             elapsed_time = time.time() - start_time
@@ -593,6 +756,16 @@ class IntegratedStockBot:
             method_stats = [f"{method}:{count}支" for method, count in method_count.items()]
             log_event(f"📈 分析方法統計: {', '.join(method_stats)}")
             
+            full_count = len(all_analyses) - budget.fallback_count
+            if budget.time_budget:
+                log_event(f"⏱️ 時間預算 {budget.time_budget} 秒，已用 {budget.elapsed():.1f} 秒，"
+                          f"完整分析 {full_count}/{len(all_analyses)} 支（吞吐量 {budget.throughput():.2f} 支/秒）")
+            
+            if self.day_state is not None:
+                self.day_state.remember_top(stocks, delta_config['top_n'])
+                self.day_state.record_slot(time_slot, reused_count, len(all_analyses) - reused_count)
+                log_event(f"♻️ 沿用前一時段分析 {reused_count} 支，重新分析 {len(all_analyses) - reused_count} 支")
+            
             # 生成推薦
             recommendations = self.generate_recommendations(all_analyses, time_slot)
             
@@ -612,13 +785,18 @@ class IntegratedStockBot:
                     score = analysis_info.get('weighted_score', 0)
                     log_event(f"   {stock['code']} {stock['name']} (評分:{score}, 方法:{method})")
             
-            # 發送通知
+            # 發送通知（有股票改用基礎分析時，附上完整分析的股票數）
             display_name = config['name']
+            notify_data = recommendations
+            if budget.fallback_count:
+                notify_data = dict(recommendations, scan_note=(
+                    f"時間預算 {budget.time_budget} 秒內完整分析 {full_count}/{len(all_analyses)} 支股票，"
+                    f"其餘 {budget.fallback_count} 支使用基礎快速分析"))
             if self.notifier:
                 if self.mode == 'optimized' and hasattr(self.notifier, 'send_optimized_combined_recommendations'):
-                    self.notifier.send_optimized_combined_recommendations(recommendations, display_name)
+                    self.notifier.send_optimized_combined_recommendations(notify_data, display_name)
                 elif hasattr(self.notifier, 'send_combined_recommendations'):
-                    self.notifier.send_combined_recommendations(recommendations, display_name)
+                    self.notifier.send_combined_recommendations(notify_data, display_name)
                 else:
                     log_event("⚠️ 通知系統不支持發送推薦", level='warning')
             
@@ -636,20 +814,11 @@ class IntegratedStockBot:
     def save_analysis_results(self, analyses: List[Dict[str, Any]], recommendations: Dict[str, List], time_slot: str) -> None:
         """保存分析結果"""
         try:
-            # 創建日期目錄
-            date_str = datetime.now().strftime('%Y%m%d')
-            results_dir = os.path.join(os.getcwd(), 'data', 'analysis_results', date_str)
-            os.makedirs(results_dir, exist_ok=True)
+            from results_store import AnalysisResultsStore
             
-            # 保存分析結果
-            analyses_path = os.path.join(results_dir, f"{time_slot}_analyses_{self.mode}.json")
-            with open(analyses_path, 'w', encoding='utf-8') as f:
-                json.dump(analyses, f, ensure_ascii=False, indent=2)
-            
-            # 保存推薦結果
-            recommendations_path = os.path.join(results_dir, f"{time_slot}_recommendations_{self.mode}.json")
-            with open(recommendations_path, 'w', encoding='utf-8') as f:
-                json.dump(recommendations, f, ensure_ascii=False, indent=2)
+            # 分析結果存成欄式表格，推薦結果只保存代碼引用
+            store = AnalysisResultsStore(os.path.join(os.getcwd(), 'data', 'analysis_results'))
+            results_dir = store.write_slot(analyses, recommendations, time_slot, self.mode)
             
             log_event(f"💾 分析結果已保存到 {results_dir}")
             
@@ -657,7 +826,9 @@ class IntegratedStockBot:
             log_event(f"⚠️ 保存分析結果時發生錯誤: {e}", level='warning')
 
 def setup_schedule(bot: IntegratedStockBot):
-    """設置排程任務"""
+    """設置排程任務，返回尚未啟動的排程器"""
+    from event_scheduler import EventScheduler, WEEKDAYS, DAY_NAMES
+    
     try:
         from config import NOTIFICATION_SCHEDULE
     except ImportError:
@@ -673,44 +844,26 @@ def setup_schedule(bot: IntegratedStockBot):
     
     print("⏰ 設置排程任務...")
     
-    # 工作日排程
-    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
-    
-    # 早盤掃描
-    for day in weekdays:
-        getattr(schedule.every(), day).at(NOTIFICATION_SCHEDULE['morning_scan']).do(
-            bot.run_analysis, 'morning_scan'
-        )
-    
-    # 盤中掃描
-    for day in weekdays:
-        getattr(schedule.every(), day).at(NOTIFICATION_SCHEDULE['mid_morning_scan']).do(
-            bot.run_analysis, 'mid_morning_scan'
-        )
-    
-    # 午間掃描
-    for day in weekdays:
-        getattr(schedule.every(), day).at(NOTIFICATION_SCHEDULE['mid_day_scan']).do(
-            bot.run_analysis, 'mid_day_scan'
-        )
+    scheduler = EventScheduler()
     
-    # 盤後掃描
-    for day in weekdays:
-        getattr(schedule.every(), day).at(NOTIFICATION_SCHEDULE['afternoon_scan']).do(
-            bot.run_analysis, 'afternoon_scan'
-        )
+    # 工作日排程：早盤、盤中、午間、盤後掃描
+    for time_slot in ['morning_scan', 'mid_morning_scan', 'mid_day_scan', 'afternoon_scan']:
+        scheduler.add(time_slot, NOTIFICATION_SCHEDULE[time_slot], bot.run_analysis, time_slot,
+                      days=WEEKDAYS)
     
     # 週末總結
-    schedule.every().friday.at(NOTIFICATION_SCHEDULE['weekly_summary']).do(
-        bot.run_analysis, 'weekly_summary'
-    )
+    scheduler.add('weekly_summary', NOTIFICATION_SCHEDULE['weekly_summary'],
+                  bot.run_analysis, 'weekly_summary', days=[DAY_NAMES['friday']])
     
     # 心跳檢測
     if bot.notifier and hasattr(bot.notifier, 'send_heartbeat'):
-        schedule.every().day.at(NOTIFICATION_SCHEDULE['heartbeat']).do(bot.notifier.send_heartbeat)
+        scheduler.add('heartbeat', NOTIFICATION_SCHEDULE['heartbeat'], bot.notifier.send_heartbeat)
+    
+    for job in scheduler.next_runs():
+        print(f"  📅 {job['name']}: 下次執行 {job['next_run']:%Y-%m-%d %H:%M:%S}")
     
     print("✅ 排程任務設置完成")
-    return True
+    return scheduler
 
 def run_daemon(mode='basic'):
     """運行後台服務"""
@@ -744,10 +897,24 @@ def run_daemon(mode='basic'):
     bot = IntegratedStockBot(mode)
     
     # 設置排程
-    if not setup_schedule(bot):
-        print("❌ 排程設置失敗，程序退出")
+    try:
+        scheduler = setup_schedule(bot)
+    except Exception as e:
+        print(f"❌ 排程設置失敗，程序退出: {e}")
         return
     
+    # 當日狀態：各時段之間沿用全市場快照、個股數據與未變動股票的分析
+    from day_state import DayState
+    bot.attach_day_state(DayState())
+    
+    # 背景預熱較重的選用元件（單次執行不預熱，維持延遲載入）
+    try:
+        from warmup import start_warmup
+        bot.warmup = start_warmup()
+        print(f"🔥 背景預熱元件: {', '.join(bot.warmup.status) or '無'}")
+    except Exception as e:
+        log_event(f"元件預熱啟動失敗: {e}", 'warning')
+    
     # 啟動時發送心跳
     if bot.notifier and hasattr(bot.notifier, 'send_heartbeat'):
         print("💓 發送啟動心跳...")
@@ -756,14 +923,15 @@ def run_daemon(mode='basic'):
     print(f"\n🎯 {mode.upper()}模式系統已啟動，開始執行排程任務...")
     print("📝 按 Ctrl+C 停止系統")
     
-    # 運行排程循環
+    # 啟動排程器：到點即觸發，各工作在獨立執行緒執行，同一時段不會重疊
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(30)  # 每30秒檢查一次
+        scheduler.start()
+        scheduler.join()
     except KeyboardInterrupt:
         print("\n\n⚠️ 收到用戶中斷信號")
         print("🛑 正在優雅關閉系統...")
+        scheduler.stop()
+        print(f"📈 排程統計:\n{scheduler.format_report()}")
         
         # 發送關閉通知
         if bot.notifier and hasattr(bot.notifier, 'send_notification'):
@@ -909,21 +1077,23 @@ def show_status(mode='basic'):
     print(f"🔧 當前模式: {mode.upper()}")
     
     try:
-        # 嘗試初始化機器人
-        bot = IntegratedStockBot(mode)
-        print("✅ 機器人初始化: 成功")
-        
-        # 檢查通知狀態
-        if bot.notifier:
-            if hasattr(bot.notifier, 'is_notification_available'):
-                if bot.notifier.is_notification_available():
-                    print("📧 通知系統: 可用")
-                else:
-                    print("⚠️ 通知系統: 不可用")
-            else:
-                print("📧 通知系統: 已載入")
-        else:
-            print("❌ 通知系統: 不可用")
+        # 只讀取配置檢查通知渠道，不建立機器人（不載入數據獲取器與分析器，也不啟動通知派送）
+        try:
+            from config import EMAIL_CONFIG, LINE_CONFIG, FILE_BACKUP
+            
+            email_ready = EMAIL_CONFIG['enabled'] and all(
+                [EMAIL_CONFIG['sender'], EMAIL_CONFIG['password'], EMAIL_CONFIG['receiver']])
+            line_ready = LINE_CONFIG.get('enabled', False) and bool(
+                LINE_CONFIG.get('channel_access_token')) and bool(
+                LINE_CONFIG.get('user_id') or LINE_CONFIG.get('group_id'))
+            
+            print(f"📧 EMAIL通知: {'可用' if email_ready else '未配置'}")
+            print(f"📱 LINE推播: {'可用' if line_ready else '未配置'}")
+            print(f"💾 文件備份: {'啟用' if FILE_BACKUP['enabled'] else '停用'}")
+            if not (email_ready or line_ready or FILE_BACKUP['enabled']):
+                print("⚠️ 通知系統: 不可用")
+        except ImportError:
+            print("⚠️ 無法導入config模組，無法檢查通知配置")
         
         # 顯示模式特色
         print(f"\n💎 {mode.upper()}模式特色:")
@@ -945,15 +1115,25 @@ def show_status(mode='basic'):
             print("  🚀 快速部署")
         
         print("\n📅 排程時段:")
-        config = bot.time_slot_config
+        config = build_time_slot_config(mode)
         for slot, info in config.items():
             stock_count = info['stock_count']
             name = info['name']
-            print(f"  📊 {name}: {stock_count}支股票")
+            print(f"  📊 {name}: {stock_count}支股票（時間預算 {info['time_budget']} 秒）")
         
     except Exception as e:
         print(f"❌ 系統狀態檢查失敗: {e}")
 
+def flush_pending_notifications():
+    """
+    結束前送出寄件匣中剩餘的通知（未載入通知模組時不做事）
+
+    在 main() 返回前明確呼叫，不依賴直譯器關閉時的 atexit 掛鉤。
+    """
+    notifier = sys.modules.get('notifier')
+    if notifier is not None and hasattr(notifier, 'flush_notifications'):
+        notifier.flush_notifications(final=True)
+
 def main():
     """主函數"""
     parser = argparse.ArgumentParser(description='整合版台股分析系統')
@@ -972,9 +1152,16 @@ def main():
     parser.add_argument('--test-type', '-t',
                        choices=['all', 'simple', 'html', 'urgent', 'stock', 'combined', 'heartbeat'],
                        default='all', help='測試類型')
+    parser.add_argument('--import-time', action='store_true',
+                       help='以 python -X importtime 執行並輸出導入時間報告')
     
     args = parser.parse_args()
     
+    # 查詢狀態只讀取配置，不做環境檢查與日誌設置，維持最短啟動時間
+    if args.command == 'status':
+        show_status(args.mode)
+        return
+    
     # 檢查環境
     if not check_environment():
         print("環境檢查失敗，請修復上述問題再嘗試")
@@ -995,9 +1182,6 @@ def main():
         
         run_single_analysis(args.slot, args.mode)
         
-    elif args.command == 'status':
-        show_status(args.mode)
-        
     elif args.command == 'test':
         test_notification(args.test_type, args.mode)
     
@@ -1005,4 +1189,9 @@ def main():
         parser.print_help()
 
 if __name__ == "__main__":
-    main()
+    from startup_profile import maybe_report_imports
+    maybe_report_imports()
+    try:
+        main()
+    finally:
+        flush_pending_notifications()
@@ -15,6 +15,7 @@ ml_enhancement_plugin.py - ML 增強插件
 
 import os
 import logging
+import threading
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
@@ -47,6 +48,8 @@ class MLEnhancementPlugin:
         self._ml_predictor = None
         self._sentiment = None
         self._tracker = None
+        self._load_lock = threading.Lock()
+        self._news_pool_ready = False
 
         if self.enabled:
             logger.info(f"🔌 ML 插件已啟用 (模式: {self.mode})")
@@ -58,6 +61,12 @@ class MLEnhancementPlugin:
         if self.modules_loaded:
             return
 
+        # 背景預熱與分析可能同時呼叫，只載入一次
+        with self._load_lock:
+            if not self.modules_loaded:
+                self._load_modules()
+
+    def _load_modules(self):
         try:
             from ml_stock_predictor import MLStockPredictor, QuickPredictor
             self._ml_predictor = QuickPredictor() if self.mode == 'quick' else MLStockPredictor()
@@ -74,6 +83,42 @@ class MLEnhancementPlugin:
 
         self.modules_loaded = True
 
+    def warm_up(self) -> bool:
+        """
+        預先載入模組（常駐模式由 warmup 在背景呼叫）
+
+        Returns:
+            bool: 插件停用時返回 False
+        """
+        if not self.enabled:
+            return False
+        self._lazy_load()
+        return True
+
+    def prepare_scan(self, stocks: List[Dict]) -> int:
+        """
+        掃描開始前以本時段的股票清單準備共用新聞池（每個時間窗只收集一次新聞）
+
+        之後 enhance_analysis 的個股新聞情緒只查新聞池索引，不另外爬取。
+
+        Returns:
+            int: 新聞池中的新聞數（插件停用或情緒模組不可用時為 0）
+        """
+        if not self.enabled:
+            return 0
+
+        self._lazy_load()
+
+        if self._sentiment:
+            try:
+                count = self._sentiment.prepare_news_pool(stocks)
+                self._news_pool_ready = True
+                return count
+            except Exception as e:
+                logger.debug(f"新聞池準備失敗: {e}")
+
+        return 0
+
     def enhance_analysis(self, original_result: Dict) -> Dict:
         """
         增強原有的分析結果
@@ -105,6 +150,14 @@ class MLEnhancementPlugin:
         except Exception as e:
             logger.debug(f"ML 增強失敗（回退到原有結果）: {e}")
 
+        try:
+            # 個股新聞情緒（prepare_scan 之後才查詢，只查新聞池索引）
+            if self._sentiment and self._news_pool_ready and original_result.get('code'):
+                enhanced['news_sentiment'] = self._sentiment.analyze_stock_sentiment(
+                    original_result['code'], original_result.get('name'), pool_only=True)
+        except Exception as e:
+            logger.debug(f"新聞情緒增強失敗（回退到原有結果）: {e}")
+
         return enhanced
 
     def _get_quick_prediction(self, stock_data: Dict) -> Optional[Dict]:
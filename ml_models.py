@@ -14,6 +14,7 @@ import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 import logging
+import importlib.util
 import json
 import os
 import pickle
@@ -22,29 +23,17 @@ warnings.filterwarnings('ignore')
 
 logger = logging.getLogger(__name__)
 
-# 嘗試導入 ML 庫（如果沒有安裝則使用簡化版本）
-try:
-    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.model_selection import train_test_split, cross_val_score
-    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-    SKLEARN_AVAILABLE = True
-except ImportError:
-    SKLEARN_AVAILABLE = False
-    logger.warning("sklearn 未安裝，使用簡化版本")
+# ML 庫延遲導入：只檢查是否安裝，實際導入延後到建立 / 訓練模型時
+# （sklearn.ensemble 導入約需 2 秒，只做規則預測或查詢狀態時不必付出）
+SKLEARN_AVAILABLE = importlib.util.find_spec('sklearn') is not None
+XGBOOST_AVAILABLE = importlib.util.find_spec('xgboost') is not None
+LIGHTGBM_AVAILABLE = importlib.util.find_spec('lightgbm') is not None
 
-try:
-    import xgboost as xgb
-    XGBOOST_AVAILABLE = True
-except ImportError:
-    XGBOOST_AVAILABLE = False
+if not SKLEARN_AVAILABLE:
+    logger.warning("sklearn 未安裝，使用簡化版本")
+if not XGBOOST_AVAILABLE:
     logger.info("XGBoost 未安裝")
-
-try:
-    import lightgbm as lgb
-    LIGHTGBM_AVAILABLE = True
-except ImportError:
-    LIGHTGBM_AVAILABLE = False
+if not LIGHTGBM_AVAILABLE:
     logger.info("LightGBM 未安裝")
 
 
@@ -262,7 +251,7 @@ class FeatureEngineer:
     def _add_cyclical_features(self, df: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
         """週期特徵"""
         if 'date' in df.columns:
-            dates = pd.to_datetime(df['date'])
+            dates = pd.DatetimeIndex(pd.to_datetime(df['date']))
         else:
             dates = df.index
 
@@ -291,13 +280,114 @@ class FeatureEngineer:
         Returns:
             Series: 1=上漲, 0=持平, -1=下跌
         """
-        future_return = df['close'].shift(-forward_days) / df['close'] - 1
+        labels = self.create_target_tensor(df, horizons=[forward_days],
+                                           thresholds=[threshold], group_col=None)
+        return pd.Series(labels[:, 0, 0].astype(int), index=df.index)
+
+    def create_target_tensor(self, df: pd.DataFrame,
+                             horizons: List[int] = (5, 20),
+                             thresholds: List[float] = (0.02,),
+                             group_col: Optional[str] = 'code',
+                             return_mask: bool = False):
+        """
+        一次計算多個預測天數 × 多個閾值的標籤張量
+
+        適用單一股票或多檔股票的面板數據（以 group_col 分組，
+        每組內需依日期排序），所有組合在同一次 NumPy 運算中完成。
+
+        Args:
+            df: 價格數據（需含 close，面板數據另需 group_col）
+            horizons: 向前看的天數列表
+            thresholds: 漲跌判斷閾值列表
+            group_col: 股票代碼欄位，None 或不存在時視為單一股票
+            return_mask: 是否一併返回「未來價格已知」遮罩
+
+        Returns:
+            np.ndarray: (rows, horizons, thresholds) int8，1=上漲, 0=持平, -1=下跌
+                        labels[:, i, j] 對應 horizons[i]、thresholds[j]
+            若 return_mask=True，另返回 (rows, horizons) bool 遮罩
+        """
+        close = df['close'].to_numpy(dtype=float)
+        n = len(close)
+        h = np.asarray(horizons, dtype=int)
+        th = np.asarray(thresholds, dtype=float)
+
+        # 依股票分組排序（stable 保留組內原有的日期順序）
+        if group_col and group_col in df.columns:
+            groups = pd.factorize(df[group_col])[0]
+            order = np.argsort(groups, kind='stable')
+        else:
+            groups = np.zeros(n, dtype=int)
+            order = np.arange(n)
+
+        c = close[order]
+        g = groups[order]
+
+        future_idx = np.arange(n)[:, None] + h[None, :]
+        clipped = np.minimum(future_idx, n - 1)
+        known = (future_idx < n) & (g[clipped] == g[:, None])
+
+        future_return = np.where(known, c[clipped], np.nan) / c[:, None] - 1
+        r = future_return[:, :, None]
+        sorted_labels = (r > th).astype(np.int8) - (r < -th).astype(np.int8)
 
-        target = pd.Series(0, index=df.index)
-        target[future_return > threshold] = 1
-        target[future_return < -threshold] = -1
+        labels = np.empty_like(sorted_labels)
+        labels[order] = sorted_labels
 
-        return target
+        if return_mask:
+            mask = np.empty_like(known)
+            mask[order] = known
+            return labels, mask
+
+        return labels
+
+
+# ==================== 每日特徵庫 ====================
+
+class DailyFeatureStore:
+    """
+    每日特徵庫
+    每個交易日一個檔案，保存已標註的特徵列，供增量更新使用
+
+    目錄結構: <store_dir>/<YYYY-MM-DD>.pkl
+    """
+
+    def __init__(self, store_dir: str = './data/feature_store'):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, date: str) -> str:
+        return os.path.join(self.store_dir, f"{date}.pkl")
+
+    def append_day(self, date: str, X: pd.DataFrame, y: pd.Series):
+        """
+        寫入某日的特徵與標籤
+
+        標籤需要 forward_days 之後的價格，因此通常在標籤成熟後才寫入。
+        """
+        day = X.copy()
+        day['__target__'] = y.reindex(X.index)
+        day.to_pickle(self._path(date))
+        logger.info(f"特徵庫已寫入: {date} ({len(day)} 筆)")
+
+    def list_dates(self, after: str = None, until: str = None) -> List[str]:
+        """列出特徵庫中的日期（after 不含，until 含）"""
+        dates = sorted(f[:-4] for f in os.listdir(self.store_dir) if f.endswith('.pkl'))
+        if after:
+            dates = [d for d in dates if d > after]
+        if until:
+            dates = [d for d in dates if d <= until]
+        return dates
+
+    def load(self, dates: List[str]) -> Tuple[pd.DataFrame, pd.Series]:
+        """載入指定日期的特徵與標籤"""
+        frames = [pd.read_pickle(self._path(d)) for d in dates]
+        if not frames:
+            return pd.DataFrame(), pd.Series(dtype=float)
+
+        data = pd.concat(frames)
+        y = data.pop('__target__')
+        return data, y
 
 
 # ==================== ML 模型包裝器 ====================
@@ -315,9 +405,14 @@ class MLModelWrapper:
         """
         self.model_type = model_type
         self.model = None
-        self.scaler = StandardScaler() if SKLEARN_AVAILABLE else None
+        self.scaler = None
+        if SKLEARN_AVAILABLE:
+            from sklearn.preprocessing import StandardScaler
+            self.scaler = StandardScaler()
         self.feature_names = []
         self.is_trained = False
+        self.version = None  # 由 ModelRegistry 載入時設定
+        self.trained_through = None  # 已納入訓練的最後日期 (YYYY-MM-DD)
 
         self._init_model()
 
@@ -335,6 +430,7 @@ class MLModelWrapper:
                 self.model_type = 'simple'
 
         if self.model_type == 'xgboost' and XGBOOST_AVAILABLE:
+            import xgboost as xgb
             self.model = xgb.XGBClassifier(
                 n_estimators=100,
                 max_depth=5,
@@ -348,6 +444,7 @@ class MLModelWrapper:
             logger.info("使用 XGBoost 模型")
 
         elif self.model_type == 'lightgbm' and LIGHTGBM_AVAILABLE:
+            import lightgbm as lgb
             self.model = lgb.LGBMClassifier(
                 n_estimators=100,
                 max_depth=5,
@@ -360,6 +457,7 @@ class MLModelWrapper:
             logger.info("使用 LightGBM 模型")
 
         elif self.model_type == 'random_forest' and SKLEARN_AVAILABLE:
+            from sklearn.ensemble import RandomForestClassifier
             self.model = RandomForestClassifier(
                 n_estimators=100,
                 max_depth=10,
@@ -369,6 +467,7 @@ class MLModelWrapper:
             logger.info("使用 Random Forest 模型")
 
         elif self.model_type == 'gradient_boosting' and SKLEARN_AVAILABLE:
+            from sklearn.ensemble import GradientBoostingClassifier
             self.model = GradientBoostingClassifier(
                 n_estimators=100,
                 max_depth=5,
@@ -382,10 +481,14 @@ class MLModelWrapper:
             self.model = None
 
     def train(self, X: pd.DataFrame, y: pd.Series,
-              test_size: float = 0.2) -> Dict[str, float]:
+              test_size: float = 0.2, through: str = None) -> Dict[str, float]:
         """
         訓練模型
 
+        Args:
+            through: 訓練資料的最後日期 (YYYY-MM-DD)；未提供時由日期索引推得，
+                     之後的 update_from_store 只讀取此日期之後的特徵庫資料
+
         Returns:
             Dict: 訓練指標
         """
@@ -408,6 +511,7 @@ class MLModelWrapper:
 
         # 分割數據
         if SKLEARN_AVAILABLE:
+            from sklearn.model_selection import train_test_split
             X_train, X_test, y_train, y_test = train_test_split(
                 X_scaled, y_clean, test_size=test_size, shuffle=False
             )
@@ -417,7 +521,9 @@ class MLModelWrapper:
             y_train, y_test = y_clean.iloc[:split_idx], y_clean.iloc[split_idx:]
 
         # 訓練
-        if self.model:
+        if self.model is not None:
+            from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+
             self.model.fit(X_train, y_train)
             y_pred = self.model.predict(X_test)
 
@@ -431,12 +537,117 @@ class MLModelWrapper:
             }
 
             self.is_trained = True
+            if through is None and isinstance(X_clean.index, pd.DatetimeIndex):
+                through = X_clean.index.max().strftime('%Y-%m-%d')
+            self.trained_through = through
             logger.info(f"模型訓練完成 - 準確率: {metrics['accuracy']:.4f}")
 
             return metrics
         else:
             return {'accuracy': 0, 'error': 'no_model'}
 
+    def supports_incremental(self) -> bool:
+        """是否支援增量更新"""
+        if self.model is None:
+            return False
+        if hasattr(self.model, 'partial_fit'):
+            return True
+        return self.model_type in ('xgboost', 'lightgbm', 'random_forest', 'gradient_boosting')
+
+    def update(self, X: pd.DataFrame, y: pd.Series,
+               n_new_estimators: int = 10, min_rows: int = 20) -> Dict[str, Any]:
+        """
+        增量更新模型（只使用新資料，不重新訓練全部歷史）
+
+        - 支援 partial_fit 的模型：直接 partial_fit
+        - XGBoost / LightGBM：以現有 booster 為起點追加 boosting rounds
+        - Gradient Boosting / Random Forest：warm_start 追加 n_new_estimators 棵樹
+
+        標準化器維持不變，避免改變既有樹的輸入分佈。
+
+        Returns:
+            Dict: 更新資訊
+        """
+        if not self.is_trained:
+            logger.info("模型尚未訓練，改為完整訓練")
+            return self.train(X, y)
+
+        if not self.supports_incremental():
+            return {'updated': False, 'error': 'incremental_not_supported'}
+
+        valid_idx = ~(X.isna().any(axis=1) | y.isna())
+        X_clean = X.loc[valid_idx, self.feature_names]
+        y_clean = y[valid_idx]
+
+        if len(X_clean) < min_rows:
+            logger.warning(f"增量資料不足 ({len(X_clean)} 筆)")
+            return {'updated': False, 'error': 'insufficient_data', 'rows': len(X_clean)}
+
+        # 新資料必須涵蓋相同類別，否則 sklearn 會重新編碼類別導致模型錯亂
+        classes = getattr(self.model, 'classes_', None)
+        if classes is not None and set(np.unique(y_clean)) != set(classes):
+            logger.warning("增量資料類別與模型不符，略過本次更新")
+            return {'updated': False, 'error': 'class_mismatch', 'rows': len(X_clean)}
+
+        X_scaled = self.scaler.transform(X_clean) if self.scaler else X_clean.values
+
+        if hasattr(self.model, 'partial_fit'):
+            self.model.partial_fit(X_scaled, y_clean)
+        elif self.model_type == 'xgboost':
+            self.model.set_params(n_estimators=n_new_estimators)
+            self.model.fit(X_scaled, y_clean, xgb_model=self.model.get_booster())
+        elif self.model_type == 'lightgbm':
+            self.model.set_params(n_estimators=n_new_estimators)
+            self.model.fit(X_scaled, y_clean, init_model=self.model.booster_)
+        else:
+            total = len(self.model.estimators_) + n_new_estimators
+            self.model.set_params(warm_start=True, n_estimators=total)
+            self.model.fit(X_scaled, y_clean)
+
+        logger.info(f"模型增量更新完成 - 新資料 {len(X_clean)} 筆")
+
+        return {'updated': True, 'rows': len(X_clean)}
+
+    def train_from_store(self, store: 'DailyFeatureStore', until: str = None,
+                         test_size: float = 0.2) -> Dict[str, Any]:
+        """以每日特徵庫中 until（含）之前的全部資料完整訓練，並記錄 trained_through"""
+        dates = store.list_dates(until=until)
+        if not dates:
+            return {'accuracy': 0, 'error': 'no_data'}
+
+        X, y = store.load(dates)
+        result = self.train(X, y, test_size=test_size, through=dates[-1])
+        result['dates'] = dates
+        return result
+
+    def update_from_store(self, store: 'DailyFeatureStore', until: str = None,
+                          **kwargs) -> Dict[str, Any]:
+        """
+        以每日特徵庫中 trained_through 之後的新資料增量更新
+
+        Args:
+            store: DailyFeatureStore
+            until: 更新到哪一天（含），預設為最新
+        """
+        dates = store.list_dates(after=self.trained_through, until=until)
+        if not dates:
+            return {'updated': False, 'error': 'no_new_data'}
+
+        X, y = store.load(dates)
+        if not self.is_trained:
+            logger.info("模型尚未訓練，改為完整訓練")
+            result = self.train(X, y, through=dates[-1])
+            result['updated'] = self.is_trained
+        else:
+            result = self.update(X, y, **kwargs)
+
+        # 資料不足或類別不齊時不前進，下次連同新資料一起更新
+        if result.get('updated'):
+            self.trained_through = dates[-1]
+        result['dates'] = dates
+
+        return result
+
     def predict(self, X: pd.DataFrame) -> np.ndarray:
         """預測"""
         if not self.is_trained or self.model is None:
@@ -468,6 +679,20 @@ class MLModelWrapper:
 
         return self.model.predict_proba(X_scaled)
 
+    def export_compiled(self, filepath: str = None):
+        """
+        匯出為編譯後的樹模型（僅支援 random_forest / gradient_boosting）
+
+        Returns:
+            CompiledTreeEnsemble，可在不導入 sklearn 的程序中載入推論
+        """
+        from tree_ensemble import CompiledTreeEnsemble
+
+        compiled = CompiledTreeEnsemble.from_wrapper(self)
+        if filepath:
+            compiled.save(filepath)
+        return compiled
+
     def get_feature_importance(self) -> Dict[str, float]:
         """獲取特徵重要性"""
         if not self.is_trained or self.model is None:
@@ -480,13 +705,14 @@ class MLModelWrapper:
         return {}
 
     def save_model(self, filepath: str):
-        """保存模型"""
+        """保存模型（單檔 pickle；版本化保存請使用 model_registry.ModelRegistry）"""
         model_data = {
             'model': self.model,
             'scaler': self.scaler,
             'feature_names': self.feature_names,
             'model_type': self.model_type,
-            'is_trained': self.is_trained
+            'is_trained': self.is_trained,
+            'trained_through': self.trained_through
         }
         with open(filepath, 'wb') as f:
             pickle.dump(model_data, f)
@@ -501,8 +727,30 @@ class MLModelWrapper:
         self.feature_names = model_data['feature_names']
         self.model_type = model_data['model_type']
         self.is_trained = model_data['is_trained']
+        self.trained_through = model_data.get('trained_through')  # 舊版檔案沒有此欄位
         logger.info(f"模型已載入: {filepath}")
 
+    @classmethod
+    def from_artifact(cls, artifact: Dict[str, Any], version: str = None) -> 'MLModelWrapper':
+        """
+        由已訓練的模型產物建立包裝器（ModelRegistry 載入用）
+
+        產物中的模型與 scaler 直接沿用，不會重新初始化或建立新的 StandardScaler。
+
+        Args:
+            artifact: {'model', 'scaler', 'feature_names', 'model_type', 'trained_through'}
+            version: 註冊表中的版本號
+        """
+        wrapper = cls.__new__(cls)
+        wrapper.model = artifact['model']
+        wrapper.scaler = artifact['scaler']
+        wrapper.feature_names = artifact['feature_names']
+        wrapper.model_type = artifact['model_type']
+        wrapper.is_trained = True
+        wrapper.version = version
+        wrapper.trained_through = artifact.get('trained_through')
+        return wrapper
+
 
 # ==================== 集成預測器 ====================
 
@@ -17,10 +17,14 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 import logging
 import warnings
+import indicator_kernels
 warnings.filterwarnings('ignore')
 
 logger = logging.getLogger(__name__)
 
+# 模型註冊表啟用模型的分數在最終評分中的權重（沒有註冊模型時不影響評分）
+REGISTERED_MODEL_WEIGHT = 0.3
+
 # ==================== 增強版技術指標計算器 ====================
 
 class AdvancedTechnicalIndicators:
@@ -120,14 +124,8 @@ class AdvancedTechnicalIndicators:
         """
         商品通道指標 CCI - 識別趨勢強度
         """
-        typical_price = (high + low + close) / 3
-        sma = typical_price.rolling(window=period).mean()
-        mean_deviation = typical_price.rolling(window=period).apply(
-            lambda x: np.abs(x - x.mean()).mean()
-        )
-
-        cci = (typical_price - sma) / (0.015 * mean_deviation)
-        return cci
+        cci = indicator_kernels.cci(high.values, low.values, close.values, period)
+        return pd.Series(cci, index=close.index)
 
     @staticmethod
     def calculate_adx(high: pd.Series, low: pd.Series, close: pd.Series,
@@ -135,22 +133,8 @@ class AdvancedTechnicalIndicators:
         """
         平均趨向指數 ADX - 衡量趨勢強度
         """
-        plus_dm = high.diff()
-        minus_dm = low.diff().abs() * -1
-
-        plus_dm[plus_dm < 0] = 0
-        minus_dm[minus_dm > 0] = 0
-        minus_dm = minus_dm.abs()
-
-        atr = AdvancedTechnicalIndicators.calculate_atr(high, low, close, period)
-
-        plus_di = 100 * (plus_dm.rolling(window=period).mean() / atr)
-        minus_di = 100 * (minus_dm.rolling(window=period).mean() / atr)
-
-        dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
-        adx = dx.rolling(window=period).mean()
-
-        return {'adx': adx, 'plus_di': plus_di, 'minus_di': minus_di}
+        result = indicator_kernels.adx(high.values, low.values, close.values, period)
+        return {key: pd.Series(values, index=close.index) for key, values in result.items()}
 
     @staticmethod
     def calculate_vwap(high: pd.Series, low: pd.Series, close: pd.Series,
@@ -168,21 +152,9 @@ class AdvancedTechnicalIndicators:
         """
         資金流量指標 MFI - 結合量價的RSI
         """
-        typical_price = (high + low + close) / 3
-        money_flow = typical_price * volume
-
-        positive_flow = pd.Series(0.0, index=close.index)
-        negative_flow = pd.Series(0.0, index=close.index)
-
-        tp_diff = typical_price.diff()
-        positive_flow[tp_diff > 0] = money_flow[tp_diff > 0]
-        negative_flow[tp_diff < 0] = money_flow[tp_diff < 0]
-
-        positive_mf = positive_flow.rolling(window=period).sum()
-        negative_mf = negative_flow.rolling(window=period).sum()
-
-        mfi = 100 - (100 / (1 + positive_mf / negative_mf.replace(0, 1)))
-        return mfi
+        mfi = indicator_kernels.money_flow_index(high.values, low.values, close.values,
+                                                 volume.values, period)
+        return pd.Series(mfi, index=close.index)
 
     @staticmethod
     def detect_divergence(price: pd.Series, indicator: pd.Series,
@@ -190,29 +162,8 @@ class AdvancedTechnicalIndicators:
         """
         檢測背離 - 價格與指標的背離現象
         """
-        if len(price) < lookback:
-            return {'bullish_divergence': False, 'bearish_divergence': False}
-
-        recent_price = price.iloc[-lookback:]
-        recent_indicator = indicator.iloc[-lookback:]
-
-        # 找局部低點和高點
-        price_min_idx = recent_price.idxmin()
-        price_max_idx = recent_price.idxmax()
-
-        # 牛市背離：價格創新低，指標未創新低
-        bullish_div = False
-        if price_min_idx == recent_price.index[-1]:  # 價格在最近創新低
-            if recent_indicator.iloc[-1] > recent_indicator.min():  # 指標未創新低
-                bullish_div = True
-
-        # 熊市背離：價格創新高，指標未創新高
-        bearish_div = False
-        if price_max_idx == recent_price.index[-1]:  # 價格在最近創新高
-            if recent_indicator.iloc[-1] < recent_indicator.max():  # 指標未創新高
-                bearish_div = True
-
-        return {'bullish_divergence': bullish_div, 'bearish_divergence': bearish_div}
+        # 牛市背離：價格創新低，指標未創新低；熊市背離：價格創新高，指標未創新高
+        return indicator_kernels.divergence(price.values, indicator.values, lookback)
 
 
 # ==================== 多時間框架分析器 ====================
@@ -463,10 +414,15 @@ class MLStockPredictor:
     使用集成學習方法結合多種模型
     """
 
-    def __init__(self):
+    def __init__(self, model_name: str = 'default'):
+        """
+        Args:
+            model_name: 模型註冊表中的模型名稱；有啟用版本時與規則評分混合
+        """
         self.feature_calculator = AdvancedTechnicalIndicators()
         self.mtf_analyzer = MultiTimeframeAnalyzer()
         self.sentiment_analyzer = MarketSentimentAnalyzer()
+        self.model_name = model_name
 
         # 特徵權重（基於歷史回測優化）
         self.feature_weights = {
@@ -638,6 +594,12 @@ class MLStockPredictor:
 
         final_score = weighted_score / total_weight if total_weight > 0 else 0.5
 
+        # 註冊表啟用模型的預測（常駐程序不需重啟即可換上新版本）
+        model_prediction = self._registered_model_prediction(df)
+        if model_prediction is not None:
+            final_score = (final_score * (1 - REGISTERED_MODEL_WEIGHT)
+                           + model_prediction['score'] * REGISTERED_MODEL_WEIGHT)
+
         # 計算信心度
         confidence = self._calculate_confidence(features, df)
 
@@ -653,9 +615,50 @@ class MLStockPredictor:
             'risk_level': prediction['risk_level'],
             'features': features,
             'recommendation': prediction['recommendation'],
-            'reasoning': prediction['reasoning']
+            'reasoning': prediction['reasoning'],
+            'model_prediction': model_prediction
         }
 
+    def _registered_model_prediction(self, df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """
+        模型註冊表中啟用版本的預測
+
+        每次都經由 get_active 取得模型：只檢查 manifest 修改時間，啟用版本變更時自動熱切換。
+
+        Returns:
+            {'version', 'up', 'down', 'score'}；沒有註冊模型或特徵不足時返回 None
+        """
+        from model_registry import JOBLIB_AVAILABLE, registry_exists, get_registry
+        if not JOBLIB_AVAILABLE or not registry_exists():
+            return None
+
+        try:
+            wrapper = get_registry().get_active(self.model_name)
+            if wrapper is None:
+                return None
+
+            from ml_models import FeatureEngineer
+            features = FeatureEngineer().create_features(df).tail(1)
+            if len(features) == 0 or not all(f in features.columns for f in wrapper.feature_names):
+                return None
+            X = features[wrapper.feature_names]
+            if X.isna().any(axis=1).iloc[0]:
+                return None
+
+            proba = wrapper.predict_proba(X)[0]
+            classes = list(getattr(wrapper.model, 'classes_', [-1, 0, 1]))
+            up = float(proba[classes.index(1)]) if 1 in classes else 0.0
+            down = float(proba[classes.index(-1)]) if -1 in classes else 0.0
+            return {
+                'version': wrapper.version,
+                'up': round(up, 4),
+                'down': round(down, 4),
+                'score': round(0.5 + (up - down) / 2, 4),
+            }
+        except Exception as e:
+            logger.debug(f"註冊模型預測失敗（僅使用規則評分）: {e}")
+            return None
+
     def _calculate_confidence(self, features: Dict[str, float], df: pd.DataFrame) -> float:
         """
         計算預測信心度
@@ -0,0 +1,338 @@
+"""
+model_registry.py - 版本化模型註冊表
+管理 MLModelWrapper 訓練產物的版本、清單與載入
+
+功能：
+1. 以 joblib 保存模型產物（不壓縮，大型陣列可 memory-map）
+2. manifest.json 記錄版本、特徵集雜湊、訓練區間與評估指標
+3. 延遲載入 - 只有在第一次使用時才讀取模型產物
+4. 熱切換 - 常駐程序偵測到 manifest 變更時自動換上新的啟用版本
+
+目錄結構：
+    models/
+        manifest.json
+        <name>/<version>/model.joblib
+"""
+
+import os
+import json
+import time
+import hashlib
+import importlib.util
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# joblib 延遲到保存 / 載入模型時才導入
+JOBLIB_AVAILABLE = importlib.util.find_spec('joblib') is not None
+if not JOBLIB_AVAILABLE:
+    logger.warning("joblib 未安裝，模型註冊表無法使用")
+
+MODEL_REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+MANIFEST_FILENAME = 'manifest.json'
+ARTIFACT_FILENAME = 'model.joblib'
+
+# manifest 跨程序鎖：超過此秒數仍未釋放的鎖檔視為殘留（持有的程序已中止）
+MANIFEST_LOCK_STALE_SECONDS = 30
+
+
+def feature_set_hash(feature_names: List[str]) -> str:
+    """計算特徵集雜湊（特徵名稱與順序皆相同才會一致）"""
+    joined = '\n'.join(str(name) for name in feature_names)
+    return hashlib.sha1(joined.encode('utf-8')).hexdigest()[:16]
+
+
+def registry_exists(registry_dir: str = None) -> bool:
+    """註冊表是否已有 manifest（只檢查檔案，不建立目錄）"""
+    return os.path.exists(os.path.join(registry_dir or MODEL_REGISTRY_DIR, MANIFEST_FILENAME))
+
+
+class ModelRegistry:
+    """
+    模型註冊表
+
+    同一個 registry_dir 可被多個工作程序共用：
+    - 產物以 mmap_mode='r' 載入，作業系統只保留一份模型陣列在記憶體
+    - get_active() 會以 manifest 的修改時間判斷是否需要熱切換
+    - 版本號以原子建立版本目錄取得，manifest 的讀取-修改-寫入以鎖檔保護，
+      多個程序同時註冊不會拿到同一個版本或互相覆蓋
+    """
+
+    def __init__(self, registry_dir: str = None, mmap_mode: Optional[str] = 'r'):
+        """
+        Args:
+            registry_dir: 註冊表目錄（預設為專案下的 models/）
+            mmap_mode: 傳給 joblib.load 的 mmap_mode，None 表示完整讀入記憶體
+        """
+        self.registry_dir = registry_dir or MODEL_REGISTRY_DIR
+        self.manifest_path = os.path.join(self.registry_dir, MANIFEST_FILENAME)
+        self.mmap_mode = mmap_mode
+
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_mtime = None
+        # 已載入的啟用模型: {name: (version, MLModelWrapper)}
+        self._active_cache = {}
+
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+    # ---------- manifest ----------
+
+    def _read_manifest(self, force: bool = False) -> Dict[str, Any]:
+        """讀取 manifest（檔案未變更時直接使用快取；force=True 時一律重新讀取）"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest, self._manifest_mtime = {'models': {}}, None
+            return self._manifest
+
+        if force or self._manifest is None or mtime != self._manifest_mtime:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+                self._manifest_mtime = mtime
+            except (OSError, ValueError) as e:
+                logger.warning(f"讀取模型清單失敗: {e}")
+                if self._manifest is None:
+                    self._manifest = {'models': {}}
+
+        return self._manifest
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        """原子寫入 manifest，避免其他程序讀到寫一半的檔案"""
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+        self._manifest = manifest
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    @contextmanager
+    def _manifest_lock(self, timeout: float = 60):
+        """
+        manifest 的跨程序鎖（以 O_EXCL 建立鎖檔）
+
+        取得鎖後重新讀取 manifest，修改並寫回後才釋放，其他程序的更新不會被覆蓋。
+        """
+        lock_path = f"{self.manifest_path}.lock"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock_path).st_mtime > MANIFEST_LOCK_STALE_SECONDS:
+                        logger.warning(f"移除殘留的模型清單鎖: {lock_path}")
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"等待模型清單鎖逾時: {lock_path}")
+                time.sleep(0.05)
+
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield self._read_manifest(force=True)
+        finally:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def _allocate_version(self, name: str, entry: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        取得新版本號並建立版本目錄
+
+        以 os.mkdir 原子建立目錄，目錄已存在（其他程序同時註冊）時改用下一個版本號。
+
+        Returns:
+            (版本號, 版本目錄)
+        """
+        model_dir = os.path.join(self.registry_dir, name)
+        os.makedirs(model_dir, exist_ok=True)
+
+        existing = set(entry['versions']) | set(os.listdir(model_dir))
+        number = max((int(v[1:]) for v in existing if v.startswith('v') and v[1:].isdigit()),
+                     default=0) + 1
+        while True:
+            version = f"v{number:04d}"
+            version_dir = os.path.join(model_dir, version)
+            try:
+                os.mkdir(version_dir)
+                return version, version_dir
+            except FileExistsError:
+                number += 1
+
+    def get_manifest(self) -> Dict[str, Any]:
+        """獲取 manifest 內容"""
+        with self._lock:
+            return self._read_manifest()
+
+    def list_versions(self, name: str = 'default') -> List[Dict[str, Any]]:
+        """列出模型所有版本（依版本號排序）"""
+        with self._lock:
+            entry = self._read_manifest()['models'].get(name, {})
+            versions = entry.get('versions', {})
+            return [versions[v] for v in sorted(versions)]
+
+    def get_active_version(self, name: str = 'default') -> Optional[str]:
+        """獲取目前啟用的版本號"""
+        with self._lock:
+            return self._read_manifest()['models'].get(name, {}).get('active')
+
+    # ---------- 註冊 / 啟用 ----------
+
+    def register(self, wrapper, name: str = 'default',
+                 training_window: Tuple[str, str] = None,
+                 metrics: Dict[str, Any] = None,
+                 activate: bool = True) -> str:
+        """
+        註冊新模型版本
+
+        Args:
+            wrapper: 已訓練的 MLModelWrapper
+            name: 模型名稱（例如 'short_term', 'long_term'）
+            training_window: (起始日, 結束日)，格式 YYYY-MM-DD
+            metrics: 訓練評估指標（train() 的回傳值）
+            activate: 是否立即設為啟用版本
+
+        Returns:
+            str: 新版本號
+        """
+        if not JOBLIB_AVAILABLE:
+            raise RuntimeError("joblib 未安裝，無法註冊模型")
+        if not wrapper.is_trained:
+            raise ValueError("模型尚未訓練，無法註冊")
+
+        with self._lock:
+            entry = self._read_manifest()['models'].get(name, {'versions': {}})
+            version, version_dir = self._allocate_version(name, entry)
+
+            # 不壓縮保存，載入時才能 memory-map
+            artifact = {
+                'model': wrapper.model,
+                'scaler': wrapper.scaler,
+                'feature_names': wrapper.feature_names,
+                'model_type': wrapper.model_type,
+                'trained_through': getattr(wrapper, 'trained_through', None),
+            }
+            artifact_path = os.path.join(version_dir, ARTIFACT_FILENAME)
+            import joblib
+            joblib.dump(artifact, artifact_path)
+
+            info = {
+                'version': version,
+                'model_type': wrapper.model_type,
+                'feature_hash': feature_set_hash(wrapper.feature_names),
+                'feature_count': len(wrapper.feature_names),
+                'training_window': list(training_window) if training_window else None,
+                'trained_through': artifact['trained_through'],
+                'metrics': {k: v for k, v in (metrics or {}).items()
+                            if isinstance(v, (int, float, str))},
+                'artifact': os.path.relpath(artifact_path, self.registry_dir),
+                'created_at': datetime.now().isoformat(),
+            }
+
+            with self._manifest_lock() as manifest:
+                entry = manifest['models'].setdefault(name, {'active': None, 'versions': {}})
+                entry['versions'][version] = info
+                if activate or entry['active'] is None:
+                    entry['active'] = version
+                self._write_manifest(manifest)
+
+        logger.info(f"模型已註冊: {name} {version}")
+        return version
+
+    def activate(self, name: str, version: str):
+        """切換啟用版本（其他程序會在下次 get_active 時熱切換）"""
+        with self._lock, self._manifest_lock() as manifest:
+            entry = manifest['models'].get(name)
+            if not entry or version not in entry['versions']:
+                raise KeyError(f"找不到模型版本: {name} {version}")
+
+            entry['active'] = version
+            self._write_manifest(manifest)
+
+        logger.info(f"模型啟用版本已切換: {name} -> {version}")
+
+    # ---------- 載入 ----------
+
+    def load(self, name: str = 'default', version: str = None):
+        """
+        載入指定版本（預設為啟用版本）
+
+        Returns:
+            MLModelWrapper
+        """
+        if not JOBLIB_AVAILABLE:
+            raise RuntimeError("joblib 未安裝，無法載入模型")
+
+        from ml_models import MLModelWrapper
+
+        with self._lock:
+            entry = self._read_manifest()['models'].get(name)
+            if not entry:
+                raise KeyError(f"找不到模型: {name}")
+
+            version = version or entry['active']
+            info = entry['versions'].get(version)
+            if info is None:
+                raise KeyError(f"找不到模型版本: {name} {version}")
+
+        artifact_path = os.path.join(self.registry_dir, info['artifact'])
+        import joblib
+        artifact = joblib.load(artifact_path, mmap_mode=self.mmap_mode)
+
+        if feature_set_hash(artifact['feature_names']) != info['feature_hash']:
+            raise ValueError(f"模型特徵集與清單不符: {name} {version}")
+
+        wrapper = MLModelWrapper.from_artifact(artifact, version=version)
+
+        logger.info(f"模型已載入: {name} {version}")
+        return wrapper
+
+    def get_active(self, name: str = 'default'):
+        """
+        獲取啟用中的模型（延遲載入 + 熱切換）
+
+        每次呼叫只檢查 manifest 的修改時間；啟用版本變更時才重新載入，
+        常駐程序不需重啟即可換上新模型。
+
+        Returns:
+            MLModelWrapper 或 None（尚未註冊任何版本）
+        """
+        with self._lock:
+            active_version = self.get_active_version(name)
+            if active_version is None:
+                return None
+
+            cached = self._active_cache.get(name)
+            if cached and cached[0] == active_version:
+                return cached[1]
+
+            wrapper = self.load(name, active_version)
+            if cached:
+                logger.info(f"模型熱切換: {name} {cached[0]} -> {active_version}")
+            self._active_cache[name] = (active_version, wrapper)
+            return wrapper
+
+
+# ==================== 簡易整合函數 ====================
+
+# 全局註冊表實例
+_registry = None
+
+def get_registry() -> ModelRegistry:
+    """獲取註冊表實例"""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
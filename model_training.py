@@ -0,0 +1,220 @@
+"""
+model_training.py - 模型訓練與每日增量更新
+完整訓練後註冊為新版本；之後每晚把標籤剛成熟的交易日特徵寫入每日特徵庫，並只以新資料增量更新啟用模型
+
+功能：
+1. 完整訓練 - 補寫特徵庫後以全部資料訓練，註冊並啟用為新版本（首次部署或定期重訓）
+2. 特徵入庫 - 對每支股票計算特徵，取 forward_days 個交易日前（標籤剛成熟）的資料列，
+   依日期寫入 DailyFeatureStore（每日一個檔案）
+3. 增量更新 - 載入啟用版本，只讀取 trained_through 之後的特徵庫資料更新，
+   每晚的成本與一天的資料量成正比
+4. 版本註冊 - 訓練或更新後註冊為新版本並啟用，常駐程序經由 get_active 自動熱切換
+
+使用方式：
+    python model_training.py train --backfill 60     # 首次部署：補寫 60 個交易日並完整訓練
+    python model_training.py update                  # 每晚收盤後執行
+    python model_training.py update --backfill 20    # 補寫最近 20 個成熟交易日
+
+環境變數：
+    MODEL_TRAINING_CODES  以逗號分隔的訓練股票代碼（預設為 DEFAULT_TRAINING_CODES）
+    MODEL_TRAINING_NAME   註冊表中的模型名稱（預設 default）
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict, List, Any, Tuple
+import logging
+
+import pandas as pd
+
+from ml_models import FeatureEngineer, DailyFeatureStore, MLModelWrapper
+from model_registry import JOBLIB_AVAILABLE, ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRAINING_CODES = ['2330', '2317', '2454', '2308', '2382', '2881', '2882', '2891',
+                          '2412', '1301', '1303', '2002', '2303', '3711', '2886']
+TRAINING_CODES = [code.strip() for code in
+                  os.getenv('MODEL_TRAINING_CODES', ','.join(DEFAULT_TRAINING_CODES)).split(',')
+                  if code.strip()]
+MODEL_NAME = os.getenv('MODEL_TRAINING_NAME', 'default')
+
+FORWARD_DAYS = 5       # 標籤的向前天數（與 FeatureEngineer.create_target 預設一致）
+HISTORY_DAYS = 120     # 計算特徵所需的歷史天數（含均線暖機）
+
+
+# ==================== 特徵入庫 ====================
+
+def matured_day_rows(histories: Dict[str, pd.DataFrame], forward_days: int = FORWARD_DAYS,
+                     days: int = 1) -> Dict[str, Tuple[pd.DataFrame, pd.Series]]:
+    """
+    各股票最近 days 個標籤已成熟交易日的特徵列
+
+    第 i 列的標籤需要第 i + forward_days 列的收盤價，因此只取倒數第 forward_days + 1 列（含）之前。
+    歷史不足以計算完整特徵（create_features 返回空表）的股票略過。
+
+    Args:
+        histories: {股票代碼: 以日期為索引的歷史價格}
+
+    Returns:
+        {日期 YYYY-MM-DD: (特徵（以股票代碼為索引）, 標籤)}
+    """
+    engineer = FeatureEngineer()
+    rows = {}
+    for code, history in histories.items():
+        if history is None or len(history) <= forward_days:
+            continue
+
+        features = engineer.create_features(history)
+        target = engineer.create_target(history, forward_days)
+        last = len(history) - forward_days
+        for index in history.index[max(last - days, 0):last]:
+            # 特徵會移除暖機期的空值列，以日期對齊而非位置
+            if index not in features.index:
+                continue
+            date = pd.Timestamp(index).strftime('%Y-%m-%d')
+            rows.setdefault(date, []).append((code, features.loc[index], target.loc[index]))
+
+    day_rows = {}
+    for date, items in rows.items():
+        X = pd.DataFrame([row for _, row, _ in items], index=[code for code, _, _ in items])
+        y = pd.Series([label for _, _, label in items], index=X.index)
+        day_rows[date] = (X, y)
+    return day_rows
+
+
+def append_matured_days(store: DailyFeatureStore, histories: Dict[str, pd.DataFrame],
+                        forward_days: int = FORWARD_DAYS, days: int = 1) -> List[str]:
+    """把標籤已成熟的交易日寫入特徵庫，返回寫入的日期"""
+    day_rows = matured_day_rows(histories, forward_days, days)
+    for date in sorted(day_rows):
+        X, y = day_rows[date]
+        store.append_day(date, X, y)
+    return sorted(day_rows)
+
+
+def fetch_histories(codes: List[str], days: int = HISTORY_DAYS, fetcher=None) -> Dict[str, pd.DataFrame]:
+    """抓取訓練股票的歷史價格（失敗或無資料的股票略過）"""
+    if fetcher is None:
+        from historical_data_fetcher import HistoricalDataFetcher
+        fetcher = HistoricalDataFetcher()
+
+    histories = {}
+    for code in codes:
+        try:
+            history = fetcher.get_stock_history(code, days=days)
+        except Exception as e:
+            logger.warning(f"歷史數據獲取失敗: {code} - {e}")
+            continue
+        if history is not None and len(history) > 0:
+            histories[code] = history
+    return histories
+
+
+# ==================== 完整訓練 ====================
+
+def run_full_training(codes: List[str] = None, model_name: str = MODEL_NAME,
+                      model_type: str = 'auto', backfill: int = 60,
+                      forward_days: int = FORWARD_DAYS, store: DailyFeatureStore = None,
+                      registry: ModelRegistry = None, fetcher=None) -> Dict[str, Any]:
+    """
+    補寫特徵庫後以全部資料完整訓練，註冊並啟用為新版本
+
+    Returns:
+        train() 的回傳值，另含 'appended', 'dates', 'version'
+    """
+    store = store or DailyFeatureStore()
+    registry = registry or ModelRegistry(mmap_mode=None)
+
+    # 歷史需涵蓋補寫天數、標籤向前天數與特徵暖機期
+    history_days = max(HISTORY_DAYS, backfill + forward_days + 60)
+    histories = fetch_histories(codes or TRAINING_CODES, days=history_days, fetcher=fetcher)
+    appended = append_matured_days(store, histories, forward_days, backfill)
+    logger.info(f"特徵庫已寫入 {len(appended)} 個交易日")
+
+    wrapper = MLModelWrapper(model_type)
+    result = wrapper.train_from_store(store)
+    result['appended'] = appended
+    result['version'] = None
+
+    if not wrapper.is_trained:
+        logger.warning(f"模型訓練失敗，未註冊新版本: {result.get('error')}")
+        return result
+
+    dates = result['dates']
+    result['version'] = registry.register(wrapper, model_name,
+                                          training_window=(dates[0], dates[-1]),
+                                          metrics=result)
+    logger.info(f"模型已訓練至 {wrapper.trained_through}，新版本 {result['version']}")
+    return result
+
+
+# ==================== 每日增量更新 ====================
+
+def run_nightly_update(codes: List[str] = None, model_name: str = MODEL_NAME,
+                       backfill: int = 1, forward_days: int = FORWARD_DAYS,
+                       store: DailyFeatureStore = None, registry: ModelRegistry = None,
+                       fetcher=None) -> Dict[str, Any]:
+    """
+    每晚的特徵入庫 + 增量更新
+
+    Returns:
+        {'appended': [日期], 'updated': bool, 'version': 新版本號或 None, ...}
+    """
+    store = store or DailyFeatureStore()
+    # 更新會修改模型，完整讀入記憶體而非 memory-map
+    registry = registry or ModelRegistry(mmap_mode=None)
+
+    histories = fetch_histories(codes or TRAINING_CODES, fetcher=fetcher)
+    appended = append_matured_days(store, histories, forward_days, backfill)
+    logger.info(f"特徵庫已寫入 {len(appended)} 個交易日: {', '.join(appended)}")
+
+    if registry.get_active_version(model_name) is None:
+        logger.warning(f"註冊表中沒有啟用的模型 {model_name}，略過增量更新")
+        return {'appended': appended, 'updated': False, 'error': 'no_active_model', 'version': None}
+
+    wrapper = registry.load(model_name)
+    result = wrapper.update_from_store(store)
+    result['appended'] = appended
+    result['version'] = None
+
+    if result.get('updated'):
+        result['version'] = registry.register(wrapper, model_name, metrics=result)
+        logger.info(f"模型已增量更新至 {wrapper.trained_through}，新版本 {result['version']}")
+    else:
+        logger.info(f"模型未更新: {result.get('error')}")
+
+    return result
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='模型訓練與每日增量更新')
+    parser.add_argument('command', choices=['train', 'update'], help='執行命令')
+    parser.add_argument('--model', default=MODEL_NAME, help='註冊表中的模型名稱')
+    parser.add_argument('--codes', help='以逗號分隔的股票代碼（預設 MODEL_TRAINING_CODES）')
+    parser.add_argument('--backfill', type=int, help='寫入最近幾個成熟交易日（train 預設 60，update 預設 1）')
+    parser.add_argument('--model-type', default='auto', help='train 使用的模型類型')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not JOBLIB_AVAILABLE:
+        print("❌ joblib 未安裝，無法使用模型註冊表")
+        return 1
+
+    codes = [code.strip() for code in args.codes.split(',')] if args.codes else None
+    if args.command == 'train':
+        result = run_full_training(codes, args.model, args.model_type, backfill=args.backfill or 60)
+    else:
+        result = run_nightly_update(codes, args.model, backfill=args.backfill or 1)
+
+    print(f"📦 特徵庫寫入: {len(result['appended'])} 個交易日")
+    if result.get('version'):
+        print(f"✅ 模型已註冊並啟用 {args.model} {result['version']}")
+        return 0
+    print(f"ℹ️ 模型未註冊新版本: {result.get('error')}")
+    return 0 if args.command == 'update' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
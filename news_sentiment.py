@@ -3,38 +3,114 @@ news_sentiment.py - 新聞情緒分析系統
 爬取財經新聞並分析市場情緒
 
 功能：
-1. 多來源新聞爬取（Yahoo 財經、鉅亨網、經濟日報等）
+1. 多來源新聞爬取（Yahoo 財經、鉅亨網、經濟日報等，可並行並設定整體截止時間）
 2. 中文情緒分析
-3. 股票相關新聞過濾
+3. 股票相關新聞過濾（共用新聞池 + 代碼 / 名稱倒排索引）
 4. 情緒分數計算
+5. 新聞快取 - 各來源游標只處理新標題，每條新聞的情緒分數只計算一次
+   （分數記錄分析器版本，演算法或詞典改變後自動重新計算）
 """
 
+import os
 import requests
 import re
 import json
+import sqlite3
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup
 import time
 
 logger = logging.getLogger(__name__)
 
-# 嘗試導入 jieba 進行中文分詞
-try:
-    import jieba
-    JIEBA_AVAILABLE = True
-except ImportError:
-    JIEBA_AVAILABLE = False
-    logger.info("jieba 未安裝，使用簡化版本")
+# 情緒分數演算法版本；評分方式改變時遞增，讓新聞快取中的舊分數失效
+# （詞典內容另以雜湊納入版本，修改詞典不需手動遞增）
+# 2: 以 Aho–Corasick 自動機取代 jieba 分詞 / 子字串比對
+SENTIMENT_VERSION = 2
+
+class AhoCorasick:
+    """
+    Aho–Corasick 多模式字串比對
+
+    一次掃描文本即可找出所有出現的模式字串，耗時與模式數量無關。
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: Any = None):
+        """加入模式字串，value 預設為模式本身"""
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((pattern, pattern if value is None else value))
+        self._built = False
+
+    def build(self):
+        """以廣度優先建立失敗連結"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, text: str):
+        """
+        逐一產出比對結果
+
+        Yields:
+            (結束位置, 模式字串, value)，結束位置為模式最後一個字元的索引
+        """
+        if not self._built:
+            self.build()
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern, value in self._output[node]:
+                yield i, pattern, value
 
 
 class ChineseSentimentAnalyzer:
     """
     中文情緒分析器
     使用詞典法進行情緒分析
+
+    詞典（正面詞、負面詞、程度副詞、否定詞）編譯成一個 Aho–Corasick 自動機，
+    一次線性掃描找出所有詞彙，不需要分詞。修改詞典後請呼叫 rebuild_lexicon()。
     """
 
+    # 程度副詞 / 否定詞與情緒詞之間允許的間隔字數
+    MODIFIER_WINDOW = 2
+
     def __init__(self):
         # 正面詞彙（股市相關）
         self.positive_words = {
@@ -78,6 +154,67 @@ class ChineseSentimentAnalyzer:
         # 否定詞
         self.negations = {'不', '沒', '未', '非', '無', '難'}
 
+        self._matcher = None
+        self._version = None
+
+    @property
+    def version(self) -> str:
+        """情緒分數版本（演算法版本 + 詞典雜湊），新聞快取以此判斷分數是否仍有效"""
+        if self._matcher is None:
+            self.rebuild_lexicon()
+        return self._version
+
+    def rebuild_lexicon(self):
+        """由目前的詞典重新編譯自動機"""
+        matcher = AhoCorasick()
+        for word in self.positive_words:
+            matcher.add(word, 'positive')
+        for word in self.negative_words:
+            matcher.add(word, 'negative')
+        for word in self.intensifiers:
+            matcher.add(word, 'intensifier')
+        for word in self.negations:
+            matcher.add(word, 'negation')
+        matcher.build()
+        self._matcher = matcher
+
+        lexicon = json.dumps([sorted(self.positive_words), sorted(self.negative_words),
+                              sorted(self.intensifiers.items()), sorted(self.negations),
+                              self.MODIFIER_WINDOW], ensure_ascii=False)
+        self._version = f"{SENTIMENT_VERSION}-{hashlib.sha1(lexicon.encode('utf-8')).hexdigest()[:8]}"
+
+    def _scan(self, text: str) -> Tuple[List[Tuple[int, int, str, str]], List[Tuple[int, int, str, str]]]:
+        """
+        掃描文本，返回 (情緒詞, 修飾詞)，每項為 (起點, 終點, 詞, 類型)
+
+        情緒詞與修飾詞各自取最左最長且互不重疊的匹配（'大漲' 優先於 '漲'）；
+        與情緒詞重疊的修飾詞捨棄（'大漲' 的 '大' 不算程度副詞）。
+        """
+        if self._matcher is None:
+            self.rebuild_lexicon()
+
+        terms, modifiers = [], []
+        for end, word, kind in self._matcher.iter_matches(text):
+            item = (end - len(word) + 1, end + 1, word, kind)
+            (terms if kind in ('positive', 'negative') else modifiers).append(item)
+
+        terms = self._longest_matches(terms)
+        covered = [(start, end) for start, end, _, _ in terms]
+        modifiers = [m for m in self._longest_matches(modifiers)
+                     if not any(m[0] < end and start < m[1] for start, end in covered)]
+        return terms, modifiers
+
+    @staticmethod
+    def _longest_matches(matches: List[Tuple[int, int, str, str]]) -> List[Tuple[int, int, str, str]]:
+        """最左最長、互不重疊的匹配（'非常' 優先於 '非'）"""
+        selected = []
+        last_end = 0
+        for start, end, word, kind in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+            if start >= last_end:
+                selected.append((start, end, word, kind))
+                last_end = end
+        return selected
+
     def analyze(self, text: str) -> Dict[str, Any]:
         """
         分析文本情緒
@@ -95,11 +232,7 @@ class ChineseSentimentAnalyzer:
         if not text:
             return {'score': 0, 'sentiment': 'neutral', 'confidence': 0}
 
-        # 分詞
-        if JIEBA_AVAILABLE:
-            words = list(jieba.cut(text))
-        else:
-            words = list(text)  # 簡單按字分割
+        terms, modifiers = self._scan(text)
 
         positive_count = 0
         negative_count = 0
@@ -108,49 +241,35 @@ class ChineseSentimentAnalyzer:
         keywords = []
 
         # 計算情緒分數
-        i = 0
-        while i < len(words):
-            word = words[i]
-
-            # 檢查程度副詞
+        modifier_idx = 0
+        prev_term_end = 0
+        for start, end, word, kind in terms:
+            # 修飾詞須在情緒詞前 MODIFIER_WINDOW 字內，且不越過前一個情緒詞
             intensity = 1.0
-            if i > 0 and words[i-1] in self.intensifiers:
-                intensity = self.intensifiers[words[i-1]]
+            negated = False
+            while modifier_idx < len(modifiers) and modifiers[modifier_idx][1] <= start:
+                m_start, m_end, m_word, m_kind = modifiers[modifier_idx]
+                modifier_idx += 1
+                if m_start < prev_term_end or start - m_end > self.MODIFIER_WINDOW:
+                    continue
+                if m_kind == 'negation':
+                    negated = not negated
+                else:
+                    intensity = max(intensity, self.intensifiers[m_word])
+            prev_term_end = end
 
-            # 檢查否定
-            negated = i > 0 and words[i-1] in self.negations
+            # 多字詞組權重較高（與原本雙字詞組的 1.2 倍一致）
+            weight = intensity * (1.2 if len(word) > 1 else 1.0)
+            is_positive = (kind == 'positive') != negated
 
-            if word in self.positive_words:
-                if negated:
-                    negative_count += 1
-                    negative_score += intensity
-                else:
-                    positive_count += 1
-                    positive_score += intensity
-                    keywords.append(word)
-
-            elif word in self.negative_words:
-                if negated:
-                    positive_count += 1
-                    positive_score += intensity
-                else:
-                    negative_count += 1
-                    negative_score += intensity
-                    keywords.append(word)
-
-            # 檢查詞組（兩個字以上）
-            if i < len(words) - 1:
-                bigram = word + words[i+1]
-                if bigram in self.positive_words:
-                    positive_count += 1
-                    positive_score += intensity * 1.2
-                    keywords.append(bigram)
-                elif bigram in self.negative_words:
-                    negative_count += 1
-                    negative_score += intensity * 1.2
-                    keywords.append(bigram)
-
-            i += 1
+            if is_positive:
+                positive_count += 1
+                positive_score += weight
+            else:
+                negative_count += 1
+                negative_score += weight
+            if not negated:
+                keywords.append(word)
 
         # 計算最終分數
         total = positive_score + negative_score
@@ -175,9 +294,193 @@ class ChineseSentimentAnalyzer:
             'confidence': round(confidence, 4),
             'positive_count': positive_count,
             'negative_count': negative_count,
-            'keywords': list(set(keywords))[:10]
+            'keywords': list(dict.fromkeys(keywords))[:10]
         }
 
+    def analyze_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """批次分析多段文本（共用同一個自動機）"""
+        if self._matcher is None:
+            self.rebuild_lexicon()
+        return [self.analyze(text) for text in texts]
+
+
+def article_key(news: Dict) -> str:
+    """新聞去重鍵：優先使用連結，沒有連結時使用標題"""
+    basis = news.get('link') or news.get('title', '')
+    return hashlib.sha1(basis.strip().encode('utf-8')).hexdigest()[:16]
+
+
+class NewsArticleStore:
+    """
+    新聞快取（SQLite）
+
+    以連結雜湊為鍵保存新聞與情緒分析結果，並記錄各來源的「最後看到」游標，
+    重複的盤中掃描只需處理新出現的標題。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            key TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            first_seen TEXT NOT NULL,
+            data TEXT NOT NULL,
+            sentiment TEXT,
+            sentiment_version TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_articles_source ON articles(source, first_seen);
+
+        CREATE TABLE IF NOT EXISTS cursors (
+            source TEXT PRIMARY KEY,
+            last_key TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str, retention_days: int = 30):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        self._migrate_schema()
+        self.lock = threading.RLock()
+        self.prune(retention_days)
+
+    def _migrate_schema(self):
+        """舊版快取補上 sentiment_version 欄位（舊分數沒有版本，視為未快取）"""
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(articles)')}
+        if 'sentiment_version' not in columns:
+            with self.conn:
+                self.conn.execute('ALTER TABLE articles ADD COLUMN sentiment_version TEXT')
+
+    def prune(self, retention_days: int):
+        """刪除超過保留天數的新聞"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM articles WHERE first_seen < ?', (cutoff,))
+
+    # ---------- 游標 ----------
+
+    def get_cursor(self, source: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute('SELECT last_key FROM cursors WHERE source = ?',
+                                    (source,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, source: str, last_key: str):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)',
+                              (source, last_key, datetime.now().isoformat()))
+
+    # ---------- 新聞 ----------
+
+    def known_keys(self, keys: List[str]) -> set:
+        """返回已保存的新聞鍵"""
+        if not keys:
+            return set()
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT key FROM articles WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_articles(self, source: str, news_list: List[Dict]):
+        """保存新聞（已存在的鍵保持不變）"""
+        now = datetime.now().isoformat()
+        rows = [(article_key(news), source, now, json.dumps(news, ensure_ascii=False))
+                for news in news_list]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO articles (key, source, first_seen, data) VALUES (?, ?, ?, ?)',
+                rows)
+
+    def latest(self, source: str, limit: int, exclude: set = None) -> List[Dict]:
+        """某來源最近保存的新聞（新到舊）"""
+        if limit <= 0:
+            return []
+        exclude = exclude or set()
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT key, data FROM articles WHERE source = ? '
+                'ORDER BY first_seen DESC, rowid ASC LIMIT ?',
+                (source, limit + len(exclude))
+            ).fetchall()
+        return [json.loads(data) for key, data in rows if key not in exclude][:limit]
+
+    # ---------- 情緒快取 ----------
+
+    def get_sentiment(self, key: str, version: str) -> Optional[Dict[str, Any]]:
+        """快取的情緒分析結果；版本不符時返回 None"""
+        with self.lock:
+            row = self.conn.execute('SELECT sentiment, sentiment_version FROM articles WHERE key = ?',
+                                    (key,)).fetchone()
+        if not row or not row[0] or row[1] != version:
+            return None
+        return json.loads(row[0])
+
+    def set_sentiment(self, key: str, news: Dict, source: str, result: Dict[str, Any],
+                      version: str):
+        """保存情緒分析結果與分析器版本（新聞尚未保存時一併保存）"""
+        payload = json.dumps(result, ensure_ascii=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO articles (key, source, first_seen, data) VALUES (?, ?, ?, ?)',
+                (key, source, datetime.now().isoformat(), json.dumps(news, ensure_ascii=False)))
+            self.conn.execute('UPDATE articles SET sentiment = ?, sentiment_version = ? WHERE key = ?',
+                              (payload, version, key))
+
+
+class HostRateLimiter:
+    """
+    每個主機的禮貌限制
+
+    同一主機同時只允許 max_concurrent 個請求，且兩次請求開始時間至少間隔 min_interval 秒；
+    不同主機互不影響，可以並行。
+    """
+
+    def __init__(self, min_interval: float = 1.0, max_concurrent: int = 1):
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_allowed = {}
+
+    def _semaphore(self, host: str) -> threading.Semaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.Semaphore(self.max_concurrent)
+            return self._semaphores[host]
+
+    def acquire(self, host: str, deadline: float = None) -> bool:
+        """
+        取得主機的請求許可
+
+        Args:
+            deadline: time.monotonic() 截止時間，等不到許可時返回 False
+
+        Returns:
+            bool: 是否取得許可（取得後必須呼叫 release）
+        """
+        semaphore = self._semaphore(host)
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if not semaphore.acquire(timeout=timeout):
+            return False
+
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_allowed.get(host, 0))
+            if deadline is not None and start_at >= deadline:
+                semaphore.release()
+                return False
+            self._next_allowed[host] = start_at + self.min_interval
+
+        if start_at > now:
+            time.sleep(start_at - now)
+        return True
+
+    def release(self, host: str):
+        self._semaphore(host).release()
+
 
 class NewsCollector:
     """
@@ -185,14 +488,74 @@ class NewsCollector:
     從多個來源收集財經新聞
     """
 
-    def __init__(self):
+    def __init__(self, concurrent: bool = True, deadline_seconds: float = 8.0,
+                 store: NewsArticleStore = None):
+        """
+        Args:
+            concurrent: collect_all_news 預設是否並行抓取所有來源
+            deadline_seconds: 並行模式的整體截止時間（秒）
+            store: 新聞快取，提供時各來源只處理游標之後的新標題
+        """
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         self.request_delay = 1.0
+        self.request_timeout = 10
+        self.concurrent = concurrent
+        self.deadline_seconds = deadline_seconds
+        self.rate_limiter = HostRateLimiter(min_interval=self.request_delay)
+        self.store = store
+
+    def _get(self, url: str, deadline: float = None, **kwargs) -> Optional[requests.Response]:
+        """
+        受主機禮貌限制的 GET 請求
+
+        逾時不超過截止時間；截止前拿不到許可時返回 None。
+        """
+        host = urlparse(url).netloc
+        if not self.rate_limiter.acquire(host, deadline):
+            logger.debug(f"{host} 請求已超過截止時間，略過")
+            return None
+
+        try:
+            timeout = self.request_timeout
+            if deadline is not None:
+                timeout = max(min(timeout, deadline - time.monotonic()), 0.1)
+            return requests.get(url, headers=self.headers, timeout=timeout, **kwargs)
+        finally:
+            self.rate_limiter.release(host)
+
+    def _apply_cursor(self, cursor_name: str, news_list: List[Dict], limit: int) -> List[Dict]:
+        """
+        只保留游標之後的新標題，其餘以快取補足到 limit 條
+
+        來源列表為新到舊：遇到游標即停止，已保存過的新聞也略過。
+        """
+        if self.store is None:
+            return news_list
+
+        cursor = self.store.get_cursor(cursor_name)
+        keys = [article_key(news) for news in news_list]
+        known = self.store.known_keys(keys)
+
+        new_news = []
+        for key, news in zip(keys, news_list):
+            if key == cursor:
+                break
+            if key not in known:
+                new_news.append(news)
+
+        if new_news:
+            self.store.add_articles(cursor_name, new_news)
+            self.store.set_cursor(cursor_name, keys[0])
+            logger.debug(f"{cursor_name} 新標題 {len(new_news)} 條")
+
+        cached = self.store.latest(cursor_name, limit - len(new_news),
+                                   exclude={article_key(news) for news in new_news})
+        return new_news + cached
 
     def collect_yahoo_finance_news(self, stock_code: str = None,
-                                   limit: int = 10) -> List[Dict]:
+                                   limit: int = 10, deadline: float = None) -> List[Dict]:
         """
         從 Yahoo 財經收集新聞
         """
@@ -206,8 +569,8 @@ class NewsCollector:
                 # 一般財經新聞
                 url = "https://tw.stock.yahoo.com/news"
 
-            response = requests.get(url, headers=self.headers, timeout=10)
-            if response.status_code == 200:
+            response = self._get(url, deadline)
+            if response is not None and response.status_code == 200:
                 soup = BeautifulSoup(response.text, 'html.parser')
 
                 # 找新聞標題
@@ -227,10 +590,11 @@ class NewsCollector:
 
         except Exception as e:
             logger.warning(f"Yahoo 財經新聞獲取失敗: {e}")
+            return news_list
 
-        return news_list
+        return self._apply_cursor(f"yahoo:{stock_code}" if stock_code else 'yahoo', news_list, limit)
 
-    def collect_cnyes_news(self, limit: int = 10) -> List[Dict]:
+    def collect_cnyes_news(self, limit: int = 10, deadline: float = None) -> List[Dict]:
         """
         從鉅亨網收集新聞
         """
@@ -240,8 +604,8 @@ class NewsCollector:
             url = "https://news.cnyes.com/api/v3/news/category/tw_stock"
             params = {'limit': limit}
 
-            response = requests.get(url, params=params, headers=self.headers, timeout=10)
-            if response.status_code == 200:
+            response = self._get(url, deadline, params=params)
+            if response is not None and response.status_code == 200:
                 data = response.json()
                 items = data.get('items', {}).get('data', [])
 
@@ -256,10 +620,11 @@ class NewsCollector:
 
         except Exception as e:
             logger.warning(f"鉅亨網新聞獲取失敗: {e}")
+            return news_list
 
-        return news_list
+        return self._apply_cursor('cnyes', news_list, limit)
 
-    def collect_udn_news(self, limit: int = 10) -> List[Dict]:
+    def collect_udn_news(self, limit: int = 10, deadline: float = None) -> List[Dict]:
         """
         從經濟日報收集新聞
         """
@@ -268,8 +633,8 @@ class NewsCollector:
         try:
             url = "https://money.udn.com/rank/newest/1001/0/0"
 
-            response = requests.get(url, headers=self.headers, timeout=10)
-            if response.status_code == 200:
+            response = self._get(url, deadline)
+            if response is not None and response.status_code == 200:
                 soup = BeautifulSoup(response.text, 'html.parser')
 
                 articles = soup.find_all('div', class_='story-content')
@@ -288,13 +653,23 @@ class NewsCollector:
 
         except Exception as e:
             logger.warning(f"經濟日報新聞獲取失敗: {e}")
+            return news_list
 
-        return news_list
+        return self._apply_cursor('udn', news_list, limit)
 
-    def collect_all_news(self, stock_code: str = None, limit: int = 30) -> List[Dict]:
+    def collect_all_news(self, stock_code: str = None, limit: int = 30,
+                         concurrent: bool = None, deadline_seconds: float = None) -> List[Dict]:
         """
         從所有來源收集新聞
+
+        Args:
+            concurrent: 是否並行抓取（預設依 self.concurrent）
+            deadline_seconds: 並行模式的整體截止時間（預設依 self.deadline_seconds）
         """
+        if self.concurrent if concurrent is None else concurrent:
+            return self._collect_all_concurrent(stock_code, limit,
+                                                deadline_seconds or self.deadline_seconds)
+
         all_news = []
 
         # Yahoo 財經
@@ -313,6 +688,147 @@ class NewsCollector:
 
         return all_news
 
+    def _collect_all_concurrent(self, stock_code: str, limit: int,
+                                deadline_seconds: float) -> List[Dict]:
+        """
+        並行抓取所有來源，只等到截止時間
+
+        各來源在不同主機，同時送出請求；截止時間到時返回已完成的來源，
+        未完成的請求在背景結束後丟棄。結果依來源固定順序合併。
+        """
+        deadline = time.monotonic() + deadline_seconds
+        per_source = limit // 3
+        sources = [
+            ('Yahoo財經', lambda: self.collect_yahoo_finance_news(stock_code, limit=per_source, deadline=deadline)),
+            ('鉅亨網', lambda: self.collect_cnyes_news(limit=per_source, deadline=deadline)),
+            ('經濟日報', lambda: self.collect_udn_news(limit=per_source, deadline=deadline)),
+        ]
+
+        executor = ThreadPoolExecutor(max_workers=len(sources), thread_name_prefix='news')
+        try:
+            futures = [executor.submit(fetch) for _, fetch in sources]
+            done, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        finally:
+            executor.shutdown(wait=False)
+
+        all_news = []
+        for (name, _), future in zip(sources, futures):
+            if future in done:
+                all_news.extend(future.result())
+            else:
+                logger.warning(f"{name} 新聞未在 {deadline_seconds:.1f} 秒內完成，略過")
+
+        return all_news
+
+
+class NewsPool:
+    """
+    共用市場新聞池
+
+    每個掃描時間窗只收集一次市場新聞，依連結 / 標題雜湊去重，
+    並以 Aho–Corasick 建立「股票代碼 / 名稱 → 新聞」倒排索引，
+    個股查詢只需查表。
+    """
+
+    def __init__(self, collector: NewsCollector, ttl_minutes: int = 30, limit: int = 30):
+        """
+        Args:
+            collector: 新聞收集器
+            ttl_minutes: 掃描時間窗長度，超過後下次查詢會重新收集
+            limit: 每次收集的新聞數量
+        """
+        self.collector = collector
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self.limit = limit
+
+        self._lock = threading.RLock()
+        self.articles = {}
+        self.collected_at = None
+        # 股票代碼 -> 名稱（名稱可為 None）
+        self.universe = {}
+        # 股票代碼 -> 新聞鍵（依收集順序）
+        self._index = {}
+        self._indexed_universe = None
+
+    def set_universe(self, stocks):
+        """
+        設定股票清單
+
+        Args:
+            stocks: {代碼: 名稱} 或 [{'code': ..., 'name': ...}]
+        """
+        if isinstance(stocks, dict):
+            items = stocks.items()
+        else:
+            items = ((s.get('code'), s.get('name')) for s in stocks)
+
+        with self._lock:
+            for code, name in items:
+                if code:
+                    self.universe[str(code)] = name or self.universe.get(str(code))
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        時間窗過期時重新收集新聞
+
+        Returns:
+            bool: 是否重新收集
+        """
+        with self._lock:
+            now = datetime.now()
+            if not force and self.collected_at and now - self.collected_at < self.ttl:
+                return False
+
+            articles = {}
+            for news in self.collector.collect_all_news(limit=self.limit):
+                articles.setdefault(article_key(news), news)
+
+            self.articles = articles
+            self.collected_at = now
+            self._indexed_universe = None
+            logger.info(f"新聞池已更新: {len(articles)} 條")
+            return True
+
+    def _ensure_index(self):
+        """
+        為尚未建立索引的股票建立倒排索引
+
+        新聞更新後整個重建一次；同一時間窗內新加入（或補上名稱）的股票只以它們自己的
+        代碼 / 名稱建立小型自動機掃描新聞標題，不重建整個索引。
+        """
+        if self._indexed_universe is None:
+            self._index = {}
+            self._indexed_universe = {}
+
+        missing = {code: name for code, name in self.universe.items()
+                   if code not in self._indexed_universe or self._indexed_universe[code] != name}
+        if not missing:
+            return
+
+        matcher = AhoCorasick()
+        for code, name in missing.items():
+            matcher.add(code, code)
+            if name:
+                matcher.add(name, code)
+        matcher.build()
+
+        for code in missing:
+            self._index.pop(code, None)
+        for key, news in self.articles.items():
+            for code in {code for _, _, code in matcher.iter_matches(news.get('title', ''))}:
+                self._index.setdefault(code, []).append(key)
+
+        self._indexed_universe.update(missing)
+
+    def get_stock_news(self, stock_code: str, stock_name: str = None) -> List[Dict]:
+        """查詢標題提到該股票代碼或名稱的新聞"""
+        with self._lock:
+            if stock_code not in self.universe or (stock_name and not self.universe[stock_code]):
+                self.universe[stock_code] = stock_name
+            self.refresh()
+            self._ensure_index()
+            return [self.articles[key] for key in self._index.get(stock_code, [])]
+
 
 class NewsSentimentSystem:
     """
@@ -320,9 +836,45 @@ class NewsSentimentSystem:
     整合新聞收集和情緒分析
     """
 
-    def __init__(self):
-        self.collector = NewsCollector()
+    def __init__(self, data_dir: str = './data/news', use_cache: bool = True):
+        """
+        Args:
+            data_dir: 新聞快取目錄
+            use_cache: 是否啟用新聞快取（游標 + 情緒分數快取）
+        """
+        self.store = NewsArticleStore(os.path.join(data_dir, 'news_cache.db')) if use_cache else None
+        self.collector = NewsCollector(store=self.store)
         self.analyzer = ChineseSentimentAnalyzer()
+        self.news_pool = NewsPool(self.collector)
+
+    def _analyze_news(self, news: Dict) -> Dict[str, Any]:
+        """分析單條新聞情緒（有快取時每條新聞只計算一次）"""
+        key = article_key(news) if self.store is not None else None
+        if key is not None:
+            cached = self.store.get_sentiment(key, self.analyzer.version)
+            if cached is not None:
+                return cached
+
+        text = news.get('title', '') + ' ' + news.get('summary', '')
+        result = self.analyzer.analyze(text)
+
+        if key is not None:
+            self.store.set_sentiment(key, news, news.get('source', ''), result, self.analyzer.version)
+        return result
+
+    def prepare_news_pool(self, stocks) -> int:
+        """
+        掃描開始前設定股票清單並收集一次市場新聞
+
+        Args:
+            stocks: {代碼: 名稱} 或 [{'code': ..., 'name': ...}]
+
+        Returns:
+            int: 新聞池中的新聞數
+        """
+        self.news_pool.set_universe(stocks)
+        self.news_pool.refresh()
+        return len(self.news_pool.articles)
 
     def analyze_market_sentiment(self, limit: int = 30) -> Dict[str, Any]:
         """
@@ -356,8 +908,7 @@ class NewsSentimentSystem:
         all_keywords = []
 
         for news in news_list:
-            text = news.get('title', '') + ' ' + news.get('summary', '')
-            result = self.analyzer.analyze(text)
+            result = self._analyze_news(news)
 
             analyzed_news.append({
                 **news,
@@ -410,21 +961,23 @@ class NewsSentimentSystem:
             'analyzed_news': analyzed_news[:10]  # 返回前10條分析結果
         }
 
-    def analyze_stock_sentiment(self, stock_code: str,
-                                stock_name: str = None) -> Dict[str, Any]:
+    def analyze_stock_sentiment(self, stock_code: str, stock_name: str = None,
+                                pool_only: bool = False) -> Dict[str, Any]:
         """
         分析特定股票的新聞情緒
+
+        Args:
+            pool_only: 只查共用新聞池（掃描中逐股查詢時使用，不另外爬取個股新聞）
         """
-        # 收集該股票相關新聞
-        news_list = self.collector.collect_yahoo_finance_news(stock_code, limit=20)
+        if pool_only:
+            news_list = self.news_pool.get_stock_news(stock_code, stock_name)
+        else:
+            # 收集該股票相關新聞
+            news_list = self.collector.collect_yahoo_finance_news(stock_code, limit=20)
 
-        # 也搜尋股票名稱相關新聞
-        if stock_name:
-            all_news = self.collector.collect_all_news(limit=30)
-            related_news = [n for n in all_news
-                          if stock_code in n.get('title', '') or
-                          stock_name in n.get('title', '')]
-            news_list.extend(related_news)
+            # 也從共用新聞池查詢股票代碼 / 名稱相關新聞
+            if stock_name:
+                news_list.extend(self.news_pool.get_stock_news(stock_code, stock_name))
 
         if not news_list:
             return {
@@ -438,8 +991,7 @@ class NewsSentimentSystem:
         # 分析
         analyzed = []
         for news in news_list:
-            text = news.get('title', '') + ' ' + news.get('summary', '')
-            result = self.analyzer.analyze(text)
+            result = self._analyze_news(news)
             analyzed.append({
                 **news,
                 'sentiment_score': result['score'],
@@ -0,0 +1,364 @@
+"""
+notification_outbox.py - 通知發送佇列
+持久化的通知寄件匣，背景執行緒並行發送到各渠道
+
+功能：
+1. 通知先寫入 SQLite 寄件匣，呼叫端立即返回
+2. 每個渠道獨立重試，失敗時以指數退避排程下一次嘗試
+3. 程序重啟後自動重送尚未送達的通知，超過保存期限才放棄
+4. 結束程序前可等待佇列送完（flush，時限內的重試也會等待，超過時限即返回）
+
+使用方式：
+    dispatcher = NotificationDispatcher(
+        NotificationOutbox('cache/notification_outbox.db'),
+        channels={'email': send_email, 'line': send_line},
+    )
+    dispatcher.start()
+    dispatcher.enqueue({'message': '...', 'subject': '...'}, ['email', 'line'])
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """JSON 序列化 numpy 型別（其餘轉字串）"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class NotificationOutbox:
+    """
+    通知寄件匣（SQLite）
+
+    每則通知一筆 messages，每個渠道一筆 deliveries：
+        pending -> sent / expired
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            backed_up INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS deliveries (
+            message_id INTEGER NOT NULL,
+            channel TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            sent_at TEXT,
+            PRIMARY KEY (message_id, channel)
+        );
+        CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries(status, next_attempt_at);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.SCHEMA)
+        self.lock = threading.RLock()
+
+    def add(self, payload: Dict[str, Any], channels: List[str]) -> int:
+        """寫入一則通知，返回通知編號"""
+        now = time.time()
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                'INSERT INTO messages (created_at, payload) VALUES (?, ?)',
+                (datetime.now().isoformat(), json.dumps(payload, ensure_ascii=False, default=_json_default)))
+            message_id = cursor.lastrowid
+            self.conn.executemany(
+                'INSERT INTO deliveries (message_id, channel, next_attempt_at) VALUES (?, ?, ?)',
+                [(message_id, channel, now) for channel in channels])
+        return message_id
+
+    def due(self, now: float = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """到期待發送的渠道"""
+        now = time.time() if now is None else now
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT d.message_id, d.channel, d.attempts, m.payload, m.created_at '
+                'FROM deliveries d JOIN messages m ON m.id = d.message_id '
+                "WHERE d.status = 'pending' AND d.next_attempt_at <= ? "
+                'ORDER BY d.next_attempt_at LIMIT ?', (now, limit)).fetchall()
+        return [{'message_id': message_id, 'channel': channel, 'attempts': attempts,
+                 'payload': json.loads(payload), 'created_at': created_at}
+                for message_id, channel, attempts, payload, created_at in rows]
+
+    def next_due_at(self) -> Optional[float]:
+        """最近一次待發送的時間"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def mark_sent(self, message_id: int, channel: str):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE deliveries SET status = 'sent', attempts = attempts + 1, sent_at = ?, "
+                'last_error = NULL WHERE message_id = ? AND channel = ?',
+                (datetime.now().isoformat(), message_id, channel))
+
+    def mark_failed(self, message_id: int, channel: str, error: str, retry_at: Optional[float]):
+        """記錄失敗；retry_at 為 None 表示放棄（expired）"""
+        with self.lock, self.conn:
+            if retry_at is None:
+                self.conn.execute(
+                    "UPDATE deliveries SET status = 'expired', attempts = attempts + 1, last_error = ? "
+                    'WHERE message_id = ? AND channel = ?', (error, message_id, channel))
+            else:
+                self.conn.execute(
+                    'UPDATE deliveries SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? '
+                    'WHERE message_id = ? AND channel = ?', (error, retry_at, message_id, channel))
+
+    def is_abandoned(self, message_id: int) -> bool:
+        """是否所有渠道都已放棄（沒有送達，也沒有仍待發送的渠道）"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM deliveries WHERE message_id = ? AND status IN ('pending', 'sent') "
+                'LIMIT 1', (message_id,)).fetchone()
+        return row is None
+
+    def undelivered(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """仍有渠道待發送、沒有任何渠道送達且尚未備份的通知 [(通知編號, 內容)]"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT m.id, m.payload FROM messages m WHERE m.backed_up = 0 '
+                "AND EXISTS (SELECT 1 FROM deliveries d WHERE d.message_id = m.id AND d.status = 'pending') "
+                "AND NOT EXISTS (SELECT 1 FROM deliveries d WHERE d.message_id = m.id AND d.status = 'sent') "
+                'ORDER BY m.id').fetchall()
+        return [(message_id, json.loads(payload)) for message_id, payload in rows]
+
+    def mark_backed_up(self, message_id: int) -> bool:
+        """
+        標記已寫入備份檔案
+
+        Returns:
+            bool: 本次才標記（先前未備份）
+        """
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                'UPDATE messages SET backed_up = 1 WHERE id = ? AND backed_up = 0', (message_id,))
+        return cursor.rowcount > 0
+
+    def pending_count(self) -> int:
+        """尚未送達的通知數"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(DISTINCT message_id) FROM deliveries WHERE status = 'pending'"
+            ).fetchone()[0]
+
+
+class NotificationDispatcher:
+    """
+    通知派送器
+
+    背景執行緒取出到期的渠道發送工作，每個工作一條執行緒同時送往所有渠道。
+    不使用 ThreadPoolExecutor：其結束掛鉤會在 atexit 的 flush 之前關閉執行緒池，
+    程序結束時將無法再送出任何通知。
+    渠道函數接收通知內容 dict，返回 True 表示送達，返回 False 或拋出例外表示失敗。
+    """
+
+    def __init__(self, outbox: NotificationOutbox,
+                 channels: Dict[str, Callable[[Dict[str, Any]], bool]],
+                 base_delay: float = 2.0, backoff_factor: float = 1.5,
+                 max_delay: float = 1800, max_age_hours: float = 24,
+                 on_undelivered: Callable[[int, Dict[str, Any]], None] = None):
+        """
+        Args:
+            outbox: 寄件匣
+            channels: {渠道名稱: 發送函數}
+            base_delay / backoff_factor / max_delay: 重試退避（秒）
+            max_age_hours: 超過此時間仍未送達即放棄
+            on_undelivered: 某則通知所有渠道都放棄（超過保存期限），或結束前 backup_undelivered()
+                時仍未送達，呼叫一次（例如寫入備份檔案）
+        """
+        self.outbox = outbox
+        self.channels = channels
+        self.base_delay = base_delay
+        self.backoff_factor = backoff_factor
+        self.max_delay = max_delay
+        self.max_age = timedelta(hours=max_age_hours)
+        self.on_undelivered = on_undelivered
+
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.RLock()
+
+    # ---------- 生命週期 ----------
+
+    def start(self):
+        """啟動背景派送（會先處理上次未送達的通知）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='notification-dispatcher',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def enqueue(self, payload: Dict[str, Any], channels: List[str]) -> int:
+        """排入通知並喚醒派送執行緒，返回通知編號"""
+        channels = [c for c in channels if c in self.channels]
+        message_id = self.outbox.add(payload, channels)
+        with self._lock:
+            self._idle.clear()
+            self._wakeup.set()
+        self.start()
+        return message_id
+
+    def flush(self, timeout: float = 60) -> bool:
+        """
+        等待寄件匣送完，時限內到期的重試也會等待
+
+        Returns:
+            bool: 是否已無待發送的通知
+        """
+        if self._thread is None:
+            return self.outbox.pending_count() == 0
+
+        deadline = time.time() + timeout
+        self._wakeup.set()
+        while True:
+            # 派送失敗時到期時間可能一直停在過去，每一輪都要檢查時限
+            if time.time() >= deadline:
+                return self.outbox.pending_count() == 0
+            if not self._idle.wait(max(deadline - time.time(), 0)):
+                return False
+            if self.outbox.pending_count() == 0:
+                return True
+            next_due = self.outbox.next_due_at()
+            if next_due is None or next_due > deadline:
+                return False
+            time.sleep(min(max(next_due - time.time(), 0) + 0.05, max(deadline - time.time(), 0)))
+
+    def backup_undelivered(self) -> int:
+        """
+        對仍未送達的通知呼叫 on_undelivered（每則通知只備份一次）
+
+        程序結束前 flush 未送完時使用：備份立即可用，寄件匣之後仍會繼續重送。
+
+        Returns:
+            int: 本次備份的通知數
+        """
+        if not self.on_undelivered:
+            return 0
+
+        count = 0
+        for message_id, payload in self.outbox.undelivered():
+            if self.outbox.mark_backed_up(message_id):
+                try:
+                    self.on_undelivered(message_id, payload)
+                    count += 1
+                except Exception as e:
+                    logger.error(f"通知 #{message_id} 備份失敗: {e}")
+        return count
+
+    # ---------- 派送 ----------
+
+    def _retry_at(self, attempts: int, created_at: str) -> Optional[float]:
+        """下一次嘗試時間；超過保存期限返回 None"""
+        if datetime.now() - datetime.fromisoformat(created_at) > self.max_age:
+            return None
+        delay = min(self.base_delay * (self.backoff_factor ** attempts), self.max_delay)
+        return time.time() + delay
+
+    def _deliver(self, job: Dict[str, Any]) -> Tuple[Dict[str, Any], bool, Optional[str]]:
+        try:
+            return job, bool(self.channels[job['channel']](job['payload'])), None
+        except Exception as e:
+            return job, False, str(e)
+
+    def _deliver_all(self, jobs: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], bool, Optional[str]]]:
+        """同時發送一批工作；無法建立執行緒時（例如直譯器關閉中）改在目前執行緒發送"""
+        results = [None] * len(jobs)
+
+        def deliver(index):
+            results[index] = self._deliver(jobs[index])
+
+        threads = []
+        for index in range(1, len(jobs)):
+            thread = threading.Thread(target=deliver, args=(index,), name='notify', daemon=True)
+            try:
+                thread.start()
+            except RuntimeError:
+                deliver(index)
+            else:
+                threads.append(thread)
+        if jobs:
+            deliver(0)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def process_due(self) -> int:
+        """處理一批到期工作，返回處理數"""
+        jobs = self.outbox.due()
+        if not jobs:
+            return 0
+
+        failed_messages = {}
+        for job, ok, error in self._deliver_all(jobs):
+            message_id, channel = job['message_id'], job['channel']
+            if ok:
+                self.outbox.mark_sent(message_id, channel)
+                logger.info(f"通知 #{message_id} 已透過 {channel} 送達")
+                continue
+
+            retry_at = self._retry_at(job['attempts'] + 1, job['created_at'])
+            self.outbox.mark_failed(message_id, channel, error or '發送失敗', retry_at)
+            if retry_at is None:
+                logger.error(f"通知 #{message_id} 的 {channel} 渠道超過保存期限，放棄重送")
+            else:
+                logger.warning(f"通知 #{message_id} 的 {channel} 渠道發送失敗，"
+                               f"{retry_at - time.time():.0f} 秒後重試")
+            failed_messages[message_id] = job['payload']
+
+        if self.on_undelivered:
+            for message_id, payload in failed_messages.items():
+                if self.outbox.is_abandoned(message_id) and self.outbox.mark_backed_up(message_id):
+                    try:
+                        self.on_undelivered(message_id, payload)
+                    except Exception as e:
+                        logger.error(f"通知 #{message_id} 備份失敗: {e}")
+
+        return len(jobs)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                while self.process_due():
+                    pass
+            except Exception as e:
+                logger.error(f"通知派送錯誤: {e}")
+
+            # 處理期間若有新通知排入，先繼續處理再回報閒置
+            with self._lock:
+                if self._wakeup.is_set():
+                    continue
+                self._idle.set()
+
+            next_due = self.outbox.next_due_at()
+            timeout = None if next_due is None else max(next_due - time.time(), 0.05)
+            self._wakeup.wait(timeout)
@@ -0,0 +1,1030 @@
+"""
+notification_render.py - 通知內容渲染
+同一組推薦資料只整理一次成檢視模型，再由檢視模型渲染各渠道格式
+
+功能：
+1. 檢視模型 - 每支股票的漲跌幅、成交金額、技術指標標籤等只計算一次
+2. 多格式渲染 - 純文字訊息、HTML 郵件、LINE Flex 訊息
+3. 內容快取 - 渲染結果依推薦資料的內容雜湊快取（記憶體 + 磁碟），
+   重試、LINE 渠道與備份檔案直接重用同一份渲染結果
+
+使用方式：
+    from notification_render import get_render_cache
+    rendered = get_render_cache().render(strategies_data, 'morning_scan')
+    rendered['message'], rendered['html_body'], rendered['flex']
+"""
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import CACHE_DIR
+except ImportError:
+    CACHE_DIR = 'cache'
+
+# 郵件主旨與文字訊息使用的時段名稱
+TIME_SLOT_NAMES = {
+    'morning_scan': '🌅 早盤掃描 (9:30)',
+    'mid_morning_scan': '☀️ 盤中掃描 (10:30)',
+    'mid_day_scan': '🌞 午間掃描 (12:30)',
+    'afternoon_scan': '🌇 盤後掃描 (15:00)',
+    'weekly_summary': '📈 週末總結 (週六12:00)'
+}
+
+# LINE Flex 標題使用的時段名稱
+FLEX_TITLES = {
+    'morning_scan': '🌅 早盤掃描',
+    'mid_morning_scan': '☀️ 盤中掃描',
+    'mid_day_scan': '🌞 午間掃描',
+    'afternoon_scan': '🌇 盤後掃描',
+    'weekly_summary': '📈 週末總結'
+}
+
+
+# ==================== 格式化 ====================
+
+def format_number(num):
+    """格式化數字顯示"""
+    if num >= 100000000:  # 億
+        return f"{num/100000000:.1f}億"
+    elif num >= 10000:  # 萬
+        return f"{num/10000:.0f}萬"
+    else:
+        return f"{num:,.0f}"
+
+def format_price_change(change_percent):
+    """格式化漲跌幅顯示"""
+    if change_percent > 0:
+        return f"📈 +{change_percent:.2f}%"
+    elif change_percent < 0:
+        return f"📉 {change_percent:.2f}%"
+    else:
+        return "➖ 0.00%"
+
+def format_institutional_flow(amount_in_wan):
+    """格式化法人買賣金額"""
+    if amount_in_wan == 0:
+        return "0"
+
+    amount_yuan = amount_in_wan * 10000
+
+    if abs(amount_yuan) >= 100000000:  # 億
+        return f"{amount_yuan/100000000:.1f}億"
+    elif abs(amount_yuan) >= 10000000:  # 千萬
+        return f"{amount_yuan/10000000:.0f}千萬"
+    else:
+        return f"{amount_yuan/10000:.0f}萬"
+
+def get_technical_indicators_text(analysis):
+    """獲取技術指標文字"""
+    indicators = []
+
+    # RSI 指標
+    if 'rsi' in analysis:
+        rsi_value = analysis['rsi']
+        if rsi_value < 30:
+            indicators.append("RSI超賣")
+        elif rsi_value > 70:
+            indicators.append("RSI超買")
+        else:
+            indicators.append(f"RSI {rsi_value:.0f}")
+
+    # MACD 指標
+    technical_signals = analysis.get('technical_signals', {})
+    if technical_signals.get('macd_golden_cross'):
+        indicators.append("MACD金叉")
+    elif technical_signals.get('macd_bullish'):
+        indicators.append("MACD轉強")
+
+    # 均線指標
+    if technical_signals.get('ma20_bullish'):
+        indicators.append("站穩20MA")
+    if technical_signals.get('ma_golden_cross'):
+        indicators.append("均線多頭")
+
+    # 成交量
+    if 'volume_ratio' in analysis:
+        vol_ratio = analysis['volume_ratio']
+        if vol_ratio > 2:
+            indicators.append(f"爆量{vol_ratio:.1f}倍")
+        elif vol_ratio > 1.5:
+            indicators.append(f"放量{vol_ratio:.1f}倍")
+
+    # 法人買超（短線也顯示）
+    if 'foreign_net_buy' in analysis and analysis['foreign_net_buy'] > 10000:
+        indicators.append("外資買超")
+
+    return indicators
+
+def _indicator_tag_class(indicator: str) -> str:
+    """技術指標標籤的 HTML 樣式"""
+    if "RSI" in indicator:
+        return "indicator-tag rsi-tag"
+    if "MACD" in indicator:
+        return "indicator-tag macd-tag"
+    if "MA" in indicator or "均線" in indicator:
+        return "indicator-tag ma-tag"
+    if "量" in indicator:
+        return "indicator-tag volume-tag"
+    if "外資" in indicator:
+        return "indicator-tag institutional-tag"
+    return "indicator-tag"
+
+
+# ==================== 檢視模型 ====================
+
+def _stock_view(stock: Dict[str, Any], with_indicators: bool = False) -> Dict[str, Any]:
+    """整理單支股票的顯示欄位"""
+    analysis = stock.get('analysis', {})
+    change_percent = analysis.get('change_percent', 0)
+    view = {
+        'code': stock['code'],
+        'name': stock['name'],
+        'current_price': stock.get('current_price', 0),
+        'change_percent': change_percent,
+        'change_text': format_price_change(change_percent),
+        'change_symbol': "+" if change_percent > 0 else "",
+        'price_class': "price-up" if change_percent > 0 else "price-down" if change_percent < 0 else "price-flat",
+        'trade_value_text': format_number(stock.get('trade_value', 0)),
+        'reason': stock.get('reason', ''),
+        'alert_reason': stock.get('alert_reason', ''),
+        'target_price': stock.get('target_price'),
+        'stop_loss': stock.get('stop_loss'),
+        'has_target_price': 'target_price' in stock,
+        'has_stop_loss': 'stop_loss' in stock,
+        'analysis': analysis,
+    }
+    if with_indicators:
+        view['indicators'] = get_technical_indicators_text(analysis)
+    return view
+
+
+def build_view_model(strategies_data: Dict[str, List[Dict]], time_slot: str,
+                     date: str = None) -> Dict[str, Any]:
+    """
+    將推薦資料整理成檢視模型（各渠道共用）
+
+    Args:
+        strategies_data: {'short_term': [...], 'long_term': [...], 'weak_stocks': [...]}
+            可另帶 'scan_note'（掃描說明，例如時間預算內完整分析的股票數）
+        time_slot: 時段
+        date: 報告日期（預設今天，格式 YYYY/MM/DD）
+    """
+    rendered_at = datetime.now()
+    short_term = [_stock_view(s, with_indicators=True) for s in strategies_data.get('short_term', [])]
+    long_term = [_stock_view(s) for s in strategies_data.get('long_term', [])]
+    weak_stocks = [_stock_view(s) for s in strategies_data.get('weak_stocks', [])]
+
+    return {
+        'time_slot': time_slot,
+        'display_name': TIME_SLOT_NAMES.get(time_slot, time_slot),
+        'flex_title': FLEX_TITLES.get(time_slot, '📊 股票分析'),
+        'date': date or rendered_at.strftime("%Y/%m/%d"),
+        'rendered_at': rendered_at,
+        'short_term': short_term,
+        'long_term': long_term,
+        'weak_stocks': weak_stocks,
+        'scan_note': strategies_data.get('scan_note'),
+        'empty': not (short_term or long_term or weak_stocks),
+    }
+
+
+# ==================== 純文字 ====================
+
+def _price_targets_text(view: Dict[str, Any]) -> str:
+    text = ""
+    if view['target_price']:
+        text += f"🎯 目標價: {view['target_price']} 元"
+    if view['stop_loss']:
+        text += f" | 🛡️ 止損價: {view['stop_loss']} 元"
+    return text + "\n\n"
+
+
+def render_text(vm: Dict[str, Any]) -> str:
+    """純文字訊息（EMAIL 純文字部分 / LINE 文字 / 備份檔案）"""
+    time_slot = vm['time_slot']
+    if vm['empty']:
+        message = f"【{time_slot}分析報告】\n\n沒有符合條件的推薦股票和警示"
+        if vm['scan_note']:
+            message += f"\n\n⏱️ {vm['scan_note']}"
+        return message
+
+    message = f"📈 {vm['date']} {time_slot}分析報告\n\n"
+    if vm['scan_note']:
+        message += f"⏱️ {vm['scan_note']}\n\n"
+
+    # 短線推薦部分
+    message += f"【🔥 短線推薦】\n\n"
+    if vm['short_term']:
+        for i, stock in enumerate(vm['short_term'], 1):
+            analysis = stock['analysis']
+            message += f"🔥 {i}. {stock['code']} {stock['name']}\n"
+            message += f"💰 現價: {stock['current_price']} 元 {stock['change_text']}\n"
+            message += f"💵 成交金額: {stock['trade_value_text']}\n"
+
+            if stock['indicators']:
+                message += f"📊 技術指標: {' | '.join(stock['indicators'])}\n"
+
+            # 法人買超資訊
+            if 'foreign_net_buy' in analysis:
+                foreign_net = analysis['foreign_net_buy']
+                if abs(foreign_net) > 1000:
+                    if foreign_net > 0:
+                        message += f"🏦 外資買超: {format_institutional_flow(foreign_net)}\n"
+                    else:
+                        message += f"🏦 外資賣超: {format_institutional_flow(abs(foreign_net))}\n"
+
+            message += f"📋 推薦理由: {stock['reason']}\n"
+            message += _price_targets_text(stock)
+    else:
+        message += "今日無短線推薦股票\n\n"
+
+    # 長線推薦部分
+    message += f"【💎 長線潛力股】\n\n"
+    if vm['long_term']:
+        for i, stock in enumerate(vm['long_term'], 1):
+            analysis = stock['analysis']
+            message += f"💎 {i}. {stock['code']} {stock['name']}\n"
+            message += f"💰 現價: {stock['current_price']} 元 {stock['change_text']}\n"
+
+            # 基本面資訊
+            if analysis.get('dividend_yield', 0) > 0:
+                message += f"💸 殖利率: {analysis['dividend_yield']:.1f}%\n"
+            if analysis.get('eps_growth', 0) > 0:
+                message += f"📈 EPS成長: {analysis['eps_growth']:.1f}%\n"
+
+            # 法人買超資訊
+            if analysis.get('foreign_net_buy', 0) > 5000:
+                message += f"🏦 外資買超: {format_institutional_flow(analysis['foreign_net_buy'])}\n"
+
+            message += f"📋 投資亮點: {stock['reason']}\n"
+            message += _price_targets_text(stock)
+    else:
+        message += "今日無長線推薦股票\n\n"
+
+    # 風險警示部分
+    if vm['weak_stocks']:
+        message += f"【⚠️ 風險警示】\n\n"
+        for i, stock in enumerate(vm['weak_stocks'], 1):
+            message += f"⚠️ {i}. {stock['code']} {stock['name']}\n"
+            message += f"💰 現價: {stock['current_price']} 元 {stock['change_text']}\n"
+            message += f"💵 成交金額: {stock['trade_value_text']}\n"
+            message += f"🚨 風險因子: {stock['alert_reason']}\n"
+            message += f"⚠️ 操作建議: 謹慎操作，嚴設停損\n\n"
+
+    # 投資提醒
+    message += f"【💡 投資提醒】\n"
+    message += f"📧 本報告透過EMAIL + LINE + 文件備份三重保障確保送達\n"
+    message += f"🔥 短線推薦：重視技術指標轉強、成交量放大\n"
+    message += f"💎 長線推薦：重視殖利率、EPS成長、法人動向\n"
+    message += f"⚠️ 本報告僅供參考，不構成投資建議\n"
+    message += f"⚠️ 股市有風險，投資需謹慎\n\n"
+    message += f"祝您投資順利！💰"
+    return message
+
+
+def render_subject(vm: Dict[str, Any]) -> str:
+    """郵件主旨"""
+    if vm['empty']:
+        return f"【{vm['time_slot']}分析報告】- 無推薦"
+    return f"【{vm['display_name']}】📊 統一版股票分析 - {vm['date']}"
+
+
+# ==================== HTML ====================
+
+_HTML_HEAD = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <title>{time_slot}分析報告 - {date}</title>
+        <style>
+            body {
+                font-family: 'Microsoft JhengHei', 'Segoe UI', Arial, sans-serif;
+                line-height: 1.6;
+                color: #333;
+                max-width: 900px;
+                margin: 0 auto;
+                padding: 20px;
+                background-color: #f8f9fa;
+            }
+            .header {
+                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                color: white;
+                padding: 20px;
+                border-radius: 10px;
+                margin-bottom: 20px;
+                text-align: center;
+            }
+            .section {
+                background: white;
+                border-radius: 10px;
+                padding: 20px;
+                margin-bottom: 20px;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+            }
+            .section-title {
+                color: #2c3e50;
+                font-size: 18px;
+                font-weight: bold;
+                margin-bottom: 15px;
+                border-bottom: 2px solid #3498db;
+                padding-bottom: 5px;
+            }
+            .shortterm-title {
+                border-bottom: 2px solid #e74c3c;
+                background: linear-gradient(135deg, #e74c3c 0%, #c0392b 100%);
+                color: white;
+                padding: 10px;
+                border-radius: 5px;
+                margin-bottom: 15px;
+            }
+            .longterm-title {
+                border-bottom: 2px solid #f39c12;
+                background: linear-gradient(135deg, #f39c12 0%, #e67e22 100%);
+                color: white;
+                padding: 10px;
+                border-radius: 5px;
+                margin-bottom: 15px;
+            }
+            .stock-card {
+                border: 1px solid #e1e5e9;
+                border-radius: 8px;
+                padding: 15px;
+                margin-bottom: 15px;
+                background: #fafbfc;
+            }
+            .shortterm-card {
+                border: 2px solid #e74c3c;
+                background: linear-gradient(135deg, #ffeaea 0%, #ffebee 100%);
+                box-shadow: 0 4px 15px rgba(231, 76, 60, 0.2);
+            }
+            .longterm-card {
+                border: 2px solid #f39c12;
+                background: linear-gradient(135deg, #fff9e6 0%, #fff3cd 100%);
+                box-shadow: 0 4px 15px rgba(243, 156, 18, 0.2);
+            }
+            .stock-header {
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+                margin-bottom: 10px;
+            }
+            .stock-name {
+                font-size: 16px;
+                font-weight: bold;
+                color: #2c3e50;
+            }
+            .stock-price {
+                font-size: 14px;
+                font-weight: bold;
+            }
+            .price-up { color: #e74c3c; }
+            .price-down { color: #27ae60; }
+            .price-flat { color: #95a5a6; }
+            
+            .technical-indicators {
+                background: #e8f4fd;
+                border-left: 4px solid #3498db;
+                padding: 10px;
+                margin: 10px 0;
+                border-radius: 0 5px 5px 0;
+            }
+            .indicator-tag {
+                display: inline-block;
+                background: #3498db;
+                color: white;
+                padding: 3px 8px;
+                border-radius: 12px;
+                font-size: 12px;
+                margin: 2px 4px 2px 0;
+                font-weight: bold;
+            }
+            .rsi-tag { background: #9b59b6; }
+            .macd-tag { background: #e67e22; }
+            .ma-tag { background: #16a085; }
+            .volume-tag { background: #f39c12; }
+            .institutional-tag { background: #2ecc71; }
+            
+            .fundamental-section {
+                background: #e8f5e8;
+                border-left: 4px solid #27ae60;
+                padding: 12px;
+                margin: 10px 0;
+                border-radius: 0 5px 5px 0;
+            }
+            .fundamental-title {
+                font-weight: bold;
+                color: #27ae60;
+                margin-bottom: 8px;
+                font-size: 14px;
+            }
+            .fundamental-item {
+                margin: 6px 0;
+                display: flex;
+                align-items: center;
+                font-size: 13px;
+                line-height: 1.4;
+            }
+            
+            .institutional-section {
+                background: #e3f2fd;
+                border-left: 4px solid #2196f3;
+                padding: 12px;
+                margin: 10px 0;
+                border-radius: 0 5px 5px 0;
+            }
+            .institutional-title {
+                font-weight: bold;
+                color: #2196f3;
+                margin-bottom: 8px;
+                font-size: 14px;
+            }
+            .institutional-item {
+                margin: 6px 0;
+                display: flex;
+                align-items: center;
+                font-size: 13px;
+                line-height: 1.4;
+            }
+            
+            .info-row {
+                margin: 5px 0;
+                display: flex;
+                align-items: center;
+            }
+            .info-label {
+                color: #7f8c8d;
+                margin-right: 8px;
+                min-width: 80px;
+                font-weight: bold;
+            }
+            .highlight-metric {
+                background: #fff3cd;
+                padding: 2px 6px;
+                border-radius: 3px;
+                font-weight: bold;
+                color: #856404;
+            }
+            .excellent-metric {
+                background: #d4edda;
+                padding: 2px 6px;
+                border-radius: 3px;
+                font-weight: bold;
+                color: #155724;
+            }
+            .weak-stock {
+                border-left: 4px solid #e74c3c;
+            }
+            .warning {
+                background-color: #ffeaa7;
+                border-left: 4px solid #fdcb6e;
+                padding: 15px;
+                margin: 20px 0;
+                border-radius: 5px;
+            }
+            .footer {
+                text-align: center;
+                color: #7f8c8d;
+                font-size: 12px;
+                margin-top: 30px;
+                padding-top: 20px;
+                border-top: 1px solid #ecf0f1;
+            }
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>📈 {time_slot}分析報告</h1>
+            <p>{date} - 📊 統一版股票通知系統</p>
+        </div>
+    """
+
+
+def _html_stock_info(stock: Dict[str, Any], reason_label: str) -> str:
+    return f"""
+                <div class="stock-info">
+                    <div class="info-row">
+                        <span class="info-label">💵 成交金額:</span>
+                        {stock['trade_value_text']}
+                    </div>
+                    <div class="info-row">
+                        <span class="info-label">{reason_label}:</span>
+                        {stock['reason']}
+                    </div>
+                    <div class="info-row">
+                        <span class="info-label">🎯 目標價:</span>
+                        {stock['target_price'] if stock['has_target_price'] else 'N/A'} 元
+                        <span class="info-label" style="margin-left: 20px;">🛡️ 止損價:</span>
+                        {stock['stop_loss'] if stock['has_stop_loss'] else 'N/A'} 元
+                    </div>
+                </div>
+            </div>
+            """
+
+
+def _html_long_term_card(stock: Dict[str, Any]) -> str:
+    analysis = stock['analysis']
+    html = f"""
+            <div class="stock-card longterm-card">
+                <div class="stock-header">
+                    <div class="stock-name">💎 {stock['code']} {stock['name']}</div>
+                    <div class="stock-price {stock['price_class']}">
+                        現價: {stock['current_price']} 元 ({stock['change_symbol']}{stock['change_percent']:.2f}%)
+                    </div>
+                </div>
+
+                <div class="fundamental-section">
+                    <div class="fundamental-title">📊 基本面優勢</div>
+            """
+
+    # 殖利率顯示
+    if analysis.get('dividend_yield', 0) > 0:
+        dividend_yield = analysis['dividend_yield']
+        dividend_years = analysis.get('dividend_consecutive_years', 0)
+        yield_class = "excellent-metric" if dividend_yield > 5 else "highlight-metric" if dividend_yield > 3 else ""
+
+        html += f"""
+                    <div class="fundamental-item">
+                        <span>💸 殖利率:</span>
+                        <span class="{yield_class}" style="margin-left: 8px;">{dividend_yield:.1f}%</span>
+                """
+        if dividend_years > 5:
+            html += f' <small style="margin-left: 8px; color: #27ae60;">(連續{dividend_years}年配息)</small>'
+        html += "</div>"
+
+    # EPS成長顯示
+    if analysis.get('eps_growth', 0) > 0:
+        eps_growth = analysis['eps_growth']
+        eps_class = "excellent-metric" if eps_growth > 20 else "highlight-metric" if eps_growth > 10 else ""
+        growth_desc = "高速成長" if eps_growth > 20 else "穩健成長" if eps_growth > 10 else "成長"
+
+        html += f"""
+                    <div class="fundamental-item">
+                        <span>📈 EPS{growth_desc}:</span>
+                        <span class="{eps_class}" style="margin-left: 8px;">{eps_growth:.1f}%</span>
+                    </div>
+                """
+
+    # ROE和本益比
+    if analysis.get('roe', 0) > 0:
+        roe = analysis['roe']
+        pe_ratio = analysis.get('pe_ratio', 0)
+        roe_class = "excellent-metric" if roe > 15 else "highlight-metric" if roe > 10 else ""
+        pe_class = "excellent-metric" if pe_ratio < 15 else "highlight-metric" if pe_ratio < 20 else ""
+
+        html += f"""
+                    <div class="fundamental-item">
+                        <span>🏆 ROE:</span>
+                        <span class="{roe_class}" style="margin-left: 8px;">{roe:.1f}%</span>
+                        <span style="margin-left: 15px;">📊 本益比:</span>
+                        <span class="{pe_class}" style="margin-left: 8px;">{pe_ratio:.1f}倍</span>
+                    </div>
+                """
+
+    html += "</div>"  # 結束基本面區塊
+
+    # 法人動向區塊
+    html += """
+                <div class="institutional-section">
+                    <div class="institutional-title">🏦 法人動向</div>
+            """
+
+    foreign_net = analysis.get('foreign_net_buy', 0)
+    trust_net = analysis.get('trust_net_buy', 0)
+    total_institutional = analysis.get('total_institutional', 0)
+    consecutive_days = analysis.get('consecutive_buy_days', 0)
+
+    if total_institutional > 50000:
+        html += f"""
+                    <div class="institutional-item">
+                        <span>🔥 三大法人大幅買超:</span>
+                        <span class="excellent-metric" style="margin-left: 8px;">{format_institutional_flow(total_institutional)}</span>
+                    </div>
+                """
+    else:
+        if foreign_net > 5000:
+            foreign_class = "excellent-metric" if foreign_net > 20000 else "highlight-metric"
+            html += f"""
+                        <div class="institutional-item">
+                            <span>🌍 外資買超:</span>
+                            <span class="{foreign_class}" style="margin-left: 8px;">{format_institutional_flow(foreign_net)}</span>
+                        </div>
+                    """
+
+        if trust_net > 3000:
+            trust_class = "excellent-metric" if trust_net > 10000 else "highlight-metric"
+            html += f"""
+                        <div class="institutional-item">
+                            <span>🏢 投信買超:</span>
+                            <span class="{trust_class}" style="margin-left: 8px;">{format_institutional_flow(trust_net)}</span>
+                        </div>
+                    """
+
+    if consecutive_days > 3:
+        html += f"""
+                    <div class="institutional-item">
+                        <span>⏰ 持續買超:</span>
+                        <span class="highlight-metric" style="margin-left: 8px;">{consecutive_days}天</span>
+                    </div>
+                """
+
+    html += "</div>"  # 結束法人動向區塊
+    return html + _html_stock_info(stock, '📋 投資亮點')
+
+
+def render_html(vm: Dict[str, Any]) -> str:
+    """HTML 郵件內容"""
+    parts = [_HTML_HEAD.replace('{time_slot}', vm['time_slot']).replace('{date}', vm['date'])]
+
+    if vm['scan_note']:
+        parts.append(f"""
+        <div class="warning">
+            <p>⏱️ {vm['scan_note']}</p>
+        </div>
+        """)
+
+    # 短線推薦區塊
+    if vm['short_term']:
+        parts.append("""
+        <div class="section">
+            <div class="shortterm-title">🔥 短線推薦</div>
+        """)
+        for stock in vm['short_term']:
+            parts.append(f"""
+            <div class="stock-card shortterm-card">
+                <div class="stock-header">
+                    <div class="stock-name">🔥 {stock['code']} {stock['name']}</div>
+                    <div class="stock-price {stock['price_class']}">
+                        現價: {stock['current_price']} 元 ({stock['change_symbol']}{stock['change_percent']:.2f}%)
+                    </div>
+                </div>
+
+                <div class="technical-indicators">
+                    <div class="fundamental-title">📊 技術指標</div>
+                    <div>
+            """)
+            parts.extend(f'<span class="{_indicator_tag_class(indicator)}">{indicator}</span>'
+                         for indicator in stock['indicators'])
+            parts.append("""
+                    </div>
+                </div>
+                """ + _html_stock_info(stock, '📋 推薦理由'))
+        parts.append("</div>")
+
+    # 長線推薦區塊
+    if vm['long_term']:
+        parts.append("""
+        <div class="section">
+            <div class="longterm-title">💎 長線潛力股 - 基本面優質</div>
+        """)
+        parts.extend(_html_long_term_card(stock) for stock in vm['long_term'])
+        parts.append("</div>")
+
+    # 風險警示區塊
+    if vm['weak_stocks']:
+        parts.append("""
+        <div class="section">
+            <div class="section-title">⚠️ 風險警示</div>
+        """)
+        for stock in vm['weak_stocks']:
+            parts.append(f"""
+            <div class="stock-card weak-stock">
+                <div class="stock-header">
+                    <div class="stock-name">⚠️ {stock['code']} {stock['name']}</div>
+                    <div class="stock-price price-down">
+                        現價: {stock['current_price']} 元 ({stock['change_percent']:.2f}%)
+                    </div>
+                </div>
+                <div class="stock-info">
+                    <div class="info-row">
+                        <span class="info-label">💵 成交金額:</span>
+                        {stock['trade_value_text']}
+                    </div>
+                    <div class="info-row">
+                        <span class="info-label">🚨 風險因子:</span>
+                        {stock['alert_reason']}
+                    </div>
+                    <div class="info-row">
+                        <span class="info-label">⚠️ 操作建議:</span>
+                        謹慎操作，嚴設停損
+                    </div>
+                </div>
+            </div>
+            """)
+        parts.append("</div>")
+
+    # 投資提醒
+    parts.append(f"""
+        <div class="warning">
+            <h3>💡 投資提醒</h3>
+            <p><strong>🔥 短線推薦重點：</strong></p>
+            <ul>
+                <li>📊 重視技術指標轉強（RSI、MACD、均線）</li>
+                <li>📈 關注成交量放大配合價格上漲</li>
+                <li>🏦 法人買超提供資金動能支撐</li>
+                <li>⏰ 適合短期操作，嚴設停損</li>
+            </ul>
+            <p><strong>💎 長線推薦重點：</strong></p>
+            <ul>
+                <li>💸 殖利率 > 3% 提供穩定現金流</li>
+                <li>📈 EPS成長 > 10% 代表獲利持續改善</li>
+                <li>🏦 法人買超顯示專業投資人看好</li>
+                <li>🏆 ROE > 15% 表示獲利能力優秀</li>
+                <li>⏰ 連續配息年數反映股息政策穩定</li>
+            </ul>
+            <p><strong>⚠️ 風險提醒：</strong></p>
+            <ul>
+                <li>本報告僅供參考，不構成投資建議</li>
+                <li>股市有風險，投資需謹慎</li>
+                <li>建議設定停損點，控制投資風險</li>
+                <li>長線投資應定期檢視基本面變化</li>
+            </ul>
+        </div>
+
+        <div class="footer">
+            <p>此電子郵件由統一版股票分析系統自動產生於 {vm['rendered_at'].strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p>📊 整合EMAIL、LINE和文件備份三種通知方式</p>
+            <p>祝您投資順利！💰</p>
+        </div>
+    </body>
+    </html>
+    """)
+
+    return ''.join(parts)
+
+
+# ==================== LINE Flex ====================
+
+def _flex_text(text: str, **style) -> Dict[str, Any]:
+    return {"type": "text", "text": text, **style}
+
+
+def _flex_section(title: str, color: str, with_separator: bool) -> Dict[str, Any]:
+    contents = []
+    if with_separator:
+        contents.append({"type": "separator", "margin": "md"})
+        contents.append(_flex_text(title, weight="bold", size="md", color=color, margin="md"))
+    else:
+        contents.append(_flex_text(title, weight="bold", size="md", color=color))
+    return {"type": "box", "layout": "vertical", "margin": "md", "contents": contents}
+
+
+def render_flex(vm: Dict[str, Any]) -> Dict[str, Any]:
+    """LINE Flex 訊息內容"""
+    flex_content = {
+        "type": "bubble",
+        "header": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": [
+                _flex_text(vm['flex_title'], weight="bold", size="xl", color="#1DB446"),
+                _flex_text(vm['rendered_at'].strftime('%Y/%m/%d %H:%M'), size="sm", color="#aaaaaa"),
+            ]
+        },
+        "body": {
+            "type": "box",
+            "layout": "vertical",
+            "contents": []
+        }
+    }
+    body = flex_content["body"]["contents"]
+
+    if vm['scan_note']:
+        flex_content["header"]["contents"].append(
+            _flex_text(f"⏱️ {vm['scan_note']}", size="xs", color="#FF8800", wrap=True))
+
+    # 短線推薦（最多顯示3支）
+    if vm['short_term']:
+        section = _flex_section("🔥 短線推薦", "#FF5551", with_separator=False)
+        for stock in vm['short_term'][:3]:
+            change_percent = stock['change_percent']
+            change_color = "#FF5551" if change_percent > 0 else "#00C851" if change_percent < 0 else "#757575"
+            change_text = f"+{change_percent:.1f}%" if change_percent > 0 else f"{change_percent:.1f}%"
+            section["contents"].append({
+                "type": "box",
+                "layout": "horizontal",
+                "margin": "sm",
+                "contents": [
+                    _flex_text(f"{stock['code']} {stock['name']}", size="sm", flex=3),
+                    _flex_text(f"{stock['current_price']}", size="sm", align="end", flex=1),
+                    _flex_text(change_text, size="sm", align="end", color=change_color, flex=1),
+                ]
+            })
+        body.append(section)
+
+    # 長線推薦（最多顯示3支）
+    if vm['long_term']:
+        section = _flex_section("💎 長線推薦", "#FFB000", with_separator=True)
+        for stock in vm['long_term'][:3]:
+            analysis = stock['analysis']
+            dividend_yield = analysis.get('dividend_yield', 0)
+            eps_growth = analysis.get('eps_growth', 0)
+
+            # 基本面標籤
+            tags = []
+            if dividend_yield > 4:
+                tags.append(f"殖利率{dividend_yield:.1f}%")
+            if eps_growth > 10:
+                tags.append(f"EPS成長{eps_growth:.1f}%")
+
+            section["contents"].append({
+                "type": "box",
+                "layout": "vertical",
+                "margin": "sm",
+                "contents": [
+                    {
+                        "type": "box",
+                        "layout": "horizontal",
+                        "contents": [
+                            _flex_text(f"{stock['code']} {stock['name']}", size="sm", weight="bold", flex=2),
+                            _flex_text(f"{stock['current_price']}元", size="sm", align="end", flex=1),
+                        ]
+                    },
+                    _flex_text(" | ".join(tags) if tags else "基本面穩健",
+                               size="xs", color="#888888", margin="xs"),
+                ]
+            })
+        body.append(section)
+
+    # 風險警示（最多顯示2支）
+    if vm['weak_stocks']:
+        section = _flex_section("⚠️ 風險警示", "#FF8A00", with_separator=True)
+        for stock in vm['weak_stocks'][:2]:
+            section["contents"].append({
+                "type": "box",
+                "layout": "horizontal",
+                "margin": "sm",
+                "contents": [
+                    _flex_text(f"{stock['code']} {stock['name']}", size="sm", flex=2),
+                    _flex_text("謹慎操作", size="sm", align="end", color="#FF8A00", flex=1),
+                ]
+            })
+        body.append(section)
+
+    # 免責聲明
+    body.append({
+        "type": "box",
+        "layout": "vertical",
+        "margin": "md",
+        "contents": [
+            {"type": "separator", "margin": "md"},
+            _flex_text("⚠️ 本報告僅供參考，不構成投資建議\n股市有風險，投資需謹慎",
+                       size="xs", color="#888888", margin="md", wrap=True),
+        ]
+    })
+
+    return flex_content
+
+
+def render_flex_alt_text(vm: Dict[str, Any]) -> str:
+    """Flex 訊息的替代文字"""
+    return (f"📊 {vm['time_slot']}分析報告\n短線推薦: {len(vm['short_term'])}支\n"
+            f"長線推薦: {len(vm['long_term'])}支\n風險警示: {len(vm['weak_stocks'])}支")
+
+
+def render_all(vm: Dict[str, Any]) -> Dict[str, Any]:
+    """渲染所有渠道格式"""
+    empty = vm['empty']
+    return {
+        'empty': empty,
+        'subject': render_subject(vm),
+        'message': render_text(vm),
+        'html_body': None if empty else render_html(vm),
+        'flex': render_flex(vm),
+        'alt_text': render_flex_alt_text(vm),
+        'rendered_at': vm['rendered_at'].isoformat(),
+    }
+
+
+# ==================== 渲染快取 ====================
+
+def _json_value(value):
+    """numpy 型別轉成 Python 數值，與寄件匣序列化後的內容雜湊一致"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+def content_hash(strategies_data: Dict[str, List[Dict]], time_slot: str, date: str) -> str:
+    """推薦資料的內容雜湊（鍵排序後的 JSON）"""
+    raw = json.dumps({'data': strategies_data, 'time_slot': time_slot, 'date': date},
+                     sort_keys=True, ensure_ascii=False, default=_json_value)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """
+    渲染結果快取
+
+    記憶體保留最近 max_entries 筆；cache_dir 有設定時同時寫入磁碟，
+    程序重啟後寄件匣重送的通知也能直接取用。
+    """
+
+    def __init__(self, cache_dir: str = None, max_entries: int = 32, retention_days: int = 7):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'renders': 0}
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.prune(retention_days)
+
+    def render(self, strategies_data: Dict[str, List[Dict]], time_slot: str,
+               date: str = None) -> Dict[str, Any]:
+        """
+        取得渲染結果（相同內容只渲染一次）
+
+        Returns:
+            {'key', 'empty', 'subject', 'message', 'html_body', 'flex', 'alt_text', 'rendered_at'}
+            返回的內容為共用物件，呼叫端不應修改
+        """
+        date = date or datetime.now().strftime("%Y/%m/%d")
+        key = content_hash(strategies_data, time_slot, date)
+
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return rendered
+
+        rendered = self._load(key)
+        if rendered is not None:
+            self.stats['disk_hits'] += 1
+        else:
+            rendered = render_all(build_view_model(strategies_data, time_slot, date))
+            rendered['key'] = key
+            self.stats['renders'] += 1
+            self._save(key, rendered)
+
+        with self._lock:
+            self._entries[key] = rendered
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rendered
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"讀取渲染快取失敗 {key}: {e}")
+            return None
+
+    def _save(self, key: str, rendered: Dict[str, Any]):
+        if not self.cache_dir:
+            return
+        tmp_path = self._path(key) + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(rendered, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning(f"寫入渲染快取失敗 {key}: {e}")
+
+    def prune(self, retention_days: int) -> int:
+        """刪除超過保存天數的磁碟快取，返回刪除數"""
+        if not self.cache_dir:
+            return 0
+        cutoff = datetime.now().timestamp() - retention_days * 86400
+        removed = 0
+        for filename in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                if filename.endswith('.json') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+# ==================== 簡易整合函數 ====================
+
+# 全局渲染快取
+_render_cache = None
+
+def get_render_cache() -> RenderCache:
+    """獲取渲染快取實例（磁碟快取位於 CACHE_DIR/notification_renders）"""
+    global _render_cache
+    if _render_cache is None:
+        _render_cache = RenderCache(os.path.join(CACHE_DIR, 'notification_renders'))
+    return _render_cache
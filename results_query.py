@@ -0,0 +1,414 @@
+"""
+results_query.py - 歷史分析結果查詢
+把 AnalysisResultsStore 的分區同步進 SQLite 索引，支援跨日期、跨時段的
+篩選、欄位投影與分組統計
+
+功能：
+1. 增量同步 - 只匯入新增或有變更的分區（以 meta 檔修改時間判斷）
+2. 分區裁剪 - 日期 / 時段 / 模式條件直接套用在分區清單與索引欄位上
+3. 查詢 - analyses 與 recommendations 兩張表，任意分析欄位皆可篩選與投影
+
+使用方式：
+    engine = ResultsQueryEngine('data/analysis_results')
+
+    # 2330 最近 60 次掃描的 weighted_score
+    engine.query('analyses', columns=['date', 'time_slot', 'weighted_score'],
+                 where=[('code', '=', '2330')], order_by='-scan_at', limit=60)
+
+    # 本月被推薦為長線 3 次以上的股票
+    engine.query('recommendations', start_date='20261001',
+                 where=[('category', '=', 'long_term')], group_by=['code', 'name'],
+                 aggregates=[('count', '*')], having=[('count', '>=', 3)])
+
+命令列：
+    python results_query.py analyses --where code=2330 --columns date,time_slot,weighted_score \\
+        --order-by=-scan_at --limit 60
+    python results_query.py recommendations --start 20261001 --where category=long_term \\
+        --group-by code,name --agg count:* --having "count>=3"
+"""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+import argparse
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+import pandas as pd
+
+from results_store import AnalysisResultsStore, _json_default
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = 'results_index.db'
+
+# 每張表的索引欄位（其餘欄位從 data JSON 取出）
+TABLE_COLUMNS = {
+    'analyses': ['date', 'time_slot', 'mode', 'scan_at', 'code', 'name'],
+    'recommendations': ['date', 'time_slot', 'mode', 'scan_at', 'category', 'rank', 'code', 'name'],
+}
+
+OPERATORS = {'=', '!=', '>', '>=', '<', '<=', 'in', 'like'}
+AGGREGATES = {'count', 'sum', 'avg', 'min', 'max'}
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_CONDITION_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(!=|>=|<=|=|>|<|~)\s*(.*?)\s*$')
+
+
+def _clean_value(value):
+    """NaN 轉 None，方便寫入 JSON"""
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+class ResultsQueryEngine:
+    """
+    分析結果查詢引擎
+
+    索引檔預設放在 <base_dir>/results_index.db，可隨時刪除重建。
+    """
+
+    def __init__(self, base_dir: str, index_path: str = None):
+        self.store = AnalysisResultsStore(base_dir)
+        self.index_path = index_path or os.path.join(base_dir, INDEX_FILENAME)
+        self._lock = threading.RLock()
+        self._init_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _init_database(self):
+        """建立索引表"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+        with self._lock, self._connect() as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS partitions (
+                    date TEXT NOT NULL,
+                    time_slot TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    meta_mtime INTEGER NOT NULL,
+                    scan_at TEXT,
+                    rows INTEGER,
+                    PRIMARY KEY (date, time_slot, mode)
+                );
+                CREATE TABLE IF NOT EXISTS analyses (
+                    date TEXT NOT NULL,
+                    time_slot TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    scan_at TEXT,
+                    code TEXT,
+                    name TEXT,
+                    data TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_partition ON analyses(date, time_slot, mode);
+                CREATE INDEX IF NOT EXISTS idx_analyses_code ON analyses(code, date);
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    date TEXT NOT NULL,
+                    time_slot TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    scan_at TEXT,
+                    category TEXT,
+                    rank INTEGER,
+                    code TEXT,
+                    name TEXT,
+                    data TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_recommendations_partition ON recommendations(date, time_slot, mode);
+                CREATE INDEX IF NOT EXISTS idx_recommendations_category ON recommendations(category, date);
+                CREATE INDEX IF NOT EXISTS idx_recommendations_code ON recommendations(code, date);
+            ''')
+
+    # ---------- 同步 ----------
+
+    def sync(self, start_date: str = None, end_date: str = None,
+             time_slots: List[str] = None, mode: str = None) -> int:
+        """
+        把符合條件的分區同步進索引
+
+        Returns:
+            int: 本次重新匯入的分區數
+        """
+        partitions = self.store.list_partitions(start_date, end_date, time_slots, mode)
+        if not partitions:
+            return 0
+
+        with self._lock, self._connect() as conn:
+            indexed = {(d, s, m): mtime for d, s, m, mtime in
+                       conn.execute('SELECT date, time_slot, mode, meta_mtime FROM partitions')}
+
+            updated = 0
+            for key in partitions:
+                meta_path = self.store._slot_prefix(*key) + '.meta.json'
+                try:
+                    mtime = os.stat(meta_path).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if indexed.get(key) == mtime:
+                    continue
+
+                try:
+                    self._ingest_partition(conn, key, mtime)
+                    updated += 1
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"匯入分區失敗 {key}: {e}")
+
+        if updated:
+            logger.info(f"結果索引已同步 {updated} 個分區")
+        return updated
+
+    def _ingest_partition(self, conn: sqlite3.Connection, key: Tuple[str, str, str], mtime: int):
+        """匯入單一分區（先刪除舊資料，重跑同一時段時會覆蓋）"""
+        date_str, slot, slot_mode = key
+        meta = self.store.read_meta(date_str, slot, slot_mode)
+        scan_at = meta.get('written_at') or datetime.fromtimestamp(mtime / 1e9).isoformat()
+
+        analyses = self.store.read_slot(date_str, slot, slot_mode)
+        analysis_rows = [
+            (date_str, slot, slot_mode, scan_at, record.get('code'), record.get('name'),
+             json.dumps(record, ensure_ascii=False, default=_json_default))
+            for record in ({k: _clean_value(v) for k, v in row.items()}
+                           for row in analyses.to_dict('records'))
+        ]
+
+        try:
+            recommendations = self.store.read_recommendations(date_str, slot, slot_mode, resolve=False)
+        except FileNotFoundError:
+            recommendations = {}
+        recommendation_rows = [
+            (date_str, slot, slot_mode, scan_at, category, rank, item.get('code'), item.get('name'),
+             json.dumps(item, ensure_ascii=False, default=_json_default))
+            for category, items in recommendations.items()
+            for rank, item in enumerate(items, 1)
+        ]
+
+        where = 'date = ? AND time_slot = ? AND mode = ?'
+        conn.execute(f'DELETE FROM analyses WHERE {where}', key)
+        conn.execute(f'DELETE FROM recommendations WHERE {where}', key)
+        conn.executemany('INSERT INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?)', analysis_rows)
+        conn.executemany('INSERT INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         recommendation_rows)
+        conn.execute('INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?, ?, ?)',
+                     (*key, mtime, scan_at, len(analysis_rows)))
+
+    # ---------- 查詢 ----------
+
+    @staticmethod
+    def _column_sql(table: str, column: str) -> str:
+        """欄位名稱轉 SQL：索引欄位直接使用，其餘從 data JSON 取出"""
+        if not _NAME_PATTERN.match(column):
+            raise ValueError(f"無效的欄位名稱: {column}")
+        if column in TABLE_COLUMNS[table]:
+            return column
+        return f"json_extract(data, '$.{column}')"
+
+    def query(self, table: str = 'analyses', columns: List[str] = None,
+              where: List[Tuple[str, str, Any]] = None,
+              start_date: str = None, end_date: str = None,
+              time_slots: List[str] = None, mode: str = None,
+              group_by: List[str] = None,
+              aggregates: List[Tuple[str, str]] = None,
+              having: List[Tuple[str, str, Any]] = None,
+              order_by: str = None, limit: int = None,
+              sync: bool = True) -> pd.DataFrame:
+        """
+        查詢分析結果或推薦結果
+
+        Args:
+            table: 'analyses' 或 'recommendations'
+            columns: 投影欄位（未分組時預設為索引欄位）
+            where: [(欄位, 運算子, 值)]，運算子為 = != > >= < <= in like
+            start_date / end_date / time_slots / mode: 分區條件（日期格式 YYYYMMDD）
+            group_by: 分組欄位
+            aggregates: [(函數, 欄位)]，函數為 count/sum/avg/min/max，
+                        結果欄位名稱為 '函數' 或 '函數_欄位'
+            having: 分組後的條件，欄位為聚合結果名稱
+            order_by: 排序欄位，前綴 '-' 表示遞減
+            limit: 筆數上限
+            sync: 查詢前是否先同步分區
+
+        Returns:
+            DataFrame
+        """
+        if table not in TABLE_COLUMNS:
+            raise ValueError(f"未知的資料表: {table}")
+
+        if sync:
+            self.sync(start_date, end_date, time_slots, mode)
+
+        clauses, params = [], []
+
+        # 分區條件走 (date, time_slot, mode) 索引
+        if start_date:
+            clauses.append('date >= ?')
+            params.append(start_date)
+        if end_date:
+            clauses.append('date <= ?')
+            params.append(end_date)
+        if time_slots:
+            clauses.append(f"time_slot IN ({', '.join('?' * len(time_slots))})")
+            params.extend(time_slots)
+        if mode:
+            clauses.append('mode = ?')
+            params.append(mode)
+
+        for column, op, value in where or []:
+            sql, values = self._condition_sql(self._column_sql(table, column), op, value)
+            clauses.append(sql)
+            params.extend(values)
+
+        select, aliases = [], []
+        if group_by or aggregates:
+            for column in group_by or []:
+                select.append(f'{self._column_sql(table, column)} AS "{column}"')
+                aliases.append(column)
+            for func, column in aggregates or [('count', '*')]:
+                func = func.lower()
+                if func not in AGGREGATES:
+                    raise ValueError(f"不支援的聚合函數: {func}")
+                target = '*' if column == '*' else self._column_sql(table, column)
+                alias = func if column == '*' else f'{func}_{column}'
+                select.append(f'{func.upper()}({target}) AS "{alias}"')
+                aliases.append(alias)
+        else:
+            for column in columns or TABLE_COLUMNS[table]:
+                select.append(f'{self._column_sql(table, column)} AS "{column}"')
+                aliases.append(column)
+
+        sql = f"SELECT {', '.join(select)} FROM {table}"
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+
+        if group_by:
+            sql += ' GROUP BY ' + ', '.join(self._column_sql(table, c) for c in group_by)
+        if having:
+            having_sql = []
+            for alias, op, value in having:
+                if alias not in aliases:
+                    raise ValueError(f"HAVING 欄位必須是查詢結果欄位: {alias}")
+                condition, values = self._condition_sql(f'"{alias}"', op, value)
+                having_sql.append(condition)
+                params.extend(values)
+            sql += ' HAVING ' + ' AND '.join(having_sql)
+
+        if order_by:
+            descending = order_by.startswith('-')
+            column = order_by.lstrip('-')
+            target = f'"{column}"' if column in aliases else self._column_sql(table, column)
+            sql += f" ORDER BY {target} {'DESC' if descending else 'ASC'}"
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        df = pd.DataFrame(rows, columns=aliases)
+        # json_extract 取出的巢狀欄位為 JSON 字串，還原為 dict / list
+        for column in df.columns:
+            if any(isinstance(v, str) and v[:1] in ('[', '{') for v in df[column]):
+                df[column] = df[column].astype(object).map(
+                    lambda v: json.loads(v) if isinstance(v, str) and v[:1] in ('[', '{') else v)
+        return df
+
+    @staticmethod
+    def _condition_sql(target: str, op: str, value) -> Tuple[str, List[Any]]:
+        op = op.lower()
+        if op not in OPERATORS:
+            raise ValueError(f"不支援的運算子: {op}")
+        if op == 'in':
+            values = list(value)
+            return f"{target} IN ({', '.join('?' * len(values))})", values
+        return f'{target} {op.upper()} ?', [value]
+
+
+# ==================== 命令列 ====================
+
+def _parse_value(text: str):
+    """命令列值：可轉數字就轉數字（股票代碼以引號包住可保留字串）"""
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in '\'"':
+        return text[1:-1]
+    if re.fullmatch(r'\d{4,6}[A-Z]?', text):
+        # 股票代碼維持字串
+        return text
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def _parse_condition(text: str) -> Tuple[str, str, Any]:
+    """解析 'weighted_score>=2'、'code=2330'、'name~台%'（~ 為 LIKE）"""
+    match = _CONDITION_PATTERN.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(f"無效的條件: {text}")
+    column, op, value = match.groups()
+    if op == '~':
+        return column, 'like', value
+    if op == '=' and ',' in value:
+        return column, 'in', [_parse_value(v) for v in value.split(',')]
+    return column, op, _parse_value(value)
+
+
+def _split_list(text: str) -> List[str]:
+    return [item.strip() for item in text.split(',') if item.strip()]
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description='歷史分析結果查詢')
+    parser.add_argument('table', choices=sorted(TABLE_COLUMNS), help='查詢的資料表')
+    parser.add_argument('--base-dir', default=os.path.join('data', 'analysis_results'),
+                        help='分析結果目錄 (預設: data/analysis_results)')
+    parser.add_argument('--start', help='起始日期 YYYYMMDD')
+    parser.add_argument('--end', help='結束日期 YYYYMMDD')
+    parser.add_argument('--slot', action='append', help='時段（可重複指定）')
+    parser.add_argument('--mode', '-m', help='分析模式')
+    parser.add_argument('--columns', '-c', type=_split_list, help='投影欄位，以逗號分隔')
+    parser.add_argument('--where', '-w', action='append', type=_parse_condition, default=[],
+                        help='篩選條件，例如 code=2330、weighted_score>=2（可重複指定）')
+    parser.add_argument('--group-by', '-g', type=_split_list, help='分組欄位，以逗號分隔')
+    parser.add_argument('--agg', '-a', action='append', default=[],
+                        help='聚合，例如 count:*、avg:weighted_score（可重複指定）')
+    parser.add_argument('--having', action='append', type=_parse_condition, default=[],
+                        help='分組條件，例如 count>=3')
+    parser.add_argument('--order-by', '-o', help='排序欄位，前綴 - 表示遞減')
+    parser.add_argument('--limit', '-n', type=int, help='筆數上限')
+    parser.add_argument('--csv', action='store_true', help='以 CSV 輸出')
+
+    args = parser.parse_args()
+
+    aggregates = [tuple(item.split(':', 1)) if ':' in item else (item, '*') for item in args.agg]
+
+    engine = ResultsQueryEngine(args.base_dir)
+    start = datetime.now()
+    try:
+        df = engine.query(args.table, columns=args.columns, where=args.where,
+                          start_date=args.start, end_date=args.end,
+                          time_slots=args.slot, mode=args.mode,
+                          group_by=args.group_by, aggregates=aggregates or None,
+                          having=args.having, order_by=args.order_by, limit=args.limit)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"❌ 查詢失敗: {e}")
+        return
+
+    if args.csv:
+        print(df.to_csv(index=False), end='')
+    else:
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(df.to_string(index=False) if not df.empty else '(沒有符合條件的結果)')
+        elapsed = (datetime.now() - start).total_seconds()
+        print(f"\n共 {len(df)} 筆，耗時 {elapsed:.3f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+results_store.py - 分析結果欄式儲存
+每個日期 × 時段一個欄式表格，取代縮排 JSON 的整份傾印
+
+功能：
+1. 分析結果寫成一個表格（有 pyarrow 用 Parquet，否則用 gzip 壓縮的 JSONL）
+2. 推薦結果只保存股票代碼引用與推薦欄位，不重複保存整份分析
+3. 讀取任意日期區間、指定欄位，不需解析全部內容
+
+目錄結構：
+    <base_dir>/<YYYYMMDD>/<time_slot>_analyses_<mode>.parquet (或 .jsonl.gz)
+    <base_dir>/<YYYYMMDD>/<time_slot>_analyses_<mode>.meta.json
+    <base_dir>/<YYYYMMDD>/<time_slot>_recommendations_<mode>.json
+"""
+
+import os
+import gzip
+import json
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401  (pandas.to_parquet 的引擎)
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+    logger.info("pyarrow 未安裝，分析結果改用壓縮 JSONL 儲存")
+
+
+def _json_default(value):
+    """JSON 序列化 numpy 型別"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+
+def _column_kind(values: List[Any]) -> str:
+    """判斷欄位型別：bool / number / str，其餘（巢狀或混合型別）為 json"""
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, (bool, np.bool_)) for v in present):
+        return 'bool'
+    if all(_is_number(v) for v in present):
+        return 'number'
+    if all(isinstance(v, str) for v in present):
+        return 'str'
+    return 'json'
+
+
+class AnalysisResultsStore:
+    """
+    分析結果儲存器
+
+    巢狀欄位（dict / list）與混合型別欄位以 JSON 字串保存，
+    欄位清單與 JSON 欄位記錄在 .meta.json，讀取時自動還原。
+    """
+
+    def __init__(self, base_dir: str, use_parquet: bool = None):
+        self.base_dir = base_dir
+        self.use_parquet = PARQUET_AVAILABLE if use_parquet is None else use_parquet
+
+    # ---------- 路徑 ----------
+
+    def _slot_prefix(self, date_str: str, time_slot: str, mode: str) -> str:
+        return os.path.join(self.base_dir, date_str, f"{time_slot}_analyses_{mode}")
+
+    def _recommendations_path(self, date_str: str, time_slot: str, mode: str) -> str:
+        return os.path.join(self.base_dir, date_str, f"{time_slot}_recommendations_{mode}.json")
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    # ---------- 寫入 ----------
+
+    def write_slot(self, analyses: List[Dict[str, Any]], recommendations: Dict[str, List],
+                   time_slot: str, mode: str, date_str: str = None) -> str:
+        """
+        保存一個時段的分析與推薦結果
+
+        Returns:
+            str: 結果目錄
+        """
+        date_str = date_str or datetime.now().strftime('%Y%m%d')
+        results_dir = os.path.join(self.base_dir, date_str)
+        os.makedirs(results_dir, exist_ok=True)
+
+        prefix = self._slot_prefix(date_str, time_slot, mode)
+        meta = self._write_table(prefix, analyses)
+        self._atomic_write(prefix + '.meta.json',
+                           json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+        refs = self._recommendation_refs(recommendations)
+        self._atomic_write(self._recommendations_path(date_str, time_slot, mode),
+                           json.dumps(refs, ensure_ascii=False, default=_json_default).encode('utf-8'))
+
+        return results_dir
+
+    def _write_table(self, prefix: str, analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """寫入欄式表格，返回 meta 資訊"""
+        columns = list(dict.fromkeys(key for a in analyses for key in a))
+        json_columns = []
+        table = {}
+
+        for col in columns:
+            values = [a.get(col) for a in analyses]
+            if _column_kind(values) == 'json':
+                values = [None if v is None else json.dumps(v, ensure_ascii=False, default=_json_default)
+                          for v in values]
+                json_columns.append(col)
+            table[col] = values
+
+        if self.use_parquet:
+            path = prefix + '.parquet'
+            pd.DataFrame(table, columns=columns).to_parquet(path + '.tmp', index=False)
+            os.replace(path + '.tmp', path)
+            fmt = 'parquet'
+        else:
+            path = prefix + '.jsonl.gz'
+            lines = '\n'.join(json.dumps({col: table[col][i] for col in columns},
+                                         ensure_ascii=False, default=_json_default)
+                              for i in range(len(analyses)))
+            self._atomic_write(path, gzip.compress(lines.encode('utf-8')))
+            fmt = 'jsonl.gz'
+
+        return {
+            'format': fmt,
+            'file': os.path.basename(path),
+            'written_at': datetime.now().isoformat(),
+            'rows': len(analyses),
+            'columns': columns,
+            'json_columns': json_columns,
+        }
+
+    @staticmethod
+    def _recommendation_refs(recommendations: Dict[str, List]) -> Dict[str, List]:
+        """推薦結果改存代碼引用：保留推薦欄位，去除內嵌的完整分析"""
+        return {
+            category: [{key: value for key, value in item.items() if key != 'analysis'}
+                       for item in items]
+            for category, items in (recommendations or {}).items()
+        }
+
+    # ---------- 讀取 ----------
+
+    def list_partitions(self, start_date: str = None, end_date: str = None,
+                        time_slots: List[str] = None, mode: str = None) -> List[Tuple[str, str, str]]:
+        """
+        列出符合條件的 (日期, 時段, 模式) 分區，只讀目錄與檔名
+
+        日期格式為 YYYYMMDD（區間兩端皆包含）
+        """
+        if not os.path.isdir(self.base_dir):
+            return []
+
+        partitions = []
+        for date_str in sorted(os.listdir(self.base_dir)):
+            if (start_date and date_str < start_date) or (end_date and date_str > end_date):
+                continue
+            day_dir = os.path.join(self.base_dir, date_str)
+            if not os.path.isdir(day_dir):
+                continue
+            for filename in sorted(os.listdir(day_dir)):
+                if not filename.endswith('.meta.json'):
+                    continue
+                slot, _, slot_mode = filename[:-len('.meta.json')].partition('_analyses_')
+                if time_slots and slot not in time_slots:
+                    continue
+                if mode and slot_mode != mode:
+                    continue
+                partitions.append((date_str, slot, slot_mode))
+
+        return partitions
+
+    def read_meta(self, date_str: str, time_slot: str, mode: str) -> Dict[str, Any]:
+        """讀取分區的 meta 資訊"""
+        with open(self._slot_prefix(date_str, time_slot, mode) + '.meta.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_slot(self, date_str: str, time_slot: str, mode: str,
+                  columns: List[str] = None) -> pd.DataFrame:
+        """讀取單一分區，只載入指定欄位"""
+        meta = self.read_meta(date_str, time_slot, mode)
+        wanted = [c for c in (columns or meta['columns']) if c in meta['columns']]
+        path = os.path.join(self.base_dir, date_str, meta['file'])
+
+        if meta['format'] == 'parquet':
+            df = pd.read_parquet(path, columns=wanted)
+        else:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            df = pd.DataFrame([{c: row.get(c) for c in wanted} for row in rows], columns=wanted)
+
+        for col in meta['json_columns']:
+            if col in df.columns:
+                df[col] = df[col].map(lambda v: json.loads(v) if isinstance(v, str) else v)
+
+        return df
+
+    def read_analyses(self, start_date: str = None, end_date: str = None,
+                      columns: List[str] = None, time_slots: List[str] = None,
+                      mode: str = None) -> pd.DataFrame:
+        """
+        讀取日期區間內的分析結果
+
+        Returns:
+            DataFrame，額外包含 date / time_slot / mode 欄位
+        """
+        frames = []
+        for date_str, slot, slot_mode in self.list_partitions(start_date, end_date, time_slots, mode):
+            df = self.read_slot(date_str, slot, slot_mode, columns)
+            df.insert(0, 'mode', slot_mode)
+            df.insert(0, 'time_slot', slot)
+            df.insert(0, 'date', date_str)
+            frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(columns=['date', 'time_slot', 'mode'] + list(columns or []))
+
+        return pd.concat(frames, ignore_index=True)
+
+    def read_recommendations(self, date_str: str, time_slot: str, mode: str,
+                             resolve: bool = True) -> Dict[str, List]:
+        """
+        讀取推薦結果
+
+        Args:
+            resolve: 是否依代碼把完整分析放回每筆推薦的 'analysis' 欄位
+        """
+        with open(self._recommendations_path(date_str, time_slot, mode), 'r', encoding='utf-8') as f:
+            refs = json.load(f)
+
+        if not resolve:
+            return refs
+
+        analyses = self.read_slot(date_str, time_slot, mode)
+        analyses = analyses.astype(object).where(analyses.notna(), None)
+        by_code = {row['code']: row for row in analyses.to_dict('records')} if 'code' in analyses else {}
+
+        return {
+            category: [{**item, 'analysis': by_code.get(item.get('code'), {})} for item in items]
+            for category, items in refs.items()
+        }
@@ -0,0 +1,113 @@
+"""
+startup_profile.py - 啟動導入時間報告
+以 python -X importtime 重新執行入口腳本，整理出最耗時的模組導入
+
+功能：
+1. 解析 -X importtime 輸出（自身時間 / 累計時間 / 導入層級）
+2. 依累計時間列出最慢的前 N 個模組與總導入時間
+3. 入口腳本加上 --import-time 旗標即可輸出報告，其餘參數照常傳遞
+
+使用方式：
+    # 入口腳本（heartbeat_check.py、integrated_stock_bot.py）
+    python integrated_stock_bot.py status --import-time
+    python heartbeat_check.py --import-time
+
+    # 分析任意腳本
+    python startup_profile.py integrated_stock_bot.py status --top 15
+
+環境變數：
+    IMPORT_TIME_TOP: 報告列出的模組數（預設 25）
+"""
+
+import os
+import re
+import sys
+import subprocess
+from typing import Dict, List, Any, Optional, Tuple
+
+IMPORT_TIME_FLAG = '--import-time'
+DEFAULT_TOP = int(os.getenv('IMPORT_TIME_TOP', '25'))
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def parse_importtime(stderr: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    解析 -X importtime 輸出
+
+    Returns:
+        (導入紀錄清單, 其餘 stderr 行)；導入紀錄包含 module / self_us / cumulative_us / depth
+    """
+    entries, other_lines = [], []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append({
+                'module': module,
+                'self_us': int(self_us),
+                'cumulative_us': int(cumulative_us),
+                'depth': max(len(indent) - 1, 0) // 2,
+            })
+        elif not line.startswith('import time:'):
+            other_lines.append(line)
+    return entries, other_lines
+
+
+def format_report(entries: List[Dict[str, Any]], top: int = DEFAULT_TOP) -> str:
+    """依累計時間排序的導入報告"""
+    total_us = sum(e['cumulative_us'] for e in entries if e['depth'] == 0)
+    lines = [
+        '',
+        '=' * 64,
+        f"📦 導入時間報告：{len(entries)} 個模組，總計 {total_us / 1000:.1f} ms",
+        '=' * 64,
+        f"{'累計(ms)':>10} {'自身(ms)':>10}  模組",
+    ]
+    for entry in sorted(entries, key=lambda e: e['cumulative_us'], reverse=True)[:top]:
+        lines.append(f"{entry['cumulative_us'] / 1000:>10.1f} {entry['self_us'] / 1000:>10.1f}  "
+                     f"{'  ' * entry['depth']}{entry['module']}")
+    return '\n'.join(lines)
+
+
+def run_with_import_report(script: str, argv: List[str], top: int = DEFAULT_TOP) -> int:
+    """
+    以 -X importtime 執行腳本並輸出報告
+
+    腳本的標準輸出照常顯示，非導入時間的 stderr 轉送到 stderr。
+
+    Returns:
+        int: 腳本的結束碼
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', script] + list(argv),
+                            stderr=subprocess.PIPE, text=True)
+    entries, other_lines = parse_importtime(result.stderr)
+    if other_lines:
+        print('\n'.join(other_lines), file=sys.stderr)
+    print(format_report(entries, top))
+    return result.returncode
+
+
+def maybe_report_imports(argv: Optional[List[str]] = None, flag: str = IMPORT_TIME_FLAG):
+    """
+    入口腳本的 --import-time 旗標處理
+
+    命令列帶有旗標時，去掉旗標以 -X importtime 重新執行目前腳本、輸出報告後結束；
+    沒有旗標時直接返回。
+    """
+    argv = sys.argv if argv is None else argv
+    if flag not in argv[1:]:
+        return
+    rest = [arg for arg in argv[1:] if arg != flag]
+    sys.exit(run_with_import_report(argv[0], rest))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='腳本啟動導入時間報告')
+    parser.add_argument('script', help='要分析的腳本')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='列出的模組數')
+    args, script_args = parser.parse_known_args()
+
+    sys.exit(run_with_import_report(args.script, script_args, args.top))
@@ -0,0 +1,102 @@
+"""
+test_channel_delivery.py - 推播渠道層測試
+以 LocalHTTPStandIn 取代 LINE / Telegram API，不需網路
+"""
+import os
+import sys
+import json
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_delivery import (LINE_MULTICAST_LIMIT, LineMessagingChannel, LocalHTTPStandIn,
+                              TelegramChannel, send_concurrently)
+
+MESSAGES = [{'type': 'text', 'text': 'hi'}]
+
+
+@pytest.fixture
+def server():
+    with LocalHTTPStandIn() as stand_in:
+        yield stand_in
+
+
+def _bodies(server, path):
+    return [json.loads(body) for request_path, body in server.requests if request_path == path]
+
+
+# ========== LINE ==========
+
+def test_multicast_splits_at_limit(server):
+    line = LineMessagingChannel('token', api_base=server.url)
+    user_ids = [f'U{i:04d}' for i in range(LINE_MULTICAST_LIMIT * 2 + 1)]
+
+    assert line.send(MESSAGES, user_ids=user_ids)
+
+    batches = _bodies(server, '/v2/bot/message/multicast')
+    assert sorted(len(body['to']) for body in batches) == [1, LINE_MULTICAST_LIMIT, LINE_MULTICAST_LIMIT]
+    assert sorted(user for body in batches for user in body['to']) == user_ids
+
+
+def test_single_user_and_groups_use_push(server):
+    line = LineMessagingChannel('token', api_base=server.url)
+
+    assert line.send(MESSAGES, user_ids=['U1'], group_ids='C1,C2')
+
+    assert _bodies(server, '/v2/bot/message/multicast') == []
+    assert sorted(body['to'] for body in _bodies(server, '/v2/bot/message/push')) == ['C1', 'C2', 'U1']
+
+
+def test_partial_failure_counts_as_sent(server):
+    """部分對象失敗時視為已送出，避免寄件匣重送給已收到的對象"""
+    server.fail_markers = ['C2']
+    line = LineMessagingChannel('token', api_base=server.url)
+
+    assert line.send(MESSAGES, user_ids=['U1', 'U2'], group_ids=['C1', 'C2'])
+
+
+def test_all_targets_failing_is_not_sent(server):
+    server.fail_markers = ['"to"']
+    line = LineMessagingChannel('token', api_base=server.url)
+
+    assert not line.send(MESSAGES, user_ids=['U1', 'U2'], group_ids=['C1'])
+
+
+# ========== Telegram ==========
+
+def test_telegram_per_chat_limiter(server):
+    telegram = TelegramChannel('token', ['100', '200'], api_base=server.url, per_chat_rate=5)
+
+    start = time.perf_counter()
+    for _ in range(3):
+        assert telegram.send_message('hi')
+    elapsed = time.perf_counter() - start
+
+    # 每個聊天室每秒 5 則（桶容量 5）：第 6 則才需等待，3 則不應被限速；
+    # 之後同一聊天室再送 5 則，至少需等待約 0.2 秒
+    assert elapsed < 0.5
+    start = time.perf_counter()
+    for _ in range(5):
+        telegram.send_message('hi')
+    assert time.perf_counter() - start >= 0.15
+    assert len(server.requests) == 16
+
+
+# ========== 並行發送 ==========
+
+def test_send_concurrently_reports_failures():
+    def boom():
+        raise RuntimeError('down')
+
+    results = send_concurrently({'ok': lambda: True, 'false': lambda: False, 'error': boom})
+
+    assert results == {'ok': True, 'false': False, 'error': False}
+
+
+def test_send_concurrently_timeout_is_failure():
+    results = send_concurrently({'slow': lambda: time.sleep(1) or True, 'fast': lambda: True},
+                                timeout=0.1)
+
+    assert results == {'slow': False, 'fast': True}
@@ -0,0 +1,87 @@
+"""
+test_email_sender.py - 共用 SMTP 連線發送器測試
+以 LocalSMTPServer 取代真實 SMTP 伺服器，不需網路
+"""
+import os
+import sys
+import smtplib
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_sender import LocalSMTPServer, PooledSMTPSender
+
+
+def _sender(server, **kwargs) -> PooledSMTPSender:
+    return PooledSMTPSender('127.0.0.1', server.port, use_tls=False, sender='bot@localhost',
+                            **kwargs)
+
+
+def _addresses(count: int):
+    return [f'user{i}@example.com' for i in range(count)]
+
+
+@pytest.fixture
+def server():
+    with LocalSMTPServer() as smtp_server:
+        yield smtp_server
+
+
+def test_batches_by_max_recipients(server):
+    sender = _sender(server, max_recipients=4)
+    recipients = _addresses(10)
+
+    result = sender.send('內容', '主旨', recipients)
+    sender.close()
+
+    assert result == {'recipients': 10, 'batches': 3, 'refused': {}}
+    assert [len(mail['rcpts']) for mail in server.received] == [4, 4, 2]
+    assert [address for mail in server.received for address in mail['rcpts']] == recipients
+
+
+def test_one_connection_per_run(server):
+    sender = _sender(server, max_recipients=3)
+
+    for i in range(5):
+        sender.send(f'內容 {i}', '主旨', _addresses(7))
+    sender.close()
+
+    assert server.connections == 1
+    assert sender.stats == {'connections': 1, 'messages': 5, 'batches': 15, 'recipients': 35}
+
+
+def test_partial_batch_failure_is_refused_not_raised(server):
+    recipients = _addresses(6)
+    server.reject = set(recipients[3:])
+    sender = _sender(server, max_recipients=3)
+
+    result = sender.send('內容', '主旨', recipients)
+    sender.close()
+
+    assert result['recipients'] == 3
+    assert sorted(result['refused']) == recipients[3:]
+    assert [mail['rcpts'] for mail in server.received] == [recipients[:3]]
+
+
+def test_all_batches_failing_raises(server):
+    recipients = _addresses(2)
+    server.reject = set(recipients)
+    sender = _sender(server)
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        sender.send('內容', '主旨', recipients)
+
+
+def test_reconnects_after_disconnect(server):
+    sender = _sender(server)
+    sender.send('第一封', '主旨', ['a@example.com'])
+
+    server.disconnect_clients()
+    result = sender.send('第二封', '主旨', ['b@example.com'])
+    sender.close()
+
+    assert result['refused'] == {}
+    assert server.connections == 2
+    assert sender.stats['connections'] == 2
+    assert [mail['rcpts'] for mail in server.received] == [['a@example.com'], ['b@example.com']]
@@ -0,0 +1,265 @@
+"""
+tree_ensemble.py - 樹模型集成的編譯推論
+將訓練好的 GradientBoosting / RandomForest 攤平成連續的 NumPy 陣列，
+以向量化方式一次評分大量股票，繞過 sklearn 每次呼叫的輸入驗證開銷
+
+功能：
+1. export - 從 MLModelWrapper 匯出（節點特徵、閾值、左右子節點、葉值）
+2. 向量化評估 - 所有樣本 × 所有樹同時逐層走訪
+3. save/load - 以 .npz 保存，載入時完全不需要 sklearn
+
+使用方式：
+    compiled = CompiledTreeEnsemble.from_wrapper(wrapper)
+    compiled.save('models/short_term.npz')
+
+    # 推論程序（不需要 sklearn）
+    compiled = CompiledTreeEnsemble.load('models/short_term.npz')
+    proba = compiled.predict_proba(features_df)
+"""
+
+import numpy as np
+from typing import Dict, List, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _softmax(raw: np.ndarray) -> np.ndarray:
+    shifted = raw - raw.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _sigmoid(raw: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-raw))
+
+
+class CompiledTreeEnsemble:
+    """
+    編譯後的樹模型集成
+
+    所有樹的節點串接成同一組陣列，roots 記錄每棵樹的根節點位置。
+    葉值 leaf_value 為 (節點數, 類別數)，已乘上各樹的權重：
+    - random_forest: 正規化後的類別機率 / 樹數，加總即為平均機率
+    - gradient_boosting: learning_rate × 樹輸出，放在該樹所屬類別的欄位
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray,
+                 children_left: np.ndarray, children_right: np.ndarray,
+                 leaf_value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 base_score: np.ndarray, link: str, classes: np.ndarray,
+                 feature_names: List[str] = None,
+                 scaler_mean: np.ndarray = None, scaler_scale: np.ndarray = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.base_score = base_score
+        self.link = link
+        self.classes_ = classes
+        self.feature_names = list(feature_names or [])
+        self.scaler_mean = scaler_mean
+        self.scaler_scale = scaler_scale
+
+    # ---------- 匯出 ----------
+
+    @classmethod
+    def from_wrapper(cls, wrapper) -> 'CompiledTreeEnsemble':
+        """從已訓練的 MLModelWrapper 匯出"""
+        if not wrapper.is_trained or wrapper.model is None:
+            raise ValueError("模型尚未訓練，無法匯出")
+
+        scaler = wrapper.scaler
+        mean = scale = None
+        if scaler is not None and hasattr(scaler, 'scale_'):
+            mean = np.asarray(scaler.mean_, dtype=float) if scaler.with_mean else None
+            scale = np.asarray(scaler.scale_, dtype=float) if scaler.with_std else None
+
+        return cls.from_estimator(wrapper.model, wrapper.feature_names, mean, scale)
+
+    @classmethod
+    def from_estimator(cls, model, feature_names: List[str] = None,
+                       scaler_mean: np.ndarray = None,
+                       scaler_scale: np.ndarray = None) -> 'CompiledTreeEnsemble':
+        """
+        從 sklearn 的 RandomForestClassifier / GradientBoostingClassifier 匯出
+
+        只讀取已訓練模型的屬性，本模組本身不需要導入 sklearn。
+        """
+        classes = np.asarray(model.classes_)
+        n_classes = len(classes)
+        estimators = np.asarray(model.estimators_, dtype=object)
+
+        if estimators.ndim == 2:
+            # GradientBoosting: (n_stages, K)，二元分類 K=1
+            loss = getattr(model, 'loss', 'log_loss')
+            if loss not in ('log_loss', 'deviance'):
+                raise ValueError(f"不支援的損失函數: {loss}")
+            init = getattr(model, 'init_', None)
+            if init != 'zero' and type(init).__name__ != 'DummyClassifier':
+                raise ValueError("只支援預設的 init 估計器")
+
+            n_outputs = estimators.shape[1]
+            trees = [(est.tree_, k, model.learning_rate)
+                     for stage in estimators for k, est in enumerate(stage)]
+            dummy = np.zeros((1, model.n_features_in_))
+            base_score = np.asarray(model._raw_predict_init(dummy)[0], dtype=float)
+            link = 'softmax' if n_outputs > 1 else 'sigmoid'
+        else:
+            # RandomForest: 平均各樹的類別機率
+            n_outputs = n_classes
+            weight = 1.0 / len(estimators)
+            trees = [(est.tree_, None, weight) for est in estimators]
+            base_score = np.zeros(n_classes)
+            link = 'identity'
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for tree, output_idx, weight in trees:
+            n_nodes = tree.node_count
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            is_leaf = left < 0
+
+            value = np.zeros((n_nodes, n_outputs))
+            raw_value = tree.value[:, 0, :]
+            if output_idx is None:
+                totals = raw_value.sum(axis=1, keepdims=True)
+                totals[totals == 0] = 1
+                value[:] = raw_value / totals * weight
+            else:
+                value[:, output_idx] = raw_value[:, 0] * weight
+
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            thresholds.append(tree.threshold.astype(np.float64))
+            lefts.append(np.where(is_leaf, -1, left + offset))
+            rights.append(np.where(is_leaf, -1, right + offset))
+            values.append(value)
+            roots.append(offset)
+
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            children_left=np.concatenate(lefts),
+            children_right=np.concatenate(rights),
+            leaf_value=np.vstack(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            base_score=base_score,
+            link=link,
+            classes=classes,
+            feature_names=feature_names,
+            scaler_mean=scaler_mean,
+            scaler_scale=scaler_scale,
+        )
+
+    # ---------- 保存 / 載入 ----------
+
+    def save(self, filepath: str):
+        """保存為 .npz（純 NumPy 陣列）"""
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'children_left': self.children_left,
+            'children_right': self.children_right,
+            'leaf_value': self.leaf_value,
+            'roots': self.roots,
+            'max_depth': np.asarray(self.max_depth),
+            'base_score': self.base_score,
+            'link': np.asarray(self.link),
+            'classes': self.classes_,
+            'feature_names': np.asarray(self.feature_names, dtype=str),
+        }
+        if self.scaler_mean is not None:
+            arrays['scaler_mean'] = self.scaler_mean
+        if self.scaler_scale is not None:
+            arrays['scaler_scale'] = self.scaler_scale
+
+        np.savez(filepath, **arrays)
+        logger.info(f"編譯模型已保存: {filepath}")
+
+    @classmethod
+    def load(cls, filepath: str) -> 'CompiledTreeEnsemble':
+        """載入 .npz（不需要 sklearn）"""
+        with np.load(filepath, allow_pickle=False) as data:
+            return cls(
+                feature=data['feature'],
+                threshold=data['threshold'],
+                children_left=data['children_left'],
+                children_right=data['children_right'],
+                leaf_value=data['leaf_value'],
+                roots=data['roots'],
+                max_depth=int(data['max_depth']),
+                base_score=data['base_score'],
+                link=str(data['link']),
+                classes=data['classes'],
+                feature_names=data['feature_names'].tolist(),
+                scaler_mean=data['scaler_mean'] if 'scaler_mean' in data.files else None,
+                scaler_scale=data['scaler_scale'] if 'scaler_scale' in data.files else None,
+            )
+
+    # ---------- 推論 ----------
+
+    def _prepare(self, X) -> np.ndarray:
+        """特徵對齊 + 標準化，並比照 sklearn 樹模型轉為 float32"""
+        if hasattr(X, 'columns') and self.feature_names:
+            if all(f in X.columns for f in self.feature_names):
+                X = X[self.feature_names]
+        values = np.asarray(X, dtype=np.float64)
+
+        if self.scaler_mean is not None:
+            values = values - self.scaler_mean
+        if self.scaler_scale is not None:
+            values = values / self.scaler_scale
+
+        return values.astype(np.float32)
+
+    def _raw_predict(self, X: np.ndarray) -> np.ndarray:
+        """所有樣本 × 所有樹同時逐層走訪，返回加權葉值總和"""
+        n_rows = len(X)
+        rows = np.arange(n_rows)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots))).copy()
+
+        for _ in range(self.max_depth):
+            left = self.children_left[node]
+            is_leaf = left < 0
+            if is_leaf.all():
+                break
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            next_node = np.where(go_left, left, self.children_right[node])
+            node = np.where(is_leaf, node, next_node)
+
+        return self.base_score + self.leaf_value[node].sum(axis=1)
+
+    def predict_proba(self, X, chunk_size: int = 4096) -> np.ndarray:
+        """
+        預測機率（欄位順序與 classes_ 相同）
+
+        Args:
+            X: DataFrame 或 2-D 陣列
+            chunk_size: 每批評估的樣本數，限制中間陣列的記憶體用量
+        """
+        values = self._prepare(X)
+        raw = np.vstack([self._raw_predict(values[i:i + chunk_size])
+                         for i in range(0, len(values), chunk_size)]
+                        or [np.empty((0, len(self.base_score)))])
+
+        if self.link == 'softmax':
+            return _softmax(raw)
+        if self.link == 'sigmoid':
+            p = _sigmoid(raw[:, 0])
+            return np.column_stack([1 - p, p])
+        return raw
+
+    def predict(self, X, chunk_size: int = 4096) -> np.ndarray:
+        """預測類別"""
+        proba = self.predict_proba(X, chunk_size)
+        return self.classes_[np.argmax(proba, axis=1)]
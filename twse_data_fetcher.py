@@ -299,34 +299,34 @@ class TWStockDataFetcher:
         
         return sorted_stocks
     
-    def get_stocks_by_time_slot(self, time_slot: str, date: str = None) -> List[Dict[str, Any]]:
-        """根據時段獲取相應數量的股票"""
-        # 定義每個時段的股票數量
-        slot_limits = {
-            'morning_scan': 200,
-            'mid_morning_scan': 300,
-            'mid_day_scan': 300,
-            'afternoon_scan': 1000,
-            'weekly_summary': 500
-        }
+    # 每個時段的股票數量
+    SLOT_LIMITS = {
+        'morning_scan': 200,
+        'mid_morning_scan': 300,
+        'mid_day_scan': 300,
+        'afternoon_scan': 1000,
+        'weekly_summary': 500
+    }
+    
+    def select_for_time_slot(self, all_stocks: List[Dict[str, Any]], time_slot: str) -> List[Dict[str, Any]]:
+        """從已按成交金額排序的全市場數據中選出時段的前N支股票（返回副本，不修改原數據）"""
+        limit = self.SLOT_LIMITS.get(time_slot, 200)
         
-        limit = slot_limits.get(time_slot, 200)
+        # 返回前N支股票，並添加時段資訊
+        selected_stocks = [dict(stock, time_slot=time_slot) for stock in all_stocks[:limit]]
         
-        logger.info(f"獲取 {time_slot} 時段的前 {limit} 支股票")
+        logger.info(f"為 {time_slot} 時段選擇了 {len(selected_stocks)} 支股票")
+        
+        return selected_stocks
+    
+    def get_stocks_by_time_slot(self, time_slot: str, date: str = None) -> List[Dict[str, Any]]:
+        """根據時段獲取相應數量的股票"""
+        logger.info(f"獲取 {time_slot} 時段的前 {self.SLOT_LIMITS.get(time_slot, 200)} 支股票")
         
         # 獲取所有股票
         all_stocks = self.get_all_stocks_by_volume(date)
         
-        # 返回前N支股票
-        selected_stocks = all_stocks[:limit]
-        
-        # 添加時段資訊
-        for stock in selected_stocks:
-            stock['time_slot'] = time_slot
-        
-        logger.info(f"為 {time_slot} 時段選擇了 {len(selected_stocks)} 支股票")
-        
-        return selected_stocks
+        return self.select_for_time_slot(all_stocks, time_slot)
 
 # 測試函數
 def test_fetcher():
@@ -0,0 +1,188 @@
+"""
+warmup.py - 常駐程序的元件預熱
+在背景執行緒預先載入較重的選用元件，避免第一個排程時段承擔載入時間
+
+功能：
+1. 依設定預熱元件（ML 插件、sklearn 模型模組、註冊表啟用模型、圖表產生器）
+2. 記錄每個元件的就緒狀態與載入耗時
+3. 只在常駐模式啟用；單次 CLI 執行仍維持延遲載入
+
+使用方式：
+    from warmup import start_warmup
+    manager = start_warmup()          # run_daemon 啟動時呼叫
+    print(manager.format_report())
+
+環境變數：
+    WARMUP_COMPONENTS  以逗號分隔的元件名稱（預設 ml_plugin,models,charts）
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+WARMUP_COMPONENTS = [name.strip() for name in
+                     os.environ.get('WARMUP_COMPONENTS', 'ml_plugin,models,charts').split(',')
+                     if name.strip()]
+
+
+# ==================== 預熱函數 ====================
+# 返回 False 表示元件未啟用而略過
+
+def _warm_ml_plugin():
+    """ML 插件：ML 預測器與新聞情緒模組"""
+    from ml_enhancement_plugin import get_plugin
+    return get_plugin().warm_up()
+
+
+def _warm_sklearn():
+    """sklearn / XGBoost / LightGBM 模型模組（ml_models 延遲導入的套件在此預先載入）"""
+    import ml_models
+    if ml_models.SKLEARN_AVAILABLE:
+        import sklearn.ensemble  # noqa: F401
+        import sklearn.preprocessing  # noqa: F401
+        import sklearn.model_selection  # noqa: F401
+        import sklearn.metrics  # noqa: F401
+    if ml_models.XGBOOST_AVAILABLE:
+        import xgboost  # noqa: F401
+    if ml_models.LIGHTGBM_AVAILABLE:
+        import lightgbm  # noqa: F401
+
+    # 指標核心的 Numba JIT 也延遲到第一次使用，預熱時先編譯
+    from indicator_kernels import _get_kernels
+    _get_kernels()
+    return True
+
+
+def _warm_models():
+    """模型註冊表：預先載入所有啟用版本（之後由 get_active 依 manifest 熱切換）"""
+    from model_registry import JOBLIB_AVAILABLE, registry_exists, get_registry
+    if not JOBLIB_AVAILABLE or not registry_exists():
+        return False
+    registry = get_registry()
+    for name in registry.get_manifest()['models']:
+        registry.get_active(name)
+    return True
+
+
+def _warm_charts():
+    """圖表樣板與渲染子程序池（字型快取、樣式）"""
+    from enhanced_notifier import ChartGenerator
+    return ChartGenerator.warm_up()
+
+
+DEFAULT_LOADERS = {
+    'ml_plugin': _warm_ml_plugin,
+    'sklearn': _warm_sklearn,
+    'models': _warm_models,
+    'charts': _warm_charts,
+}
+
+
+class WarmupManager:
+    """
+    元件預熱管理器
+
+    status 的每個元件狀態：
+        pending -> loading -> ready / skipped / failed
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[], Any]] = None):
+        self.loaders = dict(loaders or DEFAULT_LOADERS)
+        self.status = {}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self, components: List[str] = None) -> threading.Thread:
+        """在背景執行緒開始預熱（重複呼叫不會重複預熱）"""
+        with self._lock:
+            if self._thread is not None:
+                return self._thread
+
+            components = components or WARMUP_COMPONENTS
+            for name in components:
+                if name not in self.loaders:
+                    logger.warning(f"未知的預熱元件: {name}")
+                    continue
+                self.status[name] = {'state': 'pending', 'seconds': None, 'error': None}
+
+            self.started_at = datetime.now()
+            self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+            self._thread.start()
+            return self._thread
+
+    def _run(self):
+        for name in list(self.status):
+            self.status[name]['state'] = 'loading'
+            start = time.perf_counter()
+            try:
+                loaded = self.loaders[name]()
+                self.status[name]['state'] = 'skipped' if loaded is False else 'ready'
+            except Exception as e:
+                self.status[name]['state'] = 'failed'
+                self.status[name]['error'] = str(e)
+                logger.warning(f"預熱 {name} 失敗: {e}")
+            self.status[name]['seconds'] = round(time.perf_counter() - start, 3)
+            logger.info(f"預熱 {name}: {self.status[name]['state']} "
+                        f"({self.status[name]['seconds']:.2f}s)")
+
+        self.finished_at = datetime.now()
+        self._done.set()
+        logger.info(f"元件預熱完成: {self.format_report()}")
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待預熱完成，返回是否已完成"""
+        if self._thread is None:
+            return True
+        return self._done.wait(timeout)
+
+    def is_ready(self, name: str = None) -> bool:
+        """指定元件（或全部元件）是否已完成預熱"""
+        if name is None:
+            return self._done.is_set() or self._thread is None
+        return self.status.get(name, {}).get('state') in ('ready', 'skipped')
+
+    def get_report(self) -> Dict[str, Any]:
+        """預熱狀態報告"""
+        total = None
+        if self.started_at and self.finished_at:
+            total = round((self.finished_at - self.started_at).total_seconds(), 3)
+        return {
+            'ready': self.is_ready(),
+            'total_seconds': total,
+            'components': {name: dict(info) for name, info in self.status.items()},
+        }
+
+    def format_report(self) -> str:
+        """單行文字報告，例如 ml_plugin=ready(1.84s), charts=ready(0.62s)"""
+        parts = []
+        for name, info in self.status.items():
+            seconds = f"{info['seconds']:.2f}s" if info['seconds'] is not None else '-'
+            parts.append(f"{name}={info['state']}({seconds})")
+        return ', '.join(parts) or '無預熱元件'
+
+
+# ==================== 簡易整合函數 ====================
+
+# 全局預熱管理器
+_manager = None
+
+def get_warmup_manager() -> WarmupManager:
+    """獲取預熱管理器實例"""
+    global _manager
+    if _manager is None:
+        _manager = WarmupManager()
+    return _manager
+
+def start_warmup(components: List[str] = None) -> WarmupManager:
+    """啟動背景預熱（常駐模式使用）"""
+    manager = get_warmup_manager()
+    manager.start(components)
+    return manager